@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import objcache  # noqa: F401  注册对象缓存的失效信号（worker 和管理命令中的写入也要通知）
+        from . import identity  # noqa: F401  注册身份映射的写入信号
+        from . import archive  # noqa: F401  注册删除商品时清理评价的信号
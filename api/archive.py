@@ -0,0 +1,118 @@
+# api/archive.py
+"""
+冷热数据分离：已结束的商品和旧聊天记录移入归档表，热表只保留浏览、交易需要的行，
+商品列表等查询扫描的表和索引不会随历史数据无限增长。
+
+- 商品：RECEIVED / BANNED 状态且 ARCHIVE_PRODUCTS_AFTER_DAYS 天未修改的移入 ArchivedProduct。
+  评价对商品是软引用，product_id 不变；收藏夹中的这些商品随之移除。归档以外的删除
+  （接口、admin、管理命令中的 delete()）由 post_delete 信号删除该商品的评价，不留下孤立的评价。
+- 消息：早于 ARCHIVE_MESSAGES_AFTER_DAYS 天的移入 ArchivedMessage，保留原 id。
+- 按主键顺序分批移动（ARCHIVE_BATCH_SIZE），每批复制 + 删除在同一个事务中，
+  中断后重新运行会从剩余的行继续，不会重复或丢失。由 manage.py archive_data 执行。
+
+读取：商品详情在热表中找不到时回退到归档表（只读，不再计浏览量）；profile_data 的 bought
+和聊天记录把归档部分排在热表部分之前返回，接口输出格式不变。
+"""
+import contextvars
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics
+from .models import Product, Message, Review, ArchivedProduct, ArchivedMessage
+
+ARCHIVED_PRODUCT_STATUSES = ('RECEIVED', 'BANNED')
+
+_moving = contextvars.ContextVar('archive_moving', default=False)  # move() 正在从热表删除已复制的行
+
+metrics.describe('unitrade_archived_rows_total', 'counter', 'Rows moved from hot tables into archive tables.')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def archivable_products(days=None):
+    days = _setting('ARCHIVE_PRODUCTS_AFTER_DAYS', 30) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    return Product.objects.filter(status__in=ARCHIVED_PRODUCT_STATUSES, updated_at__lt=cutoff)
+
+
+def archivable_messages(days=None):
+    days = _setting('ARCHIVE_MESSAGES_AFTER_DAYS', 180) if days is None else days
+    return Message.objects.filter(timestamp__lt=timezone.now() - timedelta(days=days))
+
+
+def move(queryset, archive_model, batch_size=None):
+    """
+    把 queryset 中的行分批复制到 archive_model 并从热表删除，逐批 yield 移动的行数。
+    每批在一个事务中先锁定（select_for_update）再复制、删除，期间被修改而不再满足条件的行不会移动。
+    """
+    batch_size = batch_size or _setting('ARCHIVE_BATCH_SIZE', 500)
+    model = queryset.model
+    pk = model._meta.pk.attname
+    columns = [field.attname for field in archive_model._meta.concrete_fields if field.name != 'archived_at']
+    table = (('table', model._meta.db_table),)
+    last = None
+    while True:
+        batch = queryset.order_by(pk)
+        if last is not None:
+            batch = batch.filter(**{f'{pk}__gt': last})
+        with transaction.atomic():
+            rows = list(batch.select_for_update().values(*columns)[:batch_size])
+            if not rows:
+                return
+            archive_model.objects.bulk_create([archive_model(**row) for row in rows])
+            # 经过 Collector 删除，同时删除收藏夹等多对多中间表中的行；评价保留
+            token = _moving.set(True)
+            try:
+                model.objects.filter(**{f'{pk}__in': [row[pk] for row in rows]}).delete()
+            finally:
+                _moving.reset(token)
+        last = rows[-1][pk]
+        metrics.inc('unitrade_archived_rows_total', table, len(rows))
+        yield len(rows)
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='archive_product_reviews')
+def _delete_reviews(sender, instance, **kwargs):
+    # 评价对商品是软引用，数据库和 Collector 都不会级联；只有归档时保留
+    if not _moving.get():
+        Review.objects.filter(product_id=instance.pk).delete()
+
+
+def archive_products(days=None, batch_size=None):
+    return move(archivable_products(days), ArchivedProduct, batch_size)
+
+
+def archive_messages(days=None, batch_size=None):
+    return move(archivable_messages(days), ArchivedMessage, batch_size)
+
+
+def run(batches, progress=None):
+    """执行 archive_products() / archive_messages() 的批次，返回 (移动行数, 耗时秒数)"""
+    moved = 0
+    start = time.perf_counter()
+    for count in batches:
+        moved += count
+        if progress is not None:
+            progress(moved, time.perf_counter() - start)
+    return moved, time.perf_counter() - start
+
+
+# 统一读取：归档部分排在热表部分之前
+
+def archived_purchases(user):
+    """profile_data 中 bought 的归档部分"""
+    return ArchivedProduct.objects.filter(buyer=user).order_by('id')
+
+
+def archived_thread(user_id):
+    """聊天记录的归档部分，按时间排序；归档的消息都早于热表中的消息"""
+    return ArchivedMessage.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)).order_by('timestamp', 'id')
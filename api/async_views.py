@@ -0,0 +1,144 @@
+# api/async_views.py
+"""
+热点只读接口的异步版本，挂在 /api/async/ 下，供 ASGI 部署（unitrade_backend/asgi.py）使用。
+
+与同步 ViewSet 共用查询条件、ETag 计算和快速序列化映射，输出字节一致：
+商品列表/详情、profile_data、聊天记录、卖家评价。查询使用 Django 异步 ORM
+（aget / aaggregate / async for），等待数据库时不占用事件循环。
+
+注意：Django 5.2 的异步 ORM 仍在每个请求专属的线程中依次执行 SQL，同一请求内的查询
+无法真正并行；而用 asyncio.gather 发起查询时每个 Task 复制一份上下文，会各自打开新的
+数据库连接（不经过 PerformanceMiddleware 的统计，也不会被关闭）。因此 profile_data
+的查询依次 await，收益来自等待数据库期间事件循环可以处理其他请求。
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import Http404, HttpResponse
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import archive, conditional, fastpath, fieldsets, tasks
+from .models import User, Product, Message, Review, ArchivedProduct
+from .renderers import FastJSONRenderer
+from .serializers import ProductSerializer
+from .views import ProductViewSet, ReviewViewSet, UserViewSet, filter_products
+
+_renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+def async_api_view(view):
+    """只允许 GET/HEAD，并把 DRF 异常和 Http404 转换为与 DRF 相同的错误响应"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404 as exc:
+            return json_response({'detail': str(exc)}, status=404)
+        except APIException as exc:
+            response = json_response(exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail},
+                                     status=exc.status_code)
+            if exc.status_code == 401:
+                response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return response
+    return wrapper
+
+
+async def aget_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def authenticate(request):
+    """JWT 认证（查询用户需要数据库，放到线程中执行）；未登录时抛出 NotAuthenticated"""
+    result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    if result is None:
+        raise NotAuthenticated()
+    return result[0]
+
+
+@async_api_view
+async def product_list(request):
+    fields = fieldsets.select_fields(request, 'product')
+    queryset = filter_products(Product.objects.all(), request.GET)
+    return json_response(await fastpath.aproduct_rows(queryset, fields))
+
+
+@async_api_view
+async def product_detail(request, pk):
+    fields = fieldsets.select_fields(request, 'product')
+
+    def narrow(queryset):
+        queryset = filter_products(queryset, request.GET)
+        if fields is not None:
+            queryset = queryset.only(*fieldsets.model_columns(
+                'product', fields, ProductViewSet.sparse_required_columns))
+        return queryset
+    try:
+        instance = await aget_or_404(narrow(Product.objects.all()), pk=pk)
+    except Http404:
+        # 已归档的商品只读返回，不再计浏览量
+        instance = await aget_or_404(narrow(ArchivedProduct.objects.all()), pk=pk)
+    else:
+        await tasks.arecord_view(instance.pk)
+        instance.view_count += 1
+    etag = conditional.make_etag('product', instance.pk, instance.updated_at, fields)
+
+    async def build():
+        # sellerId / buyerId 只读取外键列，序列化时不会访问数据库
+        return json_response(ProductSerializer(instance, fields=fields).data)
+    return await conditional.aconditional_response(request, etag, instance.updated_at, build)
+
+
+@async_api_view
+async def profile_data(request, pk):
+    user = await aget_or_404(User.objects.all(), pk=pk)
+    state = [await queryset.aaggregate(**UserViewSet.PROFILE_STATE)
+             for queryset in UserViewSet.profile_state_querysets(user)]
+    etag, last_modified = UserViewSet.profile_validators(user, *state)
+
+    async def build():
+        querysets = UserViewSet.profile_querysets(user)
+        followed = querysets.pop('followedUsers')
+        archived = querysets.pop('archivedBought')
+        payload = {key: await fastpath.aproduct_rows(queryset) for key, queryset in querysets.items()}
+        payload['bought'] = await fastpath.aproduct_rows(archived) + payload['bought']
+        payload['followedUsers'] = await fastpath.auser_rows(followed)
+        return json_response(payload)
+    return await conditional.aconditional_response(request, etag, last_modified, build)
+
+
+@async_api_view
+async def message_list(request):
+    await authenticate(request)
+    fields = fieldsets.select_fields(request, 'message')
+    user_id = request.GET.get('userId')
+    if not user_id:
+        return json_response([])
+    queryset = Message.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)).order_by('timestamp')
+    rows = await fastpath.amessage_rows(archive.archived_thread(user_id), fields)
+    return json_response(rows + await fastpath.amessage_rows(queryset, fields))
+
+
+@async_api_view
+async def review_list(request):
+    fields = fieldsets.select_fields(request, 'review')
+    seller_id = request.GET.get('sellerId')
+    queryset = Review.objects.filter(seller_id=seller_id) if seller_id else Review.objects.all()
+    state = await queryset.aaggregate(**ReviewViewSet.REVIEW_STATE)
+    etag, last_modified = ReviewViewSet.review_validators(request, fields, state)
+
+    async def build():
+        return json_response(await fastpath.areview_rows(queryset, fields))
+    return await conditional.aconditional_response(request, etag, last_modified, build)
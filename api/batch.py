@@ -0,0 +1,264 @@
+# api/batch.py
+"""
+批量调用：POST /api/batch/ 一次提交多个子请求，打开应用时的刷新 token、profile_data、聊天记录、
+卖家评价、商品列表等请求只需一次往返。
+
+请求体：{"requests": [{"id": "me", "method": "GET", "path": "/api/users/u1/profile_data/",
+                      "headers": {"If-None-Match": "..."}, "body": {...}}, ...]}
+响应体：{"responses": [{"id": "me", "status": 200, "headers": {"ETag": "..."}, "body": {...}}, ...]}
+与请求同序。每项有自己的状态码，某一项失败不影响其他项；批量请求本身为 200，格式错误时为 400。
+
+- 路由：子请求按路径解析到现有的视图并直接调用，输出与单独请求相同；只接受 /api/ 下的路径，
+  不能嵌套。JSON 响应体原样嵌入，其他响应体作为字符串，流式响应（文件下载）的 body 为 null。
+- 认证：批量请求的 Authorization 只解码、查询一次，子请求沿用该用户（DRF 的强制认证）。
+  token 无效时不拒绝整批，子请求各自认证，刷新 token 的子请求照常工作；
+  在 headers 中带自己的 Authorization 的子请求也单独认证。客户端地址、Host 和连接相关的头
+  （X-Forwarded-*、Forwarded、Host 等）只取自批量请求本身，子请求设置这些头时整批返回 400。
+- 执行：连续的只读子请求（GET/HEAD）并行执行，最多同时 BATCH_MAX_PARALLEL 个（当前线程执行一个，
+  其余在线程池中，各用自己的数据库连接）；写请求按顺序单独执行，前面的写入对后面的子请求可见。
+  批量请求处在事务中时（ATOMIC_REQUESTS、测试）其他连接看不到未提交的数据，全部顺序执行。
+  全部为只读子请求时按 GET 的规则读从库（见 api/db_router.py）。没有跨子请求的事务。
+- 中间件：批量请求整体经过一次中间件链。子请求逐个按接口权重扣除限流令牌（见 api/throttling.py）。
+  当前线程中执行的子请求共用批量请求的身份映射（见 api/identity.py），线程池中的子请求各用自己的
+  映射（映射不是线程安全的）。性能指标按批量请求记录，不含线程池中执行的 SQL。
+"""
+import contextvars
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections, connection
+from django.http import Http404, HttpResponse
+from django.urls import Resolver404, resolve
+from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import db_router, identity, throttling
+from .middleware import resolve_route
+from .renderers import FastJSONRenderer
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD')
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+# 子请求不能设置的请求头（按 META 键名比较）：决定客户端地址、主机名和连接的头沿用批量请求本身，
+# 否则一个批量请求可以伪造多个 X-Forwarded-For 地址绕过按 IP 的限流
+FORBIDDEN_HEADERS = frozenset({
+    'HOST', 'FORWARDED', 'X_REAL_IP', 'CONNECTION', 'KEEP_ALIVE', 'TE', 'TRAILER', 'TRANSFER_ENCODING',
+    'UPGRADE', 'CONTENT_LENGTH',
+})
+FORBIDDEN_PREFIXES = ('X_FORWARDED_', 'PROXY_')
+# 原样带回的响应头
+RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Location', 'Retry-After', 'Allow')
+
+_renderer = FastJSONRenderer()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class Call(NamedTuple):
+    id: object  # 客户端给的标识，原样返回；没有时为下标
+    method: str
+    path: str
+    query: str
+    headers: dict
+    body: object
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, _setting('BATCH_MAX_PARALLEL', 4) - 1),
+                                           thread_name_prefix='api-batch')
+        return _executor
+
+
+def meta_key(name):
+    """请求头名对应的 META 键名（不含 HTTP_ 前缀）"""
+    return str(name).upper().replace('-', '_')
+
+
+def parse(data):
+    """校验请求体，返回 Call 列表；格式错误时抛出 ValueError"""
+    items = data.get('requests') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValueError('requests must be a non-empty list')
+    limit = _setting('BATCH_MAX_REQUESTS', 20)
+    if len(items) > limit:
+        raise ValueError(f'At most {limit} requests per batch')
+    calls = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f'requests[{index}] must be an object')
+        method = str(item.get('method', 'GET')).upper()
+        url = urlsplit(str(item.get('path', '')))
+        headers = item.get('headers') or {}
+        if method not in METHODS:
+            raise ValueError(f'requests[{index}]: unsupported method {method}')
+        if not url.path.startswith('/api/'):
+            raise ValueError(f'requests[{index}]: path must start with /api/')
+        if not isinstance(headers, dict):
+            raise ValueError(f'requests[{index}]: headers must be an object')
+        for name in headers:
+            key = meta_key(name)
+            if key in FORBIDDEN_HEADERS or key.startswith(FORBIDDEN_PREFIXES):
+                raise ValueError(f'requests[{index}]: header {name} cannot be set per request')
+        calls.append(Call(item.get('id', index), method, url.path, url.query, headers, item.get('body')))
+    return calls
+
+
+def authenticate(request):
+    """批量请求的用户和 token；没有或无效时返回 (None, None)，由子请求各自认证"""
+    try:
+        result = identity.JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None, None
+    return result or (None, None)
+
+
+def build_request(request, call, user, token):
+    """以批量请求的 META（客户端地址、cookie、Authorization）为基础构造子请求"""
+    body = b'' if call.body is None else _renderer.render(call.body)
+    meta = {key: value for key, value in request.META.items()
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH')}
+    meta.update({
+        'REQUEST_METHOD': call.method,
+        'SCRIPT_NAME': '',
+        # WSGI 的 PATH_INFO 是按 latin-1 解码的 UTF-8 字节
+        'PATH_INFO': call.path.encode().decode('iso-8859-1'),
+        'QUERY_STRING': call.query,
+        'HTTP_ACCEPT': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    })
+    meta.setdefault('wsgi.url_scheme', request.scheme)
+    if body:
+        meta['CONTENT_TYPE'] = 'application/json'
+    for name, value in call.headers.items():
+        key = meta_key(name)
+        meta[key if key == 'CONTENT_TYPE' else f'HTTP_{key}'] = str(value)
+    sub = WSGIRequest(meta)
+    if user is not None and meta.get('HTTP_AUTHORIZATION') == request.META.get('HTTP_AUTHORIZATION'):
+        sub._force_auth_user, sub._force_auth_token = user, token
+    return sub
+
+
+def _error(status, detail):
+    return HttpResponse(_renderer.render({'detail': detail}), status=status, content_type='application/json')
+
+
+def dispatch(sub):
+    """解析路由、检查限流并调用视图，总是返回响应"""
+    try:
+        match = resolve(sub.path_info)
+    except Resolver404:
+        return _error(404, 'Not found.')
+    if match.url_name == 'batch':
+        return _error(400, 'Batch requests cannot be nested.')
+    sub.resolver_match = match
+    if _setting('THROTTLE_ENABLED', False):
+        route, _ = resolve_route(sub, match.func)
+        result = throttling.check(sub, throttling.endpoint_name(sub, route))
+        if result is not None:
+            return throttling.throttled_response(*result)
+    try:
+        if iscoroutinefunction(match.func):
+            response = async_to_sync(match.func)(sub, *match.args, **match.kwargs)
+        else:
+            response = match.func(sub, *match.args, **match.kwargs)
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+    except Http404:
+        return _error(404, 'Not found.')
+    except Exception:
+        logger.exception('Batch sub-request %s %s failed', sub.method, sub.get_full_path())
+        return _error(500, 'A server error occurred.')
+    return response
+
+
+def _in_thread(sub, user):
+    # IdentityMap 不是线程安全的：线程池中的子请求各用一个新的映射，预先放入批量请求的用户；
+    # 与普通请求一样，在开始和结束时按 CONN_MAX_AGE 关闭过期的连接
+    close_old_connections()
+    try:
+        with identity.scope(read_only=True):
+            identity.add(user)
+            return dispatch(sub)
+    finally:
+        close_old_connections()
+
+
+def _run_together(subs, user):
+    pool = executor()
+    # 复制当前上下文：线程中的子请求沿用批量请求的读库选择
+    futures = [pool.submit(contextvars.copy_context().run, _in_thread, sub, user) for sub in subs[1:]]
+    first = dispatch(subs[0])  # 当前线程执行第一个，复用请求已打开的连接和身份映射
+    return [first] + [future.result() for future in futures]
+
+
+def run(subs, user=None):
+    """按顺序执行子请求，连续的只读子请求并行执行，返回与 subs 同序的响应"""
+    parallel = _setting('BATCH_MAX_PARALLEL', 4) > 1 and not connection.in_atomic_block
+    responses = []
+    start = 0
+    while start < len(subs):
+        stop = start + 1
+        if parallel and subs[start].method in READ_METHODS:
+            while stop < len(subs) and subs[stop].method in READ_METHODS:
+                stop += 1
+        responses.extend(_run_together(subs[start:stop], user) if stop - start > 1 else [dispatch(subs[start])])
+        start = stop
+    return responses
+
+
+def encode(call_id, response):
+    """一项结果的 JSON：JSON 响应体原样拼接，不重新解析和序列化"""
+    headers = {name: response[name] for name in RESPONSE_HEADERS if response.has_header(name)}
+    head = _renderer.render({'id': call_id, 'status': response.status_code, 'headers': headers})
+    if response.streaming:
+        response.close()
+        body = b'null'
+    elif not response.content:
+        body = b'null'
+    elif response.get('Content-Type', '').startswith('application/json'):
+        body = response.content
+    else:
+        body = _renderer.render(response.content.decode(response.charset, 'replace'))
+    return head[:-1] + b',"body":' + body + b'}'
+
+
+class BatchView(APIView):
+    # 子请求按各自接口的规则认证和鉴权，批量请求本身不要求登录
+    authentication_classes = ()
+    permission_classes = [permissions.AllowAny]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        try:
+            calls = parse(request.data)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=400)
+        user, token = authenticate(request)
+        outer = request._request
+        subs = [build_request(outer, call, user, token) for call in calls]
+        if all(call.method in READ_METHODS for call in calls):
+            with db_router.replica_reads(outer):
+                responses = run(subs, user)
+        else:
+            responses = run(subs, user)
+        items = b','.join(encode(call.id, response) for call, response in zip(calls, responses))
+        return HttpResponse(b'{"responses":[' + items + b']}', content_type='application/json')
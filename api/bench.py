@@ -0,0 +1,216 @@
+# api/bench.py
+"""
+API 基准测试工具：在测试数据库中生成数据，通过 Django 测试客户端逐个调用公开接口，
+记录延迟分位数 (p50/p95/p99) 与 SQL 查询数，并与保存的基线文件比较。
+
+由 ``manage.py bench_api`` 和 ``api/tests.py`` 共同使用。
+"""
+import io
+import json
+import math
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from .models import User, Product
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'bench_baseline.json'
+
+# 基准数据集的默认规模，基线文件中的查询数预算只对同规模的数据有效
+DEFAULT_DATASET = {'users': 200, 'products': 2000, 'seed': 42}
+
+PASSWORD = 'password123'
+
+
+def percentile(samples, pct):
+    """最近秩法求分位数"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class BenchContext:
+    """基准运行期间共享的数据：用户、token、可购买商品等"""
+
+    def __init__(self, client):
+        self.client = client
+        self.etags = {}
+        self.admin = User.objects.create_user(
+            id='ubenchadm', username='bench_admin', password=PASSWORD,
+            role='ADMIN', is_staff=True, is_superuser=True,
+        )
+        self.buyer = User.objects.create_user(id='ubenchbuy', username='bench_buyer', password=PASSWORD)
+        self.admin_auth = self.login(self.admin.username)
+        self.buyer_auth = self.login(self.buyer.username)
+        # 发布商品最多的卖家：profile_data / reviews 的最坏情况
+        self.power_seller = (
+            User.objects.filter(id__startswith='ug').order_by('id').values_list('id', flat=True).first()
+        )
+        self.hot_product = Product.objects.order_by('-view_count').values_list('id', flat=True).first()
+        self.purchasable = list(
+            Product.objects.filter(status='ACTIVE').exclude(seller=self.buyer)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def login(self, username):
+        response = self.client.post('/api/auth/login/', {'username': username, 'password': PASSWORD})
+        return {'HTTP_AUTHORIZATION': f"Bearer {response.json()['access']}"}
+
+
+def _get(path, auth=None):
+    def call(ctx, i):
+        headers = getattr(ctx, auth) if auth else {}
+        return ctx.client.get(path(ctx) if callable(path) else path, **headers)
+    return call
+
+
+def _revalidate(path):
+    """带上次响应的 ETag 重新请求，衡量 304 路径的开销"""
+    def call(ctx, i):
+        url = path(ctx)
+        etag = ctx.etags.get(url)
+        if etag is None:
+            etag = ctx.etags[url] = ctx.client.get(url)['ETag']
+        return ctx.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    return call
+
+
+def _login(ctx, i):
+    return ctx.client.post('/api/auth/login/', {'username': ctx.buyer.username, 'password': PASSWORD})
+
+
+def _purchase(ctx, i):
+    pid = ctx.purchasable[i % len(ctx.purchasable)]
+    return ctx.client.post(
+        f'/api/products/{pid}/purchase/',
+        {'buyerId': ctx.buyer.id, 'address': 'Library'},
+        content_type='application/json',
+        **ctx.buyer_auth,
+    )
+
+
+# 名称 -> 调用函数；每个调用返回一个 response
+SCENARIOS = {
+    'products_list': _get('/api/products/'),
+    'products_search': _get('/api/products/?search=Keyboard'),
+    'products_sort_price': _get('/api/products/?sort=price_asc&hideSold=true'),
+    'products_sort_views': _get('/api/products/?sort=views_desc'),
+    'product_retrieve': _get(lambda ctx: f'/api/products/{ctx.hot_product}/'),
+    'product_retrieve_304': _revalidate(lambda ctx: f'/api/products/{ctx.hot_product}/'),
+    'profile_data': _get(lambda ctx: f'/api/users/{ctx.power_seller}/profile_data/'),
+    'profile_data_304': _revalidate(lambda ctx: f'/api/users/{ctx.power_seller}/profile_data/'),
+    'messages': _get(lambda ctx: f'/api/messages/?userId={ctx.power_seller}', auth='buyer_auth'),
+    'reviews': _get(lambda ctx: f'/api/reviews/?sellerId={ctx.power_seller}'),
+    'reviews_304': _revalidate(lambda ctx: f'/api/reviews/?sellerId={ctx.power_seller}'),
+    'users_admin_list': _get('/api/users/admin_list/?pageSize=20', auth='admin_auth'),
+    'products_admin_list': _get('/api/products/admin_list/?pageSize=20', auth='admin_auth'),
+    'login': _login,
+    'purchase': _purchase,
+}
+
+
+@contextmanager
+def test_database():
+    """在独立的测试数据库中运行基准，不污染开发库；SQLite 下为内存库，可离线运行"""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_dataset(users, products, seed):
+    call_command('seed_synthetic', users=users, products=products, seed=seed, stdout=io.StringIO())
+
+
+def run_scenarios(iterations, names=None, client=None):
+    """
+    依次执行各场景，返回 {name: {'p50', 'p95', 'p99', 'queries', 'status', 'statuses'}}，延迟单位为毫秒。
+    status 为最后一次的状态码，statuses 为出现过的所有状态码。
+    同一个客户端地址连续登录和请求会被限流，基准运行期间关闭限流，测量的是接口本身。
+    """
+    results = {}
+    with override_settings(THROTTLE_ENABLED=False):
+        ctx = BenchContext(client or Client())
+        for name, call in SCENARIOS.items():
+            if names and name not in names:
+                continue
+            # 预热一次（不计时），同时为 _revalidate 场景取得 ETag
+            call(ctx, -1)
+            timings = []
+            max_queries = 0
+            statuses = set()
+            for i in range(iterations):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = call(ctx, i)
+                    timings.append((time.perf_counter() - start) * 1000)
+                max_queries = max(max_queries, len(queries))
+                statuses.add(response.status_code)
+            results[name] = {
+                'p50': round(percentile(timings, 50), 3),
+                'p95': round(percentile(timings, 95), 3),
+                'p99': round(percentile(timings, 99), 3),
+                'queries': max_queries,
+                'status': response.status_code,
+                'statuses': sorted(statuses),
+            }
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return None
+    with path.open(encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def save_baseline(results, dataset, path=BASELINE_PATH):
+    payload = {
+        'dataset': dataset,
+        'scenarios': {
+            name: {'queries': r['queries'], 'p95': r['p95'], 'p99': r['p99'], 'status': r['status']}
+            for name, r in results.items()
+        },
+    }
+    with Path(path).open('w', encoding='utf-8') as fp:
+        json.dump(payload, fp, indent=2, sort_keys=True)
+        fp.write('\n')
+
+
+def compare(results, baseline, latency_tolerance=None):
+    """
+    返回超出预算的描述列表。状态码与基线记录的不同（如被限流的 429、认证失败的 401，
+    查询数更少却不是在测量原来的路径）或查询数超过基线即视为回归；
+    latency_tolerance 为倍数（如 1.5），为 None 时不比较延迟（CI 机器延迟波动大）。
+    """
+    violations = []
+    budgets = baseline.get('scenarios', {})
+    for name, result in results.items():
+        budget = budgets.get(name)
+        expected = budget.get('status') if budget else None
+        unexpected = [status for status in result.get('statuses', [result['status']])
+                      if (status != expected if expected is not None else status >= 500)]
+        if unexpected:
+            wanted = f' (expected {expected})' if expected is not None else ''
+            violations.append(f"{name}: HTTP {', '.join(map(str, unexpected))}{wanted}")
+        if budget is None:
+            continue
+        if result['queries'] > budget['queries']:
+            violations.append(f"{name}: {result['queries']} queries > budget {budget['queries']}")
+        if latency_tolerance is not None:
+            for key in ('p95', 'p99'):
+                limit = budget[key] * latency_tolerance
+                if result[key] > limit:
+                    violations.append(f"{name}: {key} {result[key]:.1f}ms > budget {limit:.1f}ms")
+    return violations
@@ -0,0 +1,50 @@
+# api/conditional.py
+"""
+条件 GET 支持：由行的 updated_at / 聚合 max(updated_at) 计算 ETag 和 Last-Modified，
+不需要先序列化响应体。客户端携带 If-None-Match / If-Modified-Since 且资源未变化时返回 304。
+
+ETag 为弱校验器 (W/"...")：详情页的 viewCount 变化不会改变 ETag。
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def latest(*values):
+    """多个 updated_at 中的最大值，忽略 None（空集合的聚合结果）"""
+    present = [value for value in values if value is not None]
+    return max(present) if present else None
+
+
+def conditional_response(request, etag, last_modified, build):
+    """
+    资源未变化时返回 304 (或前置条件失败时返回 412)，否则调用 build() 生成响应，
+    并附上 ETag / Last-Modified 头。
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+    return _add_validators(response, etag, timestamp)
+
+
+async def aconditional_response(request, etag, last_modified, build):
+    """conditional_response 的异步版本，build 为返回响应的协程函数"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = await build()
+    return _add_validators(response, etag, timestamp)
+
+
+def _add_validators(response, etag, timestamp):
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
@@ -0,0 +1,210 @@
+# api/credit.py
+"""
+信用分批量计算：由 manage.py recompute_credit_scores 执行，结果写回 User.credit_score。
+
+输入用几条按用户分组的聚合查询取出（热表和归档表都计入），放进按用户对齐的 NumPy 数组，
+整批向量化计算：
+
+- 作为卖家收到的评价：贝叶斯平均分（以 RATING_PRIOR_COUNT 条 RATING_PRIOR_MEAN 分为先验，
+  评价少的用户不会因一两条评价大起大落）
+- 已完成（RECEIVED）的销售数、已成交（SOLD / RECEIVED）的购买数，按 log1p 递减加分
+- 被下架（BANNED）的商品数、账号是否被封禁，扣分
+
+只把分数有变化的用户写回：按新分数分组，同一分数的用户一条 UPDATE（同时刷新 updated_at，
+使包含 creditScore 的响应的 ETag 失效）。
+
+增量模式只重算上次运行开始后有新事件（评价、商品状态变化、账号修改）的用户，其中也包括
+上次运行刚写入新分数的用户（分数已是最新，不会再次写入）；删除商品、删除评价等不留痕迹的
+变化要等下一次全量计算。
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import objcache
+from .fastpath import IN_BATCH_SIZE
+from .models import User, Product, Review, ArchivedProduct, CreditScoreRun
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，只有信用分批量计算需要
+    np = None
+
+BASE_SCORE = 600
+MIN_SCORE, MAX_SCORE = 300, 950
+RATING_PRIOR_MEAN = 4.0
+RATING_PRIOR_COUNT = 5
+RATING_WEIGHT = 80  # 每高于 / 低于先验 1 分
+SALES_WEIGHT = 45  # * log1p(已完成销售数)
+PURCHASES_WEIGHT = 20  # * log1p(购买数)
+ACTIVITY_CAP = 200  # 交易活跃度加分上限
+BANNED_LISTING_PENALTY = 60  # 每个被下架的商品
+BANNED_LISTING_CAP = 300
+BANNED_USER_PENALTY = 250
+
+PRODUCT_MODELS = (Product, ArchivedProduct)
+
+
+class ScoringInputs:
+    """按 ids 对齐的输入数组"""
+
+    def __init__(self, ids, is_banned, current):
+        self.ids = ids
+        self.index = {user_id: i for i, user_id in enumerate(ids)}
+        size = len(ids)
+        self.is_banned = is_banned
+        self.current = current
+        self.review_count = np.zeros(size, dtype=np.int64)
+        self.rating_total = np.zeros(size, dtype=np.int64)
+        self.sales = np.zeros(size, dtype=np.int64)
+        self.purchases = np.zeros(size, dtype=np.int64)
+        self.banned_listings = np.zeros(size, dtype=np.int64)
+
+    def add(self, target, rows):
+        """rows 为 (user_id, value)；同一用户出现多次（热表 + 归档表）时累加"""
+        positions, values = [], []
+        index = self.index
+        for user_id, value in rows:
+            i = index.get(user_id)
+            if i is not None:
+                positions.append(i)
+                values.append(value)
+        if positions:
+            np.add.at(target, np.asarray(positions, dtype=np.int64), np.asarray(values, dtype=np.int64))
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('Credit scoring requires numpy (pip install numpy)')
+
+
+def _grouped(queryset, column, user_ids):
+    """执行按用户分组的聚合查询；指定 user_ids 时分批加 IN 条件"""
+    if user_ids is None:
+        yield from queryset
+        return
+    for start in range(0, len(user_ids), IN_BATCH_SIZE):
+        yield from queryset.filter(**{f'{column}__in': user_ids[start:start + IN_BATCH_SIZE]})
+
+
+def load_inputs(user_ids=None):
+    """取出 user_ids（None 为全部用户）的评分输入，共 6 条聚合查询（分批时按批数增加）"""
+    require_numpy()
+    users = list(_grouped(User.objects.order_by().values_list('id', 'is_banned', 'credit_score'), 'id', user_ids))
+    ids = [row[0] for row in users]
+    inputs = ScoringInputs(
+        ids,
+        np.fromiter((row[1] for row in users), dtype=bool, count=len(users)),
+        np.fromiter((row[2] for row in users), dtype=np.int64, count=len(users)),
+    )
+    del users
+    if user_ids is not None:
+        user_ids = ids
+
+    reviews = list(_grouped(
+        Review.objects.order_by().values_list('seller_id').annotate(n=Count('id'), total=Sum('rating')),
+        'seller_id', user_ids))
+    inputs.add(inputs.review_count, ((seller_id, n) for seller_id, n, _ in reviews))
+    inputs.add(inputs.rating_total, ((seller_id, total) for seller_id, _, total in reviews))
+
+    for model in PRODUCT_MODELS:
+        listings = _grouped(
+            model.objects.filter(status__in=('RECEIVED', 'BANNED')).order_by()
+            .values_list('seller_id', 'status').annotate(n=Count('id')),
+            'seller_id', user_ids)
+        sales, banned = [], []
+        for seller_id, status, n in listings:
+            (sales if status == 'RECEIVED' else banned).append((seller_id, n))
+        inputs.add(inputs.sales, sales)
+        inputs.add(inputs.banned_listings, banned)
+        inputs.add(inputs.purchases, _grouped(
+            model.objects.filter(buyer__isnull=False, status__in=('SOLD', 'RECEIVED')).order_by()
+            .values_list('buyer_id').annotate(n=Count('id')),
+            'buyer_id', user_ids))
+    return inputs
+
+
+def compute_scores(inputs):
+    """向量化计算所有用户的新分数，返回 int64 数组"""
+    require_numpy()
+    rating = ((inputs.rating_total + RATING_PRIOR_MEAN * RATING_PRIOR_COUNT)
+              / (inputs.review_count + RATING_PRIOR_COUNT))
+    activity = np.minimum(SALES_WEIGHT * np.log1p(inputs.sales) + PURCHASES_WEIGHT * np.log1p(inputs.purchases),
+                          ACTIVITY_CAP)
+    penalty = (np.minimum(BANNED_LISTING_PENALTY * inputs.banned_listings, BANNED_LISTING_CAP)
+               + BANNED_USER_PENALTY * inputs.is_banned)
+    scores = BASE_SCORE + RATING_WEIGHT * (rating - RATING_PRIOR_MEAN) + activity - penalty
+    return np.clip(np.rint(scores), MIN_SCORE, MAX_SCORE).astype(np.int64)
+
+
+def write_scores(inputs, scores):
+    """写回有变化的分数：同一分数的用户按 IN_BATCH_SIZE 分批，一条 UPDATE；返回变化的用户数"""
+    changed = np.flatnonzero(scores != inputs.current)
+    if not changed.size:
+        return 0
+    # 按新分数排序后切分成相同分数的段
+    changed = changed[np.argsort(scores[changed], kind='stable')]
+    ordered = scores[changed]
+    bounds = np.flatnonzero(np.diff(ordered)) + 1
+    now = timezone.now()
+    ids = inputs.ids
+    for group in np.split(changed, bounds):
+        score = int(scores[group[0]])
+        user_ids = [ids[i] for i in group]
+        with transaction.atomic():
+            for start in range(0, len(user_ids), IN_BATCH_SIZE):
+                User.objects.filter(id__in=user_ids[start:start + IN_BATCH_SIZE]).update(
+                    credit_score=score, updated_at=now)
+            # update() 不发信号，手动使对象缓存失效（见 api/objcache.py）
+            objcache.cache.invalidate(User, user_ids)
+    return int(changed.size)
+
+
+def affected_users(since):
+    """since 之后有新事件的用户"""
+    user_ids = set(Review.objects.filter(updated_at__gte=since).values_list('seller_id', flat=True))
+    for seller_id, buyer_id in Product.objects.filter(updated_at__gte=since).values_list('seller_id', 'buyer_id'):
+        user_ids.add(seller_id)
+        if buyer_id is not None:
+            user_ids.add(buyer_id)
+    user_ids.update(User.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+    return sorted(user_ids)
+
+
+def last_run():
+    return CreditScoreRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+
+
+def recompute(incremental=False, since=None):
+    """执行一次全量或增量计算，返回保存好的 CreditScoreRun；没有上次运行记录时增量模式退化为全量"""
+    require_numpy()
+    run = CreditScoreRun(mode='full', started_at=timezone.now())
+    if incremental and since is None:
+        previous = last_run()
+        since = previous.started_at if previous else None
+    user_ids = None
+    timings = {}
+    start = time.perf_counter()
+    if incremental and since is not None:
+        run.mode, run.since = 'incremental', since
+        user_ids = affected_users(since)
+        timings['events'] = time.perf_counter() - start
+
+    phase = time.perf_counter()
+    inputs = load_inputs(user_ids)
+    timings['load'] = time.perf_counter() - phase
+    phase = time.perf_counter()
+    scores = compute_scores(inputs)
+    timings['compute'] = time.perf_counter() - phase
+    phase = time.perf_counter()
+    run.users_changed = write_scores(inputs, scores)
+    timings['write'] = time.perf_counter() - phase
+    timings['total'] = time.perf_counter() - start
+
+    run.users_scored = len(inputs.ids)
+    run.timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+    run.finished_at = timezone.now()
+    run.save()
+    return run
@@ -0,0 +1,187 @@
+# api/db_router.py
+"""
+读写分离：写入和事务内的读取走主库 default，安全的只读请求走 DATABASE_REPLICAS 中的从库。
+
+- 只有经过 ReplicaRoutingMiddleware 的 GET/HEAD 请求，以及只包含读取的 /api/batch/ 批量请求
+  （见 replica_reads）才会读从库；管理命令、后台任务、写请求（包括 purchase / withdraw 等
+  POST action）中的所有查询都走主库。
+- 读己之写：客户端发出写请求后，响应带上 REPLICA_STICKY_COOKIE（有效期
+  REPLICA_STICKY_SECONDS 秒），期间它的读请求仍走主库，不会读到尚未同步的从库。
+- 复制延迟超过 REPLICA_MAX_LAG_SECONDS（或无法连接）的从库暂时移出轮询，
+  每个从库最多每 REPLICA_LAG_CHECK_SECONDS 秒检查一次；没有可用从库时读主库。
+
+本地可用 unitrade_backend/settings_replica.py 以两个 SQLite 文件模拟主从，
+由 manage.py sync_sqlite_replica 周期性复制。
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+
+# 当前请求的读库选择：None 表示读主库；否则为 [已选从库或 None]，首次读取时选定，
+# 同一请求内的查询都读同一个从库，避免前后两条查询看到不同的复制进度
+_replica_choice = contextvars.ContextVar('replica_choice', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def probe_lag(alias):
+    """查询从库的复制延迟（秒）；无法取得时抛出 DatabaseError"""
+    conn = connections[alias]
+    with conn.cursor() as cursor:
+        if conn.vendor == 'mysql':
+            cursor.execute('SHOW REPLICA STATUS')
+            row = cursor.fetchone()
+            if row is None:
+                raise DatabaseError(f'{alias} is not replicating')
+            columns = [col[0] for col in cursor.description]
+            lag = dict(zip(columns, row)).get('Seconds_Behind_Source')
+            if lag is None:
+                raise DatabaseError(f'{alias} replication is stopped')
+            return float(lag)
+        if conn.vendor == 'sqlite':
+            # sync_sqlite_replica 每次复制后把复制时间写入 user_version
+            cursor.execute('PRAGMA user_version')
+            synced_at = cursor.fetchone()[0]
+            return max(time.time() - synced_at, 0.0) if synced_at else 0.0
+    return 0.0
+
+
+def _mirrors_primary(alias):
+    """从库与主库是同一个数据库（如测试时的 TEST MIRROR）：另开连接读不到主库未提交的事务，直接读主库"""
+    if alias not in connections.settings:
+        return False
+    return connections[alias].settings_dict['NAME'] == connections[PRIMARY].settings_dict['NAME']
+
+
+class LagMonitor:
+    """缓存每个从库最近一次检查的延迟，过期后再检查"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lag = {}  # alias -> (lag 秒数, 检查时间)
+
+    def record(self, alias, lag):
+        with self._lock:
+            self._lag[alias] = (lag, time.monotonic())
+
+    def lag(self, alias):
+        interval = getattr(settings, 'REPLICA_LAG_CHECK_SECONDS', 10)
+        cached = self._lag.get(alias)
+        if cached is not None and time.monotonic() - cached[1] < interval:
+            return cached[0]
+        try:
+            lag = probe_lag(alias)
+        except DatabaseError as exc:
+            logger.warning('Replica %s unavailable: %s', alias, exc)
+            lag = float('inf')
+        self.record(alias, lag)
+        return lag
+
+    def healthy(self):
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 2)
+        return [alias for alias in replicas() if not _mirrors_primary(alias) and self.lag(alias) <= max_lag]
+
+    def reset(self):
+        with self._lock:
+            self._lag.clear()
+
+
+lag_monitor = LagMonitor()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # 关联查询跟随实例所在的库
+            return instance._state.db
+        choice = _replica_choice.get()
+        if choice is None:
+            return PRIMARY
+        if choice[0] is None:
+            healthy = lag_monitor.healthy()
+            choice[0] = random.choice(healthy) if healthy else PRIMARY
+        return choice[0]
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 从库的结构由复制得到
+        return db == PRIMARY
+
+
+class ReplicaRoutingMiddleware:
+    """GET/HEAD 请求（近期未写入的客户端）读从库；写请求的响应设置粘滞 cookie"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie = getattr(settings, 'REPLICA_STICKY_COOKIE', 'unitrade_primary')
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _choice(self, request):
+        if request.method in ('GET', 'HEAD') and self.cookie not in request.COOKIES and replicas():
+            return [None]
+        return None
+
+    def _finish(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and not getattr(request, 'replica_read_only', False):
+            response.set_cookie(self.cookie, '1', max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _replica_choice.set(self._choice(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_choice.reset(token)
+        return self._finish(request, response)
+
+    async def __acall__(self, request):
+        # ContextVar 会随 sync_to_async 复制到执行 ORM 的线程中
+        token = _replica_choice.set(self._choice(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica_choice.reset(token)
+        return self._finish(request, response)
+
+
+@contextmanager
+def replica_reads(request):
+    """
+    在 POST 请求中按 GET 请求的规则读从库，且响应不设置粘滞 cookie：
+    用于只包含读取的 /api/batch/ 批量请求（见 api/batch.py）
+    """
+    cookie = getattr(settings, 'REPLICA_STICKY_COOKIE', 'unitrade_primary')
+    request.replica_read_only = True
+    token = _replica_choice.set([None] if cookie not in request.COOKIES and replicas() else None)
+    try:
+        yield
+    finally:
+        _replica_choice.reset(token)
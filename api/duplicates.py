@@ -0,0 +1,270 @@
+# api/duplicates.py
+"""
+近似重复商品检测（MinHash + LSH 分段）。
+
+- 签名：标题和描述按 api/saved_searches.py 的关键词规则分词（英文单词、中文两字词），对词集合
+  计算 64 个最小哈希。两个签名中相等的位置所占比例是两段文本词集合 Jaccard 相似度的估计；
+  改几个词、加一句描述的重复发布相似度通常在 0.7 以上，不同商品一般低于 0.4。
+  商品标题和描述都很短，MinHash 比 SimHash 稳定：SimHash 改一个词就会翻转不少位。
+- 索引：签名每 4 个值为一段，共 16 段，每段的哈希作为一行存入 api_productfingerprintband，
+  (seller, key) 有联合索引。相似度为 0.7 的两个商品至少有一段相同的概率约 99%，0.3 时约 12%。
+  查找时用一条 key IN (...) 查询取出任一段相同的候选，再用签名估计相似度，与卖家的商品数无关。
+- 发布：ProductViewSet.perform_create 和批量发布（api/listings.py）在同一卖家的在售商品和同批
+  前面的行中查找相似度不低于 DUPLICATE_MIN_SIMILARITY 的商品。DUPLICATE_LISTING_ACTION 为
+  'reject' 时拒绝，为 'flag' 时照常发布并在指纹行记录 duplicate_of，为 'off' 时只记录签名。
+  修改标题或描述时重新计算。
+- 报告：clusters() 在数据库中按段分组，只取出有两个以上商品的段；每段内的商品与已有簇的代表比较
+  相似度，用并查集合并为重复簇。管理员接口 GET /api/products/duplicates/ 和 manage.py find_duplicates 使用；
+  后者可以先补算历史商品的签名。
+"""
+import hashlib
+import operator
+import random
+import struct
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Count
+
+from .fastpath import IN_BATCH_SIZE
+from .models import Product, ProductFingerprint, ProductFingerprintBand
+from .saved_searches import keyword_terms
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，没有时逐个计算，结果相同
+    np = None
+
+NUM_HASHES = 64
+BAND_ROWS = 4
+BANDS = NUM_HASHES // BAND_ROWS
+MASK = (1 << 64) - 1
+SIGNATURE = struct.Struct(f'<{NUM_HASHES}I')
+# 乘移位哈希 ((a * x + b) mod 2^64) >> 32，a 为奇数；固定种子：签名写入数据库后哈希函数不能改变
+_rng = random.Random(20240601)
+PERMUTATIONS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(NUM_HASHES)]
+if np is not None:
+    _A = np.array([a for a, _ in PERMUTATIONS], dtype=np.uint64)[:, None]
+    _B = np.array([b for _, b in PERMUTATIONS], dtype=np.uint64)[:, None]
+
+
+class Screened(NamedTuple):
+    signature: tuple  # 词太少时为 None，不参与检测
+    duplicate_of: str  # 近似重复的已有商品 id，没有时为 ''
+    same_as: int  # 批量发布时近似重复的前面某行的下标，没有时为 None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def action():
+    return _setting('DUPLICATE_LISTING_ACTION', 'flag')
+
+
+def _hash(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def signature(title, description):
+    """返回 64 个最小哈希值的元组；不同的词少于 DUPLICATE_MIN_TERMS 个时返回 None"""
+    terms = set(keyword_terms(f'{title or ""} {description or ""}'))
+    if len(terms) < _setting('DUPLICATE_MIN_TERMS', 3):
+        return None
+    hashes = [_hash(term.encode()) for term in terms]
+    if np is not None:
+        # uint64 乘法溢出即为 mod 2^64
+        values = (_A * np.array(hashes, dtype=np.uint64) + _B) >> np.uint64(32)
+        return tuple(int(value) for value in values.min(axis=1))
+    return tuple(min((a * h + b) & MASK for h in hashes) >> 32 for a, b in PERMUTATIONS)
+
+
+def band_keys(sig):
+    keys = []
+    for band in range(BANDS):
+        packed = struct.pack(f'<B{BAND_ROWS}I', band, *sig[band * BAND_ROWS:(band + 1) * BAND_ROWS])
+        key = _hash(packed)
+        keys.append(key - (1 << 64) if key >= 1 << 63 else key)  # BigIntegerField 为有符号 64 位
+    return keys
+
+
+def similarity(a, b):
+    return sum(map(operator.eq, a, b)) / NUM_HASHES
+
+
+def _unpack(value):
+    return SIGNATURE.unpack(bytes(value))
+
+
+def _candidates(seller_id, keys):
+    """同一卖家在售商品中 key 在 keys 中的分段，返回 {key: [(商品 id, 签名), ...]}"""
+    keys = sorted(keys)
+    found = defaultdict(list)
+    signatures = {}
+    for start in range(0, len(keys), IN_BATCH_SIZE):
+        rows = (ProductFingerprintBand.objects
+                .filter(seller_id=seller_id, key__in=keys[start:start + IN_BATCH_SIZE], product__status='ACTIVE')
+                .values_list('key', 'product_id', 'product__fingerprint__signature'))
+        for key, pk, value in rows:
+            if value is not None:
+                if pk not in signatures:
+                    signatures[pk] = _unpack(value)
+                found[key].append((pk, signatures[pk]))
+    return found
+
+
+def screen(seller_id, texts):
+    """texts 为 [(标题, 描述), ...]，返回与之对应的 Screened 列表"""
+    signatures = [signature(title, description) for title, description in texts]
+    keys = [band_keys(sig) if sig is not None else () for sig in signatures]
+    all_keys = {key for row in keys for key in row}
+    if not all_keys:
+        return [Screened(None, '', None) for _ in texts]
+    threshold = _setting('DUPLICATE_MIN_SIMILARITY', 0.7)
+    existing = _candidates(seller_id, all_keys)
+    earlier = defaultdict(list)  # 同批中前面的行
+    result = []
+    for index, (sig, row_keys) in enumerate(zip(signatures, keys)):
+        if sig is None:
+            result.append(Screened(None, '', None))
+            continue
+        scores = {pk: similarity(sig, other) for key in row_keys for pk, other in existing.get(key, ())}
+        near = [(-score, pk) for pk, score in scores.items() if score >= threshold]
+        duplicate_of = min(near)[1] if near else ''
+        same_as = None
+        if not duplicate_of:
+            rows = {row for key in row_keys for row, other in earlier.get(key, ())
+                    if similarity(sig, other) >= threshold}
+            same_as = min(rows) if rows else None
+        for key in row_keys:
+            earlier[key].append((index, sig))
+        result.append(Screened(sig, duplicate_of, same_as))
+    return result
+
+
+def check(seller_id, title, description):
+    return screen(seller_id, [(title, description)])[0]
+
+
+def record(products, screened):
+    """为新商品写入签名和分段；'off' 模式下不记录 duplicate_of"""
+    flag = action() != 'off'
+    fingerprints, bands = [], []
+    for product, match in zip(products, screened):
+        if match.signature is None:
+            continue
+        duplicate_of = ''
+        if flag:
+            duplicate_of = match.duplicate_of or (products[match.same_as].pk if match.same_as is not None else '')
+        fingerprints.append(ProductFingerprint(product_id=product.pk, seller_id=product.seller_id,
+                                               signature=SIGNATURE.pack(*match.signature),
+                                               duplicate_of=duplicate_of))
+        bands.extend(ProductFingerprintBand(product_id=product.pk, seller_id=product.seller_id, key=key)
+                     for key in band_keys(match.signature))
+    ProductFingerprint.objects.bulk_create(fingerprints, batch_size=500)
+    ProductFingerprintBand.objects.bulk_create(bands, batch_size=1000)
+
+
+def forget(product_ids):
+    ProductFingerprintBand.objects.filter(product_id__in=product_ids).delete()
+    ProductFingerprint.objects.filter(product_id__in=product_ids).delete()
+
+
+def refresh(product):
+    """标题或描述修改后重新计算签名"""
+    forget([product.pk])
+    record([product], [check(product.seller_id, product.title, product.description)])
+
+
+def backfill(batch_size=1000):
+    """为还没有签名的商品计算签名（不判定重复），返回处理的商品数"""
+    done = 0
+    last = ''
+    while True:
+        products = list(Product.objects.filter(pk__gt=last, fingerprint__isnull=True).order_by('pk')
+                        .only('id', 'seller_id', 'title', 'description')[:batch_size])
+        if not products:
+            return done
+        screened = [Screened(signature(product.title, product.description), '', None) for product in products]
+        record(products, screened)
+        done += len(products)
+        last = products[-1].pk
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def clusters(same_seller=True, limit=50):
+    """全部商品的近似重复簇，按大小降序，返回 (簇总数, 前 limit 个簇)；same_seller 为 False 时也合并不同卖家的商品"""
+    threshold = _setting('DUPLICATE_MIN_SIMILARITY', 0.7)
+    scope = ('seller_id', 'key') if same_seller else ('key',)
+    # 由数据库按段分组，只取出有两个以上商品的段
+    shared = sorted({row['key'] for row in (ProductFingerprintBand.objects.values(*scope)
+                                            .annotate(n=Count('id')).filter(n__gt=1).order_by().iterator())})
+    buckets = defaultdict(list)
+    for start in range(0, len(shared), IN_BATCH_SIZE):
+        for seller_id, key, pk in (ProductFingerprintBand.objects.filter(key__in=shared[start:start + IN_BATCH_SIZE])
+                                   .values_list('seller_id', 'key', 'product_id')):
+            buckets[(seller_id, key) if same_seller else key].append(pk)
+    members = sorted({pk for pks in buckets.values() if len(pks) > 1 for pk in pks})
+    signatures = {}
+    for start in range(0, len(members), IN_BATCH_SIZE):
+        signatures.update((pk, _unpack(value)) for pk, value in ProductFingerprint.objects
+                          .filter(product_id__in=members[start:start + IN_BATCH_SIZE])
+                          .values_list('product_id', 'signature'))
+
+    sets = _UnionFind()
+    for pks in buckets.values():
+        # 每个桶内只与各个簇的代表比较：原样重复发布的大簇不会退化为两两比较。
+        # 与某个代表相似的成员并入该簇，都不相似的成为新代表
+        leaders = []
+        for pk in pks:
+            sig = signatures.get(pk)
+            if sig is None:
+                continue
+            joined = False
+            for leader, leader_sig in leaders:
+                if sets.find(leader) == sets.find(pk):
+                    joined = True
+                elif similarity(sig, leader_sig) >= threshold:
+                    sets.union(leader, pk)
+                    joined = True
+            if not joined:
+                leaders.append((pk, sig))
+    merged = defaultdict(list)
+    for pk in sets.parent:
+        merged[sets.find(pk)].append(pk)
+    found = sorted((sorted(pks) for pks in merged.values() if len(pks) > 1), key=lambda pks: (-len(pks), pks[0]))
+    return len(found), _describe(found[:limit])
+
+
+def _describe(found):
+    wanted = [pk for pks in found for pk in pks]
+    products = {}
+    for start in range(0, len(wanted), IN_BATCH_SIZE):
+        for row in (Product.objects.filter(pk__in=wanted[start:start + IN_BATCH_SIZE])
+                    .values('id', 'seller_id', 'title', 'price', 'status', 'created_at')):
+            products[row['id']] = {'id': row['id'], 'sellerId': row['seller_id'], 'title': row['title'],
+                                   'price': str(row['price']), 'status': row['status'],
+                                   'createdAt': row['created_at']}
+    report = []
+    for pks in found:
+        items = [products[pk] for pk in pks if pk in products]
+        report.append({'size': len(items), 'sellers': len({item['sellerId'] for item in items}), 'products': items})
+    return report
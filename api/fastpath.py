@@ -0,0 +1,258 @@
+# api/fastpath.py
+"""
+只读列表接口的快速序列化路径。
+
+DRF 的 ModelSerializer 对每一行、每个字段都要经过 Field.get_attribute /
+to_representation，列表接口的大部分时间花在这里而不是 SQL 上。这里改为用
+values_list() 直接取列，再由按模型预编译的映射函数生成与 ProductSerializer /
+UserSerializer / MessageSerializer / ReviewSerializer 完全相同的 camelCase 结构，
+配合 renderers.FastJSONRenderer 输出字节一致的 JSON（见 api/tests.py 中的一致性测试）。
+
+修改上述序列化器的字段时，必须同步修改这里的映射。
+"""
+import decimal
+from collections import defaultdict
+
+from django.utils import timezone
+
+from . import media
+from .models import User
+
+# 批量查询多对多关系时每批的 id 数，避开 SQLite 的参数个数上限
+IN_BATCH_SIZE = 900
+
+
+def to_datetime(value, tz):
+    """与 DRF DateTimeField.to_representation (ISO 8601) 一致；tz 为当前时区，每次查询只取一次"""
+    if not value:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+to_datetime.uses_timezone = True
+
+
+def decimal_converter(max_digits, decimal_places):
+    """与 DRF DecimalField.to_representation (COERCE_DECIMAL_TO_STRING) 一致"""
+    exponent = decimal.Decimal('.1') ** decimal_places
+
+    context = decimal.Context(prec=max_digits)
+
+    def to_decimal(value):
+        if value is None:
+            return ''
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return f'{value.quantize(exponent, context=context):f}'
+    return to_decimal
+
+
+def to_float(value):
+    return None if value is None else float(value)
+
+
+class RowMapper:
+    """
+    把 values_list() 取出的元组映射为序列化器的输出 dict。
+    fields 为 [(输出键, 列名, 转换函数或 None), ...]；列名为 None 的键只占位（值为 None），
+    由调用方随后填入（如多对多 id 列表）。映射函数在构造时用 exec 生成，
+    省去逐字段的循环和属性查找。
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.columns = [column for _, column, _ in self.fields if column is not None]
+        namespace = {}
+        items = []
+        i = 0
+        for key, column, convert in self.fields:
+            if column is None:
+                items.append(f'{key!r}: None')
+                continue
+            if convert is None:
+                items.append(f'{key!r}: row[{i}]')
+            else:
+                namespace[f'_convert{i}'] = convert
+                extra = ', tz' if getattr(convert, 'uses_timezone', False) else ''
+                items.append(f'{key!r}: _convert{i}(row[{i}]{extra})')
+            i += 1
+        exec(f"def map_row(row, tz):\n    return {{{', '.join(items)}}}\n", namespace)
+        self.map_row = namespace['map_row']
+        self.keys = [key for key, _, _ in self.fields]
+        self._subsets = {}
+
+    def subset(self, keys):
+        """只包含 keys 的映射器（保持原字段顺序），按字段组合缓存，供稀疏字段集使用"""
+        if keys is None:
+            return self
+        keys = tuple(key for key in self.keys if key in keys)
+        mapper = self._subsets.get(keys)
+        if mapper is None:
+            mapper = self._subsets[keys] = RowMapper([field for field in self.fields if field[0] in keys])
+        return mapper
+
+    def rows(self, queryset):
+        map_row = self.map_row
+        tz = timezone.get_current_timezone()
+        return [map_row(row, tz) for row in queryset.values_list(*self.columns)]
+
+    async def arows(self, queryset):
+        """
+        rows() 的异步版本，供 ASGI 下的异步视图使用。
+        values_list().aiterator() 在 Django 5.2 中会在事件循环里直接执行 SQL（抛出
+        SynchronousOnlyOperation），因此用 async for：整批结果在线程中一次取回。
+        """
+        map_row = self.map_row
+        tz = timezone.get_current_timezone()
+        return [map_row(row, tz) async for row in queryset.values_list(*self.columns)]
+
+
+PRODUCT_MAPPER = RowMapper([
+    ('id', 'id', None),
+    ('sellerId', 'seller_id', None),
+    ('buyerId', 'buyer_id', None),
+    ('title', 'title', None),
+    ('price', 'price', decimal_converter(10, 2)),
+    ('description', 'description', None),
+    ('category', 'category', None),
+    ('image', 'image', None),
+    ('imageVariants', 'image', media.variant_urls),
+    ('status', 'status', None),
+    ('viewCount', 'view_count', None),
+    ('createdAt', 'created_at', to_datetime),
+    ('tags', 'tags', None),
+])
+
+# wishlist / following 是多对多字段，由 user_rows 单独批量查询后填入
+USER_MAPPER = RowMapper([
+    ('id', 'id', None),
+    ('username', 'username', None),
+    ('avatar', 'avatar', None),
+    ('avatarVariants', 'avatar', media.variant_urls),
+    ('role', 'role', None),
+    ('creditScore', 'credit_score', None),
+    ('bio', 'bio', None),
+    ('isBanned', 'is_banned', None),
+    ('joinDate', 'date_joined', to_datetime),
+    ('wishlist', None, None),
+    ('following', None, None),
+    ('walletBalance', 'wallet_balance', to_float),
+])
+
+MESSAGE_MAPPER = RowMapper([
+    ('id', 'id', None),
+    ('senderId', 'sender_id', None),
+    ('receiverId', 'receiver_id', None),
+    ('content', 'content', None),
+    ('timestamp', 'timestamp', to_datetime),
+    ('is_read', 'is_read', None),
+    ('type', 'msg_type', None),
+])
+
+REVIEW_MAPPER = RowMapper([
+    ('id', 'id', None),
+    ('sellerId', 'seller_id', None),
+    ('buyerId', 'buyer_id', None),
+    ('buyerName', 'buyer__username', None),
+    ('productId', 'product_id', None),
+    ('rating', 'rating', None),
+    ('content', 'content', None),
+    ('createdAt', 'created_at', to_datetime),
+])
+
+
+def _related_ids(through, owner_column, target_column, owner_ids):
+    """分批查询多对多中间表，返回 {owner_id: [target_id, ...]}"""
+    grouped = defaultdict(list)
+    for start in range(0, len(owner_ids), IN_BATCH_SIZE):
+        batch = owner_ids[start:start + IN_BATCH_SIZE]
+        pairs = (through.objects.filter(**{f'{owner_column}__in': batch})
+                 .order_by(owner_column, target_column)
+                 .values_list(owner_column, target_column))
+        for owner_id, target_id in pairs:
+            grouped[owner_id].append(target_id)
+    return grouped
+
+
+async def _arelated_ids(through, owner_column, target_column, owner_ids):
+    grouped = defaultdict(list)
+    for start in range(0, len(owner_ids), IN_BATCH_SIZE):
+        batch = owner_ids[start:start + IN_BATCH_SIZE]
+        pairs = (through.objects.filter(**{f'{owner_column}__in': batch})
+                 .order_by(owner_column, target_column)
+                 .values_list(owner_column, target_column))
+        async for owner_id, target_id in pairs:
+            grouped[owner_id].append(target_id)
+    return grouped
+
+
+def product_rows(queryset, fields=None):
+    return PRODUCT_MAPPER.subset(fields).rows(queryset)
+
+
+def user_rows(queryset, fields=None):
+    related = [key for key in ('wishlist', 'following') if fields is None or key in fields]
+    if not related:
+        return USER_MAPPER.subset(fields).rows(queryset)
+    # 查询多对多需要 id，即使调用方没有请求 id 字段
+    drop_id = fields is not None and 'id' not in fields
+    rows = USER_MAPPER.subset(None if fields is None else set(fields) | {'id'}).rows(queryset)
+    ids = [row['id'] for row in rows]
+    if 'wishlist' in related:
+        wishlist = _related_ids(User.wishlist.through, 'user_id', 'product_id', ids)
+        for row in rows:
+            row['wishlist'] = wishlist.get(row['id'], [])
+    if 'following' in related:
+        following = _related_ids(User.following.through, 'from_user_id', 'to_user_id', ids)
+        for row in rows:
+            row['following'] = following.get(row['id'], [])
+    if drop_id:
+        for row in rows:
+            del row['id']
+    return rows
+
+
+async def auser_rows(queryset, fields=None):
+    related = [key for key in ('wishlist', 'following') if fields is None or key in fields]
+    if not related:
+        return await USER_MAPPER.subset(fields).arows(queryset)
+    drop_id = fields is not None and 'id' not in fields
+    rows = await USER_MAPPER.subset(None if fields is None else set(fields) | {'id'}).arows(queryset)
+    ids = [row['id'] for row in rows]
+    if 'wishlist' in related:
+        wishlist = await _arelated_ids(User.wishlist.through, 'user_id', 'product_id', ids)
+        for row in rows:
+            row['wishlist'] = wishlist.get(row['id'], [])
+    if 'following' in related:
+        following = await _arelated_ids(User.following.through, 'from_user_id', 'to_user_id', ids)
+        for row in rows:
+            row['following'] = following.get(row['id'], [])
+    if drop_id:
+        for row in rows:
+            del row['id']
+    return rows
+
+
+def message_rows(queryset, fields=None):
+    return MESSAGE_MAPPER.subset(fields).rows(queryset)
+
+
+def review_rows(queryset, fields=None):
+    return REVIEW_MAPPER.subset(fields).rows(queryset)
+
+
+async def aproduct_rows(queryset, fields=None):
+    return await PRODUCT_MAPPER.subset(fields).arows(queryset)
+
+
+async def amessage_rows(queryset, fields=None):
+    return await MESSAGE_MAPPER.subset(fields).arows(queryset)
+
+
+async def areview_rows(queryset, fields=None):
+    return await REVIEW_MAPPER.subset(fields).arows(queryset)
@@ -0,0 +1,73 @@
+# api/fieldsets.py
+"""
+稀疏字段集：商品、用户、评价、消息的 GET 接口支持以下查询参数，
+只返回需要的字段，同时只查询对应的列（列表用 values_list，详情用 only()），
+不需要的大字段（description、tags、wishlist/following 列表）不会从数据库取出。
+
+    ?fields=id,title,price    只返回列出的字段
+    ?omit=description,tags    返回除列出字段以外的全部字段
+    ?preset=card              使用预设字段组，可再用 fields 追加、omit 去掉
+
+预设 card 用于列表网格卡片：
+    商品  id, title, price, image, imageVariants, status
+    用户  id, username, avatar, avatarVariants, creditScore
+
+字段名使用接口输出的 camelCase 名称，未知的字段或预设返回 400。
+"""
+from rest_framework.exceptions import ValidationError
+
+from .fastpath import PRODUCT_MAPPER, USER_MAPPER, MESSAGE_MAPPER, REVIEW_MAPPER
+
+PRESETS = {
+    'product': {'card': ['id', 'title', 'price', 'image', 'imageVariants', 'status']},
+    'user': {'card': ['id', 'username', 'avatar', 'avatarVariants', 'creditScore']},
+    'review': {'card': ['id', 'buyerName', 'rating', 'createdAt']},
+    'message': {'card': ['id', 'senderId', 'receiverId', 'timestamp', 'is_read', 'type']},
+}
+
+MAPPERS = {
+    'product': PRODUCT_MAPPER,
+    'user': USER_MAPPER,
+    'review': REVIEW_MAPPER,
+    'message': MESSAGE_MAPPER,
+}
+
+
+def _split(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def select_fields(request, resource):
+    """
+    解析 fields / omit / preset 参数，返回按接口字段顺序排列的字段名列表；
+    未使用这些参数时返回 None，表示返回全部字段。
+    """
+    # DRF Request 用 query_params，异步视图（见 api/async_views.py）收到的是 Django HttpRequest
+    params = getattr(request, 'query_params', request.GET)
+    fields, omit, preset = params.get('fields'), params.get('omit'), params.get('preset')
+    if not (fields or omit or preset):
+        return None
+
+    available = MAPPERS[resource].keys
+    if preset:
+        if preset not in PRESETS[resource]:
+            raise ValidationError({'preset': f"Unknown preset '{preset}'."})
+        selected = set(PRESETS[resource][preset])
+    else:
+        selected = set() if fields else set(available)
+    for param, names in (('fields', fields), ('omit', omit)):
+        if not names:
+            continue
+        names = _split(names)
+        unknown = names - set(available)
+        if unknown:
+            raise ValidationError({param: f"Unknown field(s): {', '.join(sorted(unknown))}."})
+        selected = selected | names if param == 'fields' else selected - names
+    return [key for key in available if key in selected]
+
+
+def model_columns(resource, fields, required=()):
+    """字段名对应的模型列，用于 queryset.only()；跨表列和多对多字段不在其中"""
+    columns = [column for key, column, _ in MAPPERS[resource].fields
+               if key in fields and column and '__' not in column]
+    return list(dict.fromkeys([*required, *columns]))
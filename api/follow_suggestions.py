@@ -0,0 +1,199 @@
+# api/follow_suggestions.py
+"""
+推荐关注：由 manage.py build_follow_suggestions 批量计算，结果写入 api_followsuggestion，
+UserViewSet.suggestions 用一条按 (user, rank) 索引的查询读取。
+
+用户按 id 排序编号，关注关系和交易信号放进 SciPy 稀疏矩阵（CSR），分数用稀疏矩阵乘法整批计算：
+
+- 朋友的朋友：F 为关注矩阵（F[u, v] = 1 表示 u 关注 v），F @ F 的 (u, v) 是 u 关注的人中关注了 v 的人数。
+- 相似卖家：B[u, s] 为用户 u 与卖家 s 的互动（买过其商品 PURCHASE_WEIGHT，收藏过其商品 WISHLIST_WEIGHT，
+  热表和归档表都计入）。卖家之间按互动用户的余弦相似度比较（列归一化后的 Bᵀ B），每个卖家只保留最相似的
+  SIMILAR_SELLERS 个（含自身）。用户对卖家的分数为按行归一化的 B 乘以该相似度矩阵：
+  常买的卖家本身和与之相似的卖家得分高。
+- 总分 = FOLLOW_WEIGHT × 共同关注数 + SELLER_WEIGHT × 卖家分数；去掉自己、已关注和被封禁的用户后，
+  用一次 int64 排序向量化地取每行前 K 个。
+
+计算和写入都按 FOLLOW_SUGGESTION_BLOCK_SIZE 个用户分块，中间结果的内存由块大小而不是用户总数决定。
+每块在一个事务中删除该块用户的旧推荐再批量插入，读取方看到的总是完整的旧结果或新结果；
+计算之后才关注的人由读取时的查询排除。
+"""
+import time
+from array import array
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import User, Product, ArchivedProduct, FollowSuggestion
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # numpy / scipy 为可选依赖，只有推荐关注的批量计算需要
+    np = sparse = None
+
+FOLLOW_WEIGHT = 1.0  # 每个共同关注
+SELLER_WEIGHT = 3.0  # 卖家分数在 [0, 1] 之间
+PURCHASE_WEIGHT = 3.0
+WISHLIST_WEIGHT = 1.0
+SIMILAR_SELLERS = 50
+
+PRODUCT_MODELS = (Product, ArchivedProduct)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def require_scipy():
+    if sparse is None:
+        raise ImportError('Follow suggestions require numpy and scipy (pip install numpy scipy)')
+
+
+def _matrix(size, rows, cols, data):
+    matrix = sparse.csr_matrix((np.asarray(data, dtype=np.float32),
+                                (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32))),
+                               shape=(size, size))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def _inverse(values):
+    return np.divide(1.0, values, out=np.zeros_like(values), where=values > 0)
+
+
+class Graph:
+    """按用户编号对齐的输入：关注矩阵、互动矩阵和被封禁标记"""
+
+    def __init__(self, size, follows, interactions, banned):
+        self.size = size
+        follow_src, follow_dst = follows
+        self.follows = _matrix(size, follow_src, follow_dst, np.ones(len(follow_src), dtype=np.float32))
+        self.follows.data[:] = 1  # 重复的关注行只算一次
+        self.interactions = _matrix(size, *interactions)
+        self.banned = np.asarray(banned, dtype=bool)
+
+
+def _pairs(index, queryset):
+    """把 (用户 id, 用户 id) 行流式转换为两个编号数组，不在 index 中的行丢弃"""
+    rows, cols = array('i'), array('i')
+    for a, b in queryset.iterator(chunk_size=10000):
+        i, j = index.get(a), index.get(b)
+        if i is not None and j is not None:
+            rows.append(i)
+            cols.append(j)
+    return np.frombuffer(rows, dtype=np.int32), np.frombuffer(cols, dtype=np.int32)
+
+
+def load_graph():
+    """从数据库读取全部用户、关注关系和交易信号，返回 (按编号排列的用户 id, Graph)"""
+    require_scipy()
+    users = list(User.objects.order_by('id').values_list('id', 'is_banned'))
+    ids = [row[0] for row in users]
+    index = {user_id: i for i, user_id in enumerate(ids)}
+    banned = np.fromiter((row[1] for row in users), dtype=bool, count=len(users))
+    del users
+
+    follows = _pairs(index, User.following.through.objects.order_by().values_list('from_user_id', 'to_user_id'))
+    signals = [(_pairs(index, model.objects.filter(buyer__isnull=False).order_by()
+                       .values_list('buyer_id', 'seller_id')), PURCHASE_WEIGHT) for model in PRODUCT_MODELS]
+    signals.append((_pairs(index, User.wishlist.through.objects.order_by()
+                           .values_list('user_id', 'product__seller_id')), WISHLIST_WEIGHT))
+    interactions = (
+        np.concatenate([rows for (rows, _), _ in signals]),
+        np.concatenate([cols for (_, cols), _ in signals]),
+        np.concatenate([np.full(len(rows), weight, dtype=np.float32) for (rows, _), weight in signals]),
+    )
+    return ids, Graph(len(ids), follows, interactions, banned)
+
+
+def _top_k(matrix, k):
+    """每行最大的 k 个正值，返回 (行, 列, 值, 名次) 数组；同分按列号排序"""
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    rows = np.repeat(np.arange(matrix.shape[0], dtype=np.int32), np.diff(matrix.indptr))
+    # 非负 float32 的位模式按整数比较与按浮点比较顺序相同：行号放高 32 位、分数取反放低 32 位，
+    # 一次稳定的 int64 排序即按行分组、行内分数降序、同分保持列号顺序（比三个键的 lexsort 快约 10 倍）
+    key = (rows.astype(np.int64) << 32) | (0x7FFFFFFF - matrix.data.astype(np.float32).view(np.int32))
+    order = np.argsort(key, kind='stable')
+    # 行号是主键，排序后仍与 indptr 对齐，名次 = 位置 - 该行起点
+    rank = np.arange(len(order)) - matrix.indptr[rows]
+    keep = order[rank < k]
+    return rows[keep], matrix.indices[keep], matrix.data[keep], rank[rank < k]
+
+
+def similar_sellers(interactions, keep, block_size):
+    """卖家 × 卖家的余弦相似度（按互动用户），每行只保留最大的 keep 个"""
+    norms = np.sqrt(np.asarray(interactions.multiply(interactions).sum(axis=0)).ravel())
+    normalized = (interactions @ sparse.diags(_inverse(norms).astype(np.float32))).tocsr()
+    by_seller = normalized.T.tocsr()
+    size = interactions.shape[0]
+    parts = []
+    for start in range(0, size, block_size):
+        block = (by_seller[start:start + block_size] @ normalized).tocsr()
+        rows, cols, values, _ = _top_k(block, keep)
+        parts.append(sparse.csr_matrix((values, (rows, cols)), shape=block.shape))
+    return sparse.vstack(parts, format='csr')
+
+
+def compute(graph, k, block_size, similar=SIMILAR_SELLERS):
+    """
+    按块生成推荐：每块产出 (start, stop, 用户编号, 推荐用户编号, 名次, 分数, 共同关注数) 数组，
+    只包含未被封禁且有推荐的用户
+    """
+    require_scipy()
+    follows = graph.follows
+    similarity = similar_sellers(graph.interactions, similar, block_size)
+    profile = (sparse.diags(_inverse(np.asarray(graph.interactions.sum(axis=1)).ravel()))
+               @ graph.interactions).tocsr()
+    for start in range(0, graph.size, block_size):
+        stop = min(start + block_size, graph.size)
+        followed = follows[start:stop]
+        mutual = (followed @ follows).tocsr()
+        total = (mutual * FOLLOW_WEIGHT + (profile[start:stop] @ similarity) * SELLER_WEIGHT).tocsr()
+        # 去掉已关注的人（followed 为 0/1 矩阵）、自己和被封禁的用户
+        total = (total - total.multiply(followed)).tocsr()
+        rows = np.repeat(np.arange(stop - start, dtype=np.int32), np.diff(total.indptr))
+        total.data[(rows + start == total.indices) | graph.banned[total.indices]] = 0
+        rows, cols, scores, rank = _top_k(total, k)
+        keep = ~graph.banned[rows + start]
+        rows, cols, scores, rank = rows[keep], cols[keep], scores[keep], rank[keep]
+        counts = np.asarray(mutual[rows, cols]).ravel().astype(np.int64) if len(rows) else np.zeros(0, np.int64)
+        yield start, stop, rows + start, cols, rank, scores, counts
+
+
+def store(ids, start, stop, users, suggested, rank, scores, mutual):
+    """替换编号 [start, stop) 的用户的推荐"""
+    rows = []
+    for u, v, r, score, count in zip(users.tolist(), suggested.tolist(), rank.tolist(), scores.tolist(),
+                                     mutual.tolist()):
+        reason = 'follows' if count * FOLLOW_WEIGHT >= score - count * FOLLOW_WEIGHT else 'sellers'
+        rows.append(FollowSuggestion(user_id=ids[u], suggested_id=ids[v], rank=r, score=round(score, 4),
+                                     mutual_follows=count, reason=reason))
+    with transaction.atomic():
+        # ids 按数据库排序，块内的用户正好是这个 id 区间
+        FollowSuggestion.objects.filter(user_id__gte=ids[start], user_id__lte=ids[stop - 1]).delete()
+        FollowSuggestion.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def build(k=None, block_size=None):
+    """重新计算全部用户的推荐，返回 {'users', 'edges', 'suggestions', 'timings'}"""
+    require_scipy()
+    k = k or _setting('FOLLOW_SUGGESTION_COUNT', 20)
+    block_size = block_size or _setting('FOLLOW_SUGGESTION_BLOCK_SIZE', 20000)
+    timings = {}
+    start = time.perf_counter()
+    ids, graph = load_graph()
+    timings['load'] = time.perf_counter() - start
+    written = 0
+    compute_time = store_time = 0.0
+    mark = time.perf_counter()
+    for block in compute(graph, k, block_size):
+        now = time.perf_counter()
+        compute_time += now - mark
+        written += store(ids, *block)
+        mark = time.perf_counter()
+        store_time += mark - now
+    timings['compute'] = compute_time
+    timings['store'] = store_time
+    return {'users': graph.size, 'edges': int(graph.follows.nnz), 'suggestions': written, 'timings': timings}
@@ -0,0 +1,303 @@
+# api/identity.py
+"""
+请求级身份映射（identity map）：同一请求内按主键查找的行只查询一次，视图、序列化器和辅助函数
+拿到的是同一个实例。
+
+- 作用域：IdentityMapMiddleware 为每个请求打开一个映射（ContextVar，同步和异步请求都适用），
+  请求结束即丢弃，不跨请求共享。后台任务每批打开一个（见 api/jobs.py）。不在作用域中时 get()
+  等函数照常查询数据库，行为与直接使用 ORM 相同。
+- 查找：get(model, pk) / get_many() 先查映射，未命中的主键连同 prefetch() 登记过的主键合并为一条
+  IN 查询（dataloader 式批量载入）；不存在的主键也会记住。related(instance, name) 读取外键关联，
+  memo(key, loader) 记住非主键查询的结果（如 tasks.system_sender()）。
+  cached=True 时未命中先查对象缓存（api/objcache.py）：只读请求中取出的行放入映射，写请求中
+  只返回不放入，写请求里修改后保存的实例总是来自数据库。
+- 写入：save() / delete() 通过信号替换或删除映射中已有的行；绕过信号的 queryset.update()
+  之后需要调用 forget()。memo() 的结果不随写入失效。
+- 认证：JWTAuthentication 把当前用户放入映射，视图中再按主键取当前用户（如 toggle_follow 的
+  get_object、买家就是当前用户的 purchase）时不再查询。
+- 调试：IDENTITY_MAP_DEBUG 为 True 时响应带 X-Identity-Map 头（映射执行的查询数、避免的查询数、
+  仍然重复执行的 SELECT 数），明细写入 api.identity 日志，用来发现还没有经过映射的重复查找。
+"""
+import contextvars
+import logging
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+from rest_framework_simplejwt import authentication
+
+from . import metrics, objcache
+from .fastpath import IN_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+MISSING = object()  # 已确认不存在的主键
+
+_current = contextvars.ContextVar('identity_map', default=None)
+
+metrics.describe('unitrade_identity_map_lookups_total', 'counter',
+                 'Primary-key lookups through the request identity map, by model and result (hit / load).')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _key(model, pk):
+    return model._meta.concrete_model, str(pk)
+
+
+class IdentityMap:
+    def __init__(self, read_only=False):
+        self.read_only = read_only  # 只读请求：对象缓存中取出的行可以放入映射
+        self._rows = {}  # (模型, 主键字符串) -> 实例或 MISSING
+        self._pending = defaultdict(set)  # 模型 -> 已登记、尚未载入的主键
+        self._memo = {}
+        self.loads = 0  # 映射执行的查询数
+        self.avoided = Counter()  # 命中的 (模型名, 主键或 memo 键) -> 次数，即避免的查询
+
+    def peek(self, model, pk):
+        """映射中的实例；已确认不存在时返回 MISSING，未载入时返回 None"""
+        return self._rows.get(_key(model, pk))
+
+    def add(self, instance):
+        """放入实例；只载入了部分列的实例不放入，返回原实例"""
+        if instance is not None and instance.pk is not None and not instance.get_deferred_fields():
+            self._rows[_key(type(instance), instance.pk)] = instance
+        return instance
+
+    def forget(self, model, pks):
+        for pk in pks:
+            self._rows.pop(_key(model, pk), None)
+
+    def prefetch(self, model, pks):
+        """登记稍后要用的主键，下次载入该模型时一并查询"""
+        model = model._meta.concrete_model
+        pending = self._pending[model]
+        for pk in pks:
+            if pk is not None and (model, str(pk)) not in self._rows:
+                pending.add(str(pk))
+
+    def get_many(self, model, pks, cached=False):
+        """返回 {主键字符串: 实例}，不存在的主键不在结果中"""
+        model = model._meta.concrete_model
+        label = model._meta.model_name
+        wanted = list(dict.fromkeys(str(pk) for pk in pks if pk is not None))
+        found, missing = {}, []
+        for pk in wanted:
+            value = self._rows.get((model, pk))
+            if value is None:
+                missing.append(pk)
+                continue
+            self.avoided[label, pk] += 1
+            if value is not MISSING:
+                found[pk] = value
+        if len(wanted) > len(missing):
+            metrics.inc('unitrade_identity_map_lookups_total', (('model', label), ('result', 'hit')),
+                        len(wanted) - len(missing))
+        if not missing:
+            return found
+        metrics.inc('unitrade_identity_map_lookups_total', (('model', label), ('result', 'load')), len(missing))
+
+        if cached and objcache.enabled() and model in objcache.LABELS:
+            for pk in missing:
+                value = objcache.get(model, pk)
+                if value is not None:
+                    found[pk] = value
+                    if self.read_only:
+                        self._rows[model, pk] = value
+            return found
+
+        pending = self._pending.pop(model, set())
+        load = sorted(pk for pk in pending.union(missing) if (model, pk) not in self._rows)
+        for start in range(0, len(load), IN_BATCH_SIZE):
+            chunk = load[start:start + IN_BATCH_SIZE]
+            self.loads += 1
+            for instance in model._default_manager.filter(pk__in=chunk):
+                self._rows[model, str(instance.pk)] = instance
+            for pk in chunk:
+                self._rows.setdefault((model, pk), MISSING)
+        for pk in missing:
+            value = self._rows[model, pk]
+            if value is not MISSING:
+                found[pk] = value
+        return found
+
+    def memo(self, key, loader):
+        if key in self._memo:
+            self.avoided['memo', key] += 1
+            return self._memo[key]
+        value = self._memo[key] = loader()
+        return value
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def scope(read_only=False):
+    """在请求之外（后台任务、测试）打开一个映射"""
+    token = _current.set(IdentityMap(read_only))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def _map():
+    # 不在作用域中时用一次性的映射，行为等同于直接查询
+    return _current.get() or IdentityMap()
+
+
+def get(model, pk, cached=False):
+    """按主键取实例，不存在时返回 None"""
+    if pk is None:
+        return None
+    return _map().get_many(model, [pk], cached).get(str(pk))
+
+
+def get_or_404(model, pk, cached=False):
+    instance = get(model, pk, cached)
+    if instance is None:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+    return instance
+
+
+def get_many(model, pks, cached=False):
+    return _map().get_many(model, pks, cached)
+
+
+def prefetch(model, pks):
+    identity = _current.get()
+    if identity is not None:
+        identity.prefetch(model, pks)
+
+
+def peek(model, pk):
+    identity = _current.get()
+    return identity.peek(model, pk) if identity is not None else None
+
+
+def add(instance):
+    identity = _current.get()
+    return identity.add(instance) if identity is not None else instance
+
+
+def forget(model, pks):
+    identity = _current.get()
+    if identity is not None:
+        identity.forget(model, pks)
+
+
+def memo(key, loader):
+    identity = _current.get()
+    return identity.memo(key, loader) if identity is not None else loader()
+
+
+def related(instance, name, cached=False):
+    """读取外键关联；已加载时直接返回，否则经过映射"""
+    field = instance._meta.get_field(name)
+    if field.is_cached(instance):
+        return getattr(instance, name)
+    value = get(field.related_model, getattr(instance, field.attname), cached)
+    if value is None:
+        return getattr(instance, name)  # 不存在或为空时与直接访问属性的行为一致
+    field.set_cached_value(instance, value)
+    return value
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """与 simplejwt 相同，认证得到的用户放入身份映射"""
+
+    def get_user(self, validated_token):
+        return add(super().get_user(validated_token))
+
+
+@receiver(post_save, dispatch_uid='identity_row_saved')
+def _row_saved(sender, instance, **kwargs):
+    # 只替换映射中已有的行（包括记为不存在、随后新建的主键）
+    identity = _current.get()
+    if identity is not None and identity.peek(sender, instance.pk) is not None:
+        identity.forget(sender, [instance.pk])
+        identity.add(instance)
+
+
+@receiver(post_delete, dispatch_uid='identity_row_deleted')
+def _row_deleted(sender, instance, **kwargs):
+    identity = _current.get()
+    if identity is not None and identity.peek(sender, instance.pk) is not None:
+        identity._rows[_key(sender, instance.pk)] = MISSING
+
+
+class DuplicateQueryRecorder:
+    """调试用 execute_wrapper：统计语句和参数都相同的 SELECT"""
+
+    def __init__(self):
+        self.queries = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            self.queries[sql, repr(params)] += 1
+        return execute(sql, params, many, context)
+
+    def duplicates(self):
+        return {query: count - 1 for query, count in self.queries.items() if count > 1}
+
+
+class IdentityMapMiddleware:
+    """为每个请求打开一个身份映射；IDENTITY_MAP_DEBUG 时报告避免的和仍然重复的查询"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.debug = _setting('IDENTITY_MAP_DEBUG', False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = DuplicateQueryRecorder() if self.debug else None
+        with ExitStack() as stack:
+            identity = stack.enter_context(scope(request.method in SAFE_METHODS))
+            if recorder is not None:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+        return self._report(request, response, identity, recorder)
+
+    async def __acall__(self, request):
+        # ContextVar 随 sync_to_async 复制到执行 ORM 的线程，线程中使用的是同一个映射
+        recorder = DuplicateQueryRecorder() if self.debug else None
+        with ExitStack() as stack:
+            identity = stack.enter_context(scope(request.method in SAFE_METHODS))
+            if recorder is not None:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(recorder))
+            response = await self.get_response(request)
+        return self._report(request, response, identity, recorder)
+
+    @staticmethod
+    def _report(request, response, identity, recorder):
+        if recorder is None:
+            return response
+        duplicates = recorder.duplicates()
+        avoided = sum(identity.avoided.values())
+        response['X-Identity-Map'] = (f'loads={identity.loads}; avoided={avoided}; '
+                                      f'duplicates={sum(duplicates.values())}')
+        if avoided or duplicates:
+            logger.info(
+                'Identity map %s %s: %d queries avoided (%s); %d duplicate SELECTs still executed%s',
+                request.method, request.path, avoided,
+                ', '.join(f'{label}:{pk} x{count}' for (label, pk), count in identity.avoided.most_common()),
+                sum(duplicates.values()),
+                ''.join(f'\n  x{count + 1}: {sql} {params}' for (sql, params), count in duplicates.items()))
+        return response
@@ -0,0 +1,142 @@
+# api/ids.py
+"""
+时间有序的主键生成。
+
+原来的 ``'u' + uuid4().hex[:8]`` 只有 32 位随机数：InnoDB 的聚簇索引按主键排序，
+随机主键让插入散落在整棵 B+ 树上，频繁页分裂；几万行后生日碰撞的概率也不可忽略。
+
+新格式为前缀 + 16 位小写 Crockford base32（80 位）：
+
+    48 位毫秒时间戳 | 20 位进程节点号 | 12 位毫秒内序号
+
+- 字符表按 ASCII 递增，字符串顺序即数值顺序，新行总是追加在索引末尾；
+- 同一进程内严格单调：时钟回拨时沿用上一毫秒，序号用尽时借用下一毫秒；
+- 节点号在进程启动和 fork 后随机选取，不同进程同一毫秒碰撞需要节点号相同（约 1/100 万）
+  且序号相同；万一碰撞，插入时主键冲突再换一个 id 重试（见 GeneratedIdMixin）。
+- 模型的主键默认值只生成 id，不查询数据库：构造实例（表单、admin 的添加页、序列化器、
+  异步上下文）没有额外开销。批量创建用 unique_ids 一次确认。
+
+ID_SCHEME = 'legacy' 时继续生成旧格式；无论哪种方式，已有的 id 都保持不变。
+"""
+import os
+import secrets
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+
+ALPHABET = '0123456789abcdefghjkmnpqrstvwxyz'
+NODE_BITS = 20
+SEQUENCE_BITS = 12
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+ENCODED_LENGTH = 16  # 80 位 / 每字符 5 位
+
+
+def encode(value, length=ENCODED_LENGTH):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode_timestamp(id_value):
+    """从新格式 id 取出毫秒时间戳；旧格式返回 None"""
+    body = id_value[1:]
+    if len(body) != ENCODED_LENGTH or any(c not in ALPHABET for c in body):
+        return None
+    value = 0
+    for c in body:
+        value = value * 32 + ALPHABET.index(c)
+    return value >> (NODE_BITS + SEQUENCE_BITS)
+
+
+class TimeOrderedIds:
+    """线程安全的单调 id 生成器，每个进程一个实例"""
+
+    def __init__(self):
+        self.reseed()
+
+    def reseed(self):
+        # fork 出的子进程会继承父进程的状态，必须换一个节点号
+        self._lock = threading.Lock()
+        self.node = secrets.randbits(NODE_BITS)
+        self.last_ms = 0
+        self.sequence = 0
+
+    def next(self, prefix):
+        with self._lock:
+            now = time.time_ns() // 1_000_000
+            if now > self.last_ms:
+                self.last_ms = now
+                self.sequence = 0
+            else:
+                # 同一毫秒或时钟回拨：继续递增序号，用尽后借用下一毫秒
+                self.sequence = (self.sequence + 1) & SEQUENCE_MASK
+                if self.sequence == 0:
+                    self.last_ms += 1
+            value = (self.last_ms << (NODE_BITS + SEQUENCE_BITS)) | (self.node << SEQUENCE_BITS) | self.sequence
+        return prefix + encode(value)
+
+
+_generator = TimeOrderedIds()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_generator.reseed)
+
+
+def legacy_id(prefix):
+    return prefix + uuid.uuid4().hex[:8]
+
+
+def new_id(prefix):
+    if getattr(settings, 'ID_SCHEME', 'time') == 'legacy':
+        return legacy_id(prefix)
+    return _generator.next(prefix)
+
+
+def unique_ids(model, prefix, count, attempts=5):
+    """批量生成 count 个 id，每 900 个用一条 IN 查询确认不存在（批量创建时在插入前确认）"""
+    result = []
+    for _ in range(attempts):
+        candidates = [new_id(prefix) for _ in range(count - len(result))]
+        taken = set()
+        for start in range(0, len(candidates), 900):
+            taken.update(model._default_manager.filter(pk__in=candidates[start:start + 900])
+                         .values_list('pk', flat=True))
+        result.extend(candidate for candidate in candidates if candidate not in taken)
+        if len(result) == count:
+            return result
+    raise RuntimeError(f'Could not generate {count} unique {model.__name__} ids after {attempts} attempts')
+
+
+class GeneratedIdMixin:
+    """
+    主键由默认值生成的新实例，插入时主键冲突则换一个 id 重试（最多 ID_INSERT_ATTEMPTS 次）；
+    调用方自己给出的主键冲突照常抛出 IntegrityError。模型需定义 ID_PREFIX。
+    """
+    ID_INSERT_ATTEMPTS = 5
+
+    def __init__(self, *args, **kwargs):
+        # 从数据库载入（from_db）和按位置传参时不算生成的主键
+        self._generated_id = not args and 'pk' not in kwargs and self._meta.pk.attname not in kwargs
+        super().__init__(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        if not (self._generated_id and self._state.adding):
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        for attempt in range(self.ID_INSERT_ATTEMPTS):
+            try:
+                # 保存点：冲突只回滚这一次插入，不影响调用方的事务
+                with transaction.atomic(using=using):
+                    super().save(*args, **kwargs)
+            except IntegrityError:
+                if (attempt == self.ID_INSERT_ATTEMPTS - 1
+                        or not type(self)._default_manager.using(using).filter(pk=self.pk).exists()):
+                    raise  # 不是主键冲突（如用户名重复）
+                self.pk = new_id(self.ID_PREFIX)
+            else:
+                self._generated_id = False
+                return
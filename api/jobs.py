@@ -0,0 +1,196 @@
+# api/jobs.py
+"""
+数据库后台任务队列：不依赖外部 broker，任务就是 api_job 表中的一行。
+
+- enqueue() 在调用方的事务中插入任务，业务写入回滚时任务也不会出现；
+  带 idempotency_key 的任务重复入队会被忽略。
+- worker（manage.py run_jobs）每次批量取走最多 JOB_BATCH_SIZE 个到期任务：
+  支持时用 SELECT ... FOR UPDATE SKIP LOCKED，再以批次号做条件更新认领，
+  多个 worker 并发也不会重复执行。
+- 成功的任务与处理函数的写入在同一个事务中标记为 DONE；失败的任务按指数退避（带抖动）重试，
+  超过 max_attempts 后标记为 FAILED。结果只写回仍由本批次认领的任务。
+- worker 崩溃遗留的 RUNNING 任务在 JOB_LOCK_TIMEOUT 秒后重新入队；原批次之后若仍执行到它，
+  写回时发现认领已失效，处理函数的写入回滚，不会重复发送消息。
+- 同一批任务共用一个身份映射（api/identity.py），如系统消息的发送者每批只查询一次。
+
+任务处理函数用 @register('kind') 注册在 api/tasks.py 中，接收 payload dict。
+"""
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import identity, metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# 任务排队时间和执行时间的直方图桶（秒）
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0)
+
+metrics.describe('unitrade_jobs_enqueued_total', 'counter', 'Background jobs enqueued, by kind.')
+metrics.describe('unitrade_jobs_finished_total', 'counter', 'Background job attempts, by kind and result.')
+metrics.describe('unitrade_job_duration_seconds', 'histogram', 'Background job execution time.')
+metrics.describe('unitrade_job_queue_delay_seconds', 'histogram', 'Time from a job becoming due to being picked up.')
+metrics.describe('unitrade_jobs_pending', 'gauge', 'Jobs waiting in the queue, by kind.')
+
+_handlers = {}
+
+
+def register(kind):
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def get_handler(kind):
+    if not _handlers:
+        from . import tasks  # noqa: F401  注册任务处理函数
+    return _handlers.get(kind)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(kind, payload, key=None, delay=0, max_attempts=None):
+    """插入一个任务；key 已存在时忽略。返回是否真正入队"""
+    job = Job(
+        kind=kind, payload=payload, idempotency_key=key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or _setting('JOB_MAX_ATTEMPTS', 5),
+    )
+    if key is None:
+        job.save(force_insert=True)
+    else:
+        try:
+            # 保存点：唯一键冲突只回滚这一次插入，不影响调用方的事务
+            with transaction.atomic():
+                job.save(force_insert=True)
+        except IntegrityError:
+            return False
+    metrics.inc('unitrade_jobs_enqueued_total', (('kind', kind),))
+    return True
+
+
+def backoff(attempts):
+    """第 n 次失败后的等待秒数：base * 2^(n-1)，上限 JOB_BACKOFF_MAX，带 ±25% 抖动"""
+    base = _setting('JOB_BACKOFF_BASE', 2)
+    delay = min(base * 2 ** (attempts - 1), _setting('JOB_BACKOFF_MAX', 600))
+    return delay * random.uniform(0.75, 1.25)
+
+
+def dequeue(batch_size, kinds=None):
+    """认领最多 batch_size 个到期任务，返回 Job 列表（状态已为 RUNNING）"""
+    now = timezone.now()
+    claim = uuid.uuid4().hex
+    with transaction.atomic():
+        due = Job.objects.filter(status='PENDING', run_at__lte=now)
+        if kinds:
+            due = due.filter(kind__in=kinds)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.order_by('run_at', 'id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        # 条件更新：不支持 SKIP LOCKED 的数据库上，被其他 worker 抢先认领的行不会再被更新
+        Job.objects.filter(id__in=ids, status='PENDING').update(status='RUNNING', claim=claim, locked_at=now)
+    return list(Job.objects.filter(claim=claim, status='RUNNING').order_by('run_at', 'id'))
+
+
+class ClaimLost(Exception):
+    """任务已不属于这个批次（超过 JOB_LOCK_TIMEOUT 被重新入队），处理函数的写入回滚"""
+
+
+def _finish(job, **fields):
+    # 只更新仍由本批次认领、处于 RUNNING 的任务；被 requeue_stale 放回队列的任务不再改写
+    return Job.objects.filter(pk=job.pk, claim=job.claim, status='RUNNING').update(**fields)
+
+
+def execute(jobs):
+    """
+    执行一批任务。成功的任务在处理函数的同一个事务中标记为 DONE，worker 在批次中途崩溃时
+    已提交的任务不会被 requeue_stale 重新执行；认领已失效的任务回滚，不计入结果。
+    """
+    done = retry = failed = 0
+    with identity.scope():
+        for job in jobs:
+            handler = get_handler(job.kind)
+            started = timezone.now()
+            metrics.observe('unitrade_job_queue_delay_seconds', max((started - job.run_at).total_seconds(), 0),
+                            (('kind', job.kind),), JOB_BUCKETS)
+            start = time.perf_counter()
+            try:
+                if handler is None:
+                    raise LookupError(f'No handler registered for job kind {job.kind!r}')
+                # 每个任务单独一个事务，失败时不会留下部分写入
+                with transaction.atomic():
+                    handler(job.payload)
+                    if not _finish(job, status='DONE', finished_at=timezone.now(), attempts=F('attempts') + 1):
+                        raise ClaimLost
+            except ClaimLost:
+                logger.warning('Job %s (%s) was requeued while running; rolled back', job.pk, job.kind)
+                continue
+            except Exception as exc:
+                job.attempts += 1
+                job.last_error = f'{type(exc).__name__}: {exc}'
+                logger.warning('Job %s (%s) attempt %d failed: %s', job.pk, job.kind, job.attempts, job.last_error)
+                now = timezone.now()
+                if job.attempts >= job.max_attempts or handler is None:
+                    result = 'failed'
+                    finished = _finish(job, status='FAILED', attempts=job.attempts, last_error=job.last_error,
+                                       finished_at=now)
+                else:
+                    result = 'retry'
+                    finished = _finish(job, status='PENDING', attempts=job.attempts, last_error=job.last_error,
+                                       claim='', locked_at=None, run_at=now + timedelta(seconds=backoff(job.attempts)))
+                if not finished:
+                    continue
+                if result == 'failed':
+                    failed += 1
+                else:
+                    retry += 1
+            else:
+                done += 1
+                result = 'done'
+            metrics.observe('unitrade_job_duration_seconds', time.perf_counter() - start,
+                            (('kind', job.kind),), JOB_BUCKETS)
+            metrics.inc('unitrade_jobs_finished_total', (('kind', job.kind), ('result', result)))
+    return done, retry, failed
+
+
+def requeue_stale():
+    """把锁定超过 JOB_LOCK_TIMEOUT 秒仍未完成的任务（worker 已崩溃）放回队列"""
+    cutoff = timezone.now() - timedelta(seconds=_setting('JOB_LOCK_TIMEOUT', 300))
+    return Job.objects.filter(status='RUNNING', locked_at__lt=cutoff).update(status='PENDING', claim='', locked_at=None)
+
+
+def purge_finished():
+    """删除 JOB_RETENTION_DAYS 天前完成的任务；FAILED 的任务保留供排查"""
+    cutoff = timezone.now() - timedelta(days=_setting('JOB_RETENTION_DAYS', 7))
+    deleted, _ = Job.objects.filter(status='DONE', finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_pending(batch_size=None, kinds=None):
+    """在当前线程中执行完所有到期任务（测试和 run_jobs --once 使用），返回 (done, retry, failed)"""
+    totals = [0, 0, 0]
+    while True:
+        jobs = dequeue(batch_size or _setting('JOB_BATCH_SIZE', 50), kinds)
+        if not jobs:
+            return tuple(totals)
+        for i, count in enumerate(execute(jobs)):
+            totals[i] += count
+
+
+@metrics.register_collector
+def _queue_depth():
+    rows = Job.objects.filter(status='PENDING').values('kind').annotate(n=Count('id')).order_by()
+    return [('unitrade_jobs_pending', (('kind', row['kind']),), row['n']) for row in rows]
@@ -0,0 +1,118 @@
+# api/listings.py
+"""
+批量发布商品：POST /api/products/bulk/，请求体为 JSON 数组，或上传 CSV 文件（字段 file）。
+
+- 所有行用 ProductSerializer(many=True) 校验，错误按行号返回；默认任何一行有错都不创建，
+  带 ?partial=true 时只创建通过校验的行。
+- 近似重复（见 api/duplicates.py）：与卖家在售商品或同批前面的行重复的行，'reject' 模式下作为该行的错误，
+  'flag' 模式下照常创建并记录。
+- 主键用 ids.unique_ids 一次生成（一条存在性查询），在一个事务中分块 bulk_create。
+- bulk_create 不发 post_save 信号，派生数据按批同步：输入联想索引（api/suggest.py）在提交后
+  一次写入增量层；保存的搜索（api/saved_searches.py）合并为一个匹配任务，每个用户只收到一条消息。
+  对象缓存（api/objcache.py）不缓存不存在的主键，新建的行无需失效。
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.db import transaction
+
+from . import duplicates, ids, suggest, tasks
+from .models import Product
+from .serializers import ProductSerializer
+
+# CSV 的列；tags 列中多个标签用分号分隔
+CSV_COLUMNS = ('title', 'price', 'description', 'category', 'image', 'tags')
+CSV_REQUIRED_COLUMNS = {'title', 'price', 'category', 'image'}
+TAG_SEPARATOR = ';'
+
+
+class BulkRejected(Exception):
+    """整个请求无法处理（格式错误、行数超限），与逐行的校验错误不同"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def read_csv(uploaded_file):
+    """把上传的 CSV 转为与 JSON 请求相同的行 dict 列表"""
+    if uploaded_file.size > _setting('PRODUCT_BULK_MAX_CSV_BYTES', 2 * 1024 * 1024):
+        raise BulkRejected('CSV file is too large')
+    try:
+        # utf-8-sig：兼容 Excel 导出的带 BOM 的文件
+        text = uploaded_file.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise BulkRejected('CSV file must be UTF-8 encoded')
+    reader = csv.DictReader(io.StringIO(text))
+    missing = CSV_REQUIRED_COLUMNS - set(reader.fieldnames or ())
+    if missing:
+        raise BulkRejected(f"CSV is missing columns: {', '.join(sorted(missing))}")
+    rows = []
+    for record in reader:
+        row = {column: (record.get(column) or '').strip() for column in CSV_COLUMNS if column in record}
+        row['tags'] = [tag.strip() for tag in row.get('tags', '').split(TAG_SEPARATOR) if tag.strip()]
+        rows.append(row)
+    return rows
+
+
+def validate(rows, seller, partial=False):
+    """
+    返回 (通过校验的行, 错误列表)。通过的行为 (数据, duplicates.Screened)；
+    错误为 {'row': 从 1 开始的行号, 'errors': {...}}
+    """
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise BulkRejected('Expected a list of products')
+    if not rows:
+        raise BulkRejected('No products to create')
+    limit = _setting('PRODUCT_BULK_MAX_ROWS', 500)
+    if len(rows) > limit:
+        raise BulkRejected(f'At most {limit} products per request')
+    serializer = ProductSerializer(data=rows, many=True)
+    if serializer.is_valid():
+        numbered, errors = list(enumerate(serializer.validated_data, 1)), []
+    else:
+        # 较新的 DRF 以 {下标: 错误} 的形式返回，旧版本为与 rows 等长的列表
+        row_errors = serializer.errors
+        if not isinstance(row_errors, dict):
+            row_errors = dict(enumerate(row_errors))
+        errors = [{'row': i + 1, 'errors': row_errors[i]} for i in sorted(row_errors) if row_errors[i]]
+        if not partial or len(errors) == len(rows):
+            return [], errors
+        numbers = [i + 1 for i in range(len(rows)) if not row_errors.get(i)]
+        serializer = ProductSerializer(data=[rows[number - 1] for number in numbers], many=True)
+        serializer.is_valid(raise_exception=True)
+        numbered = list(zip(numbers, serializer.validated_data))
+
+    # 与卖家的在售商品和同批前面的行近似重复的行（见 api/duplicates.py）
+    screened = duplicates.screen(seller.pk, [(data.get('title', ''), data.get('description', ''))
+                                             for _, data in numbered])
+    reject = duplicates.action() == 'reject'
+    valid = []
+    for (number, data), match in zip(numbered, screened):
+        if reject and (match.duplicate_of or match.same_as is not None):
+            target = match.duplicate_of or f'row {numbered[match.same_as][0]}'
+            errors.append({'row': number, 'errors': {'duplicateOf': [f'Near-duplicate of {target}']}})
+        else:
+            valid.append((data, match))
+    errors.sort(key=lambda error: error['row'])
+    if errors and not partial:
+        return [], errors
+    return valid, errors
+
+
+def create(seller, valid_rows):
+    """在一个事务中创建商品并同步派生数据，返回新商品的 id 列表"""
+    product_ids = ids.unique_ids(Product, 'p', len(valid_rows))
+    products = []
+    for pk, (data, _) in zip(product_ids, valid_rows):
+        # 批量发布的都是新的在售商品，忽略行中的 status / buyerId
+        fields = {key: value for key, value in data.items() if key not in ('status', 'buyer')}
+        products.append(Product(id=pk, seller=seller, status='ACTIVE', **fields))
+    with transaction.atomic():
+        Product.objects.bulk_create(products, batch_size=_setting('PRODUCT_BULK_BATCH_SIZE', 200))
+        duplicates.record(products, [match for _, match in valid_rows])
+        tasks.match_saved_searches_many(product_ids)
+        changes = [(product.pk, product.title, 0, True) for product in products]
+        transaction.on_commit(lambda: suggest.index.apply_many(changes))
+    return product_ids
@@ -0,0 +1,52 @@
+# api/management/commands/archive_data.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import archive
+
+TABLES = ('products', 'messages')
+
+
+class Command(BaseCommand):
+    help = 'Move finished products and old messages into the archive tables in resumable batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append', choices=TABLES, help='Repeatable; default: both')
+        parser.add_argument('--products-days', type=int, default=None,
+                            help='Archive RECEIVED/BANNED products unchanged for this many days '
+                                 '(ARCHIVE_PRODUCTS_AFTER_DAYS)')
+        parser.add_argument('--messages-days', type=int, default=None,
+                            help='Archive messages older than this many days (ARCHIVE_MESSAGES_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per transaction (ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches, to limit lock time and replication lag')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be moved')
+
+    def handle(self, *args, **options):
+        for table in options['table'] or TABLES:
+            if table == 'products':
+                days = options['products_days']
+                eligible, batches = archive.archivable_products(days), archive.archive_products
+            else:
+                days = options['messages_days']
+                eligible, batches = archive.archivable_messages(days), archive.archive_messages
+            if options['dry_run']:
+                self.stdout.write(f'{table}: {eligible.count()} rows would be archived')
+                continue
+            moved, elapsed = archive.run(self.throttled(batches(days, options['batch_size']), options['sleep']),
+                                         progress=lambda moved, elapsed: self.progress(table, moved, elapsed))
+            if moved:
+                self.stderr.write('')  # 结束进度行
+            rate = moved / elapsed if elapsed else 0
+            self.stdout.write(f'{table}: archived {moved} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)')
+
+    @staticmethod
+    def throttled(batches, seconds):
+        for count in batches:
+            yield count
+            if seconds:
+                time.sleep(seconds)
+
+    def progress(self, table, moved, elapsed):
+        self.stderr.write(f'\r{table}: {moved} rows, {moved / elapsed if elapsed else 0:,.0f} rows/s', ending='')
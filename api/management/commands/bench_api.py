@@ -0,0 +1,51 @@
+# api/management/commands/bench_api.py
+from django.core.management.base import BaseCommand, CommandError
+
+from api import bench
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every public API endpoint (latency percentiles + SQL query counts) against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=bench.DEFAULT_DATASET['users'])
+        parser.add_argument('--products', type=int, default=bench.DEFAULT_DATASET['products'])
+        parser.add_argument('--seed', type=int, default=bench.DEFAULT_DATASET['seed'])
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Only run the named scenario(s)')
+        parser.add_argument('--baseline', default=str(bench.BASELINE_PATH))
+        parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--latency-tolerance', type=float, default=1.5,
+                            help='Fail when p95/p99 exceed baseline * tolerance (0 disables latency checks)')
+
+    def handle(self, *args, **options):
+        dataset = {'users': options['users'], 'products': options['products'], 'seed': options['seed']}
+
+        with bench.test_database():
+            self.stdout.write(f"Seeding {dataset['users']} users / {dataset['products']} products...")
+            bench.seed_dataset(**dataset)
+            results = bench.run_scenarios(options['iterations'], names=options['scenarios'])
+
+        self.stdout.write(f"{'scenario':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'status':>8}")
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<22}{r['p50']:>9.2f}{r['p95']:>9.2f}{r['p99']:>9.2f}{r['queries']:>9}{r['status']:>8}")
+
+        if options['update_baseline']:
+            bench.save_baseline(results, dataset, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        baseline = bench.load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(self.style.WARNING('No baseline file found, run with --update-baseline first.'))
+            return
+        if baseline.get('dataset') != dataset:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with dataset {baseline.get('dataset')}, budgets may not apply."))
+
+        tolerance = options['latency_tolerance'] or None
+        violations = bench.compare(results, baseline, latency_tolerance=tolerance)
+        if violations:
+            raise CommandError('Performance budget exceeded:\n  ' + '\n  '.join(violations))
+        self.stdout.write(self.style.SUCCESS('All scenarios within budget.'))
@@ -0,0 +1,141 @@
+# api/management/commands/bench_asgi.py
+import asyncio
+import logging
+import threading
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from api import bench
+from api.bench import percentile
+
+# 场景名 -> 路径模板（同步版本）；异步版本在 /api/ 后加 async/
+ENDPOINTS = {
+    'products_list': '/api/products/?hideSold=true',
+    'profile_data': '/api/users/{seller}/profile_data/',
+    'reviews': '/api/reviews/?sellerId={seller}',
+    'messages': '/api/messages/?userId={seller}',
+}
+
+
+class SimulatedLatency:
+    """execute_wrapper：每条 SQL 额外等待固定时间，模拟数据库在网络另一端"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+
+async def asgi_get(app, path, headers):
+    """在进程内直接调用 ASGI 应用，返回 (状态码, 响应字节数)"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), *headers],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    disconnected = asyncio.Event()
+    sent_request = False
+    status, size = None, 0
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django 在响应期间监听断开连接；保持连接直到响应结束
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status, size
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            size += len(message.get('body', b''))
+
+    await app(scope, receive, send)
+    disconnected.set()
+    return status, size
+
+
+async def load(app, path, headers, requests, concurrency):
+    latencies, statuses = [], {}
+    peak_threads = threading.active_count()
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, peak_threads
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status, _ = await asgi_get(app, path, headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            peak_threads = max(peak_threads, threading.active_count())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies, statuses, peak_threads
+
+
+class Command(BaseCommand):
+    help = 'ASGI load benchmark: throughput and tail latency of the sync DRF views vs the /api/async/ views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and mode')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--db-latency-ms', type=float, default=2.0,
+                            help='Added to every SQL statement to simulate a networked database; 0 disables')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), help='Repeatable')
+
+    def handle(self, *args, **options):
+        names = options['endpoint'] or list(ENDPOINTS)
+        with bench.test_database():
+            self.stdout.write('Seeding dataset...')
+            bench.seed_dataset(options['users'], options['products'], options['seed'])
+            ctx = bench.BenchContext(Client())
+            seller = ctx.power_seller
+            headers = [(b'authorization', ctx.buyer_auth['HTTP_AUTHORIZATION'].encode())]
+
+            if options['db_latency_ms']:
+                wrapper = SimulatedLatency(options['db_latency_ms'] / 1000)
+                # 每个线程 / 异步上下文都有自己的连接对象，新建的连接也要挂上 wrapper
+                connection.execute_wrappers.append(wrapper)
+                connection_created.connect(
+                    lambda sender, connection, **kwargs: connection.execute_wrappers.append(wrapper),
+                    weak=False, dispatch_uid='bench_asgi_latency')
+
+            # 模拟延迟下几乎每个请求都会触发慢请求日志，基准期间关闭
+            logging.getLogger('api.performance').setLevel(logging.ERROR)
+            app = get_asgi_application()
+            self.stdout.write(
+                f"{options['requests']} requests per endpoint, concurrency {options['concurrency']}, "
+                f"+{options['db_latency_ms']}ms per SQL statement")
+            self.stdout.write(
+                f"{'endpoint':<16}{'mode':<7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'threads':>9}  status")
+            for name in names:
+                sync_path = ENDPOINTS[name].format(seller=seller)
+                async_path = sync_path.replace('/api/', '/api/async/', 1)
+                for mode, path in (('sync', sync_path), ('async', async_path)):
+                    # 预热：建立连接、编译映射函数
+                    asyncio.run(load(app, path, headers, options['concurrency'], options['concurrency']))
+                    elapsed, latencies, statuses, threads = asyncio.run(
+                        load(app, path, headers, options['requests'], options['concurrency']))
+                    self.stdout.write(
+                        f"{name:<16}{mode:<7}{len(latencies) / elapsed:>9.1f}"
+                        f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}"
+                        f"{percentile(latencies, 99):>9.1f}{threads:>9}  {statuses}")
+            connection_created.disconnect(dispatch_uid='bench_asgi_latency')
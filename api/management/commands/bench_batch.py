@@ -0,0 +1,100 @@
+# api/management/commands/bench_batch.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api import bench
+
+
+def launch_calls(user_id, seller_id, refresh):
+    """打开应用时的请求：(方法, 路径, 请求体)"""
+    return [
+        ('POST', '/api/auth/refresh/', {'refresh': refresh}),
+        ('GET', f'/api/users/{user_id}/profile_data/', None),
+        ('GET', f'/api/messages/?userId={user_id}', None),
+        ('GET', f'/api/reviews/?sellerId={seller_id}', None),
+        ('GET', '/api/products/', None),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compare app-launch latency of sequential API calls with one /api/batch/ request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--rtt-ms', type=float, default=50.0, help='Client round-trip time added per request')
+        parser.add_argument('--db-latency-ms', type=float, default=0.5,
+                            help='Simulated network latency per SQL query (SQLite runs in process)')
+
+    def handle(self, *args, **options):
+        delay = options['db_latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def install(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        with bench.test_database(), override_settings(THROTTLE_ENABLED=False):
+            bench.seed_dataset(**bench.DEFAULT_DATASET)
+            client = Client()
+            ctx = bench.BenchContext(client)
+            tokens = client.post('/api/auth/login/', {'username': ctx.buyer.username,
+                                                      'password': bench.PASSWORD}).json()
+            auth = {'HTTP_AUTHORIZATION': f"Bearer {tokens['access']}"}
+            calls = launch_calls(ctx.buyer.pk, ctx.power_seller, tokens['refresh'])
+
+            if delay:
+                for conn in connections.all():
+                    conn.execute_wrappers.append(slow_query)
+                connection_created.connect(install)
+            try:
+                self.report('sequential calls', len(calls), options,
+                            lambda **kw: self.sequential(client, calls, auth, **kw))
+                for parallel in (1, 4):
+                    with override_settings(BATCH_MAX_PARALLEL=parallel):
+                        name = f'batch, {"parallel reads" if parallel > 1 else "sequential"}'
+                        self.report(name, 1, options, lambda **kw: self.batch(client, calls, auth, **kw))
+            finally:
+                connection_created.disconnect(install)
+                for conn in connections.all():
+                    if slow_query in conn.execute_wrappers:
+                        conn.execute_wrappers.remove(slow_query)
+
+    @staticmethod
+    def sequential(client, calls, auth, check=False):
+        for method, path, body in calls:
+            if method == 'GET':
+                response = client.get(path, **auth)
+            else:
+                response = client.post(path, body, content_type='application/json', **auth)
+            assert response.status_code == 200, (path, response.status_code)
+
+    @staticmethod
+    def batch(client, calls, auth, check=False):
+        payload = {'requests': [{'method': method, 'path': path, 'body': body} for method, path, body in calls]}
+        response = client.post('/api/batch/', payload, content_type='application/json', **auth)
+        assert response.status_code == 200
+        if check:  # 只在预热时解析响应，计时不含客户端解析 JSON
+            assert all(item['status'] == 200 for item in response.json()['responses'])
+
+    def report(self, name, round_trips, options, launch):
+        launch(check=True)  # 预热
+        timings, queries = [], 0
+        for _ in range(options['iterations']):
+            connection.queries_log.clear()  # 查询日志有上限，每次前清空
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                launch()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries += len(captured)
+        rtt = round_trips * options['rtt_ms']
+        self.stdout.write(
+            f"{name}: server p50 {bench.percentile(timings, 50):.1f}ms, p99 {bench.percentile(timings, 99):.1f}ms, "
+            f"{queries / options['iterations']:.1f} queries on the request thread, {round_trips} round trip(s); "
+            f"launch with {options['rtt_ms']:.0f}ms RTT ~ {bench.percentile(timings, 50) + rtt:.0f}ms")
@@ -0,0 +1,63 @@
+# api/management/commands/bench_bulk_listings.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api import bench, jobs, saved_searches
+from api.models import User, Product, SavedSearch
+
+
+def rows(count, offset):
+    return [{'title': f'Bench desk {offset + i}', 'price': f'{10 + i % 90}.00', 'description': 'solid wood',
+             'category': 'Furniture', 'image': 'https://example.com/desk.png', 'tags': ['wood']}
+            for i in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Compare creating products one POST at a time with a single bulk POST'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200)
+        parser.add_argument('--searches', type=int, default=50, help='Saved searches matching every product')
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        with bench.test_database():
+            seller = User.objects.create_user(username='bench_bulk_seller', password='x')
+            watchers = User.objects.bulk_create([User(username=f'bench_bulk_{i}') for i in range(options['searches'])])
+            searches = [SavedSearch(user=user, keywords='desk') for user in watchers]
+            for search in searches:
+                saved_searches.prepare(search)
+            SavedSearch.objects.bulk_create(searches)
+            client = APIClient()
+            client.force_authenticate(seller)
+
+            def single():
+                for row in rows(count, 0):
+                    client.post('/api/products/', row, format='json')
+
+            def bulk():
+                client.post('/api/products/bulk/', rows(count, count), format='json')
+
+            for name, run in (('single POSTs', single), ('bulk POST', bulk)):
+                self.measure(name, run, count)
+            self.stdout.write(f'{Product.objects.count()} products created')
+
+    def measure(self, name, run, count):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            run()
+            elapsed = (time.perf_counter() - start) * 1000
+        queries = len(captured)
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            jobs.run_pending()
+            job_elapsed = (time.perf_counter() - start) * 1000
+        self.stdout.write(
+            f'{name}: {count} rows in {elapsed:.1f}ms ({elapsed / count:.2f}ms/row, {queries} queries); '
+            f'saved-search jobs {job_elapsed:.1f}ms ({len(captured)} queries)')
@@ -0,0 +1,88 @@
+# api/management/commands/bench_credit.py
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api import credit
+from api.bench import test_database
+from api.management.commands.seed_synthetic import chunked
+from api.models import User, Product, Review
+
+STATUSES = ['ACTIVE', 'SOLD', 'RECEIVED', 'RECEIVED', 'BANNED']
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and time full and incremental credit score recomputation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--products', type=int, default=None, help='Default: one per user')
+        parser.add_argument('--reviews', type=int, default=None, help='Default: one per two users')
+        parser.add_argument('--touched', type=float, default=0.01,
+                            help='Fraction of users with new events before the incremental run')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if credit.np is None:
+            raise CommandError('Credit scoring requires numpy (pip install numpy)')
+        users = options['users']
+        products = options['products'] if options['products'] is not None else users
+        reviews = options['reviews'] if options['reviews'] is not None else users // 2
+        rng = random.Random(options['seed'])
+        with test_database():
+            start = time.perf_counter()
+            self.seed(rng, users, products, reviews)
+            self.stdout.write(f'seeded {users} users, {products} products, {reviews} reviews '
+                              f'in {time.perf_counter() - start:.1f}s')
+
+            self.report(credit.recompute())
+            self.report(credit.recompute())  # 第二次：分数已是最新，没有写入
+
+            # 部分用户产生新事件：新的评价和被下架的商品
+            touched = rng.sample(range(users), max(1, int(users * options['touched'])))
+            since = timezone.now()
+            with transaction.atomic():
+                for i in touched:
+                    Product.objects.filter(seller_id=f'ubc{i:08d}', status='ACTIVE').update(
+                        status='BANNED', updated_at=since + timedelta(seconds=1))
+            self.report(credit.recompute(incremental=True))
+
+    def report(self, run):
+        timings = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in run.timings.items())
+        self.stdout.write(f'{run.mode:>11}: {run.users_scored} users scored, {run.users_changed} changed '
+                          f'({timings}; {run.users_scored / run.timings["total"]:,.0f} users/s)')
+
+    def seed(self, rng, users, products, reviews):
+        user_id = 'ubc{:08d}'.format
+        joined = timezone.now() - timedelta(days=30)
+        for chunk in chunked(range(users), 10000):
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(id=user_id(i), username=f'bench_credit_{i}', password='!', avatar='',
+                         is_banned=rng.random() < 0.01, date_joined=joined)
+                    for i in chunk
+                ])
+        sold = []
+        for chunk in chunked(range(products), 10000):
+            batch = []
+            for i in chunk:
+                status = rng.choice(STATUSES)
+                buyer = user_id(rng.randrange(users)) if status in ('SOLD', 'RECEIVED') else None
+                batch.append(Product(id=f'pbc{i:09d}', seller_id=user_id(rng.randrange(users)), buyer_id=buyer,
+                                     title='bench', price=1, description='', category='Other', image='',
+                                     status=status))
+                if status == 'RECEIVED':
+                    sold.append((batch[-1].id, batch[-1].seller_id, buyer))
+            with transaction.atomic():
+                Product.objects.bulk_create(batch)
+        for chunk in chunked(rng.choices(sold, k=reviews) if sold else [], 10000):
+            with transaction.atomic():
+                Review.objects.bulk_create([
+                    Review(seller_id=seller, buyer_id=buyer, product_id=product, content='',
+                           rating=rng.choices((1, 2, 3, 4, 5), (2, 3, 10, 30, 55))[0])
+                    for product, seller, buyer in chunk
+                ])
@@ -0,0 +1,83 @@
+# api/management/commands/bench_duplicates.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import bench, duplicates
+from api.models import User, Product
+from api.saved_searches import keyword_terms
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def corpus(users, products, repost_ratio, seed):
+    """随机词表生成的商品；repost_ratio 的商品是同一卖家之前某个商品改了一两个词的重复发布"""
+    rng = random.Random(seed)
+    vocabulary = [f'w{i}' for i in range(5000)]
+    listings = []
+    for i in range(products):
+        seller = f'ub{rng.randrange(users)}'
+        own = [row for row in listings[-2000:] if row[0] == seller]
+        if own and rng.random() < repost_ratio:
+            _, title, words = rng.choice(own)
+            words = list(words)
+            for _ in range(rng.randint(1, 2)):
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        else:
+            title = ' '.join(rng.sample(vocabulary, 5))
+            words = rng.sample(vocabulary, 20)
+        listings.append((seller, title, words))
+    return [(seller, title, ' '.join(words)) for seller, title, words in listings]
+
+
+class Command(BaseCommand):
+    help = 'Compare the LSH duplicate lookup with scanning every listing of the seller, and time the cluster report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--reposts', type=float, default=0.1, help='Fraction of listings that are reposts')
+        parser.add_argument('--checks', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rows = corpus(options['users'], options['products'], options['reposts'], options['seed'])
+        with bench.test_database():
+            User.objects.bulk_create([User(id=f'ub{i}', username=f'bench_dup_{i}') for i in range(options['users'])])
+            Product.objects.bulk_create([
+                Product(id=f'pb{i:06d}', seller_id=seller, title=title, description=description, price=1,
+                        category='Other', image='https://example.com/x.png')
+                for i, (seller, title, description) in enumerate(rows)], batch_size=1000)
+            start = time.perf_counter()
+            count = duplicates.backfill()
+            self.stdout.write(f'backfill: {count} products in {time.perf_counter() - start:.2f}s')
+
+            lsh, scan, agree = [], [], 0
+            for seller, title, description in rng.sample(rows, options['checks']):
+                description = f'{description} urgent'
+                start = time.perf_counter()
+                match = duplicates.check(seller, title, description)
+                lsh.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                terms = set(keyword_terms(f'{title} {description}'))
+                best = max(jaccard(terms, set(keyword_terms(f'{t} {d}'))) for t, d in
+                           Product.objects.filter(seller_id=seller, status='ACTIVE').values_list('title', 'description'))
+                scan.append((time.perf_counter() - start) * 1000)
+                agree += bool(match.duplicate_of) == (best >= 0.7)
+            per_seller = options['products'] / options['users']
+            for name, timings in (('LSH lookup', lsh), ('scan seller listings', scan)):
+                self.stdout.write(f'{name}: p50 {bench.percentile(timings, 50):.2f}ms, '
+                                  f'p99 {bench.percentile(timings, 99):.2f}ms ({per_seller:.0f} listings per seller)')
+            self.stdout.write(f'LSH agrees with exact Jaccard >= 0.7 on {agree}/{len(lsh)} reposts')
+
+            for same_seller in (True, False):
+                start = time.perf_counter()
+                total, report = duplicates.clusters(same_seller=same_seller, limit=5)
+                self.stdout.write(f"cluster report ({'same seller' if same_seller else 'cross seller'}): "
+                                  f'{total} clusters in {time.perf_counter() - start:.2f}s, '
+                                  f"largest {report[0]['size'] if report else 0}")
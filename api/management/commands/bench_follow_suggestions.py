@@ -0,0 +1,91 @@
+# api/management/commands/bench_follow_suggestions.py
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import bench, follow_suggestions
+from api.follow_suggestions import np
+
+
+def synthetic_graph(users, edges, interactions, sellers, seed):
+    """幂律的关注图：少数热门用户被大量关注；互动集中在少数卖家"""
+    rng = np.random.default_rng(seed)
+    popularity = rng.permutation(users)
+    src = rng.integers(0, users, edges, dtype=np.int32)
+    dst = popularity[(users * rng.random(edges) ** 3).astype(np.int64)].astype(np.int32)
+    seller_ids = rng.choice(users, sellers, replace=False)
+    buyers = rng.integers(0, users, interactions, dtype=np.int32)
+    targets = seller_ids[(sellers * rng.random(interactions) ** 2).astype(np.int64)].astype(np.int32)
+    weights = np.where(rng.random(interactions) < 0.3, follow_suggestions.PURCHASE_WEIGHT,
+                       follow_suggestions.WISHLIST_WEIGHT).astype(np.float32)
+    banned = rng.random(users) < 0.001
+    return follow_suggestions.Graph(users, (src, dst), (buyers, targets, weights), banned)
+
+
+class Command(BaseCommand):
+    help = 'Measure build time and peak memory of follow suggestions on a synthetic graph, and end to end on a small DB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000)
+        parser.add_argument('--edges', type=int, default=10000000)
+        parser.add_argument('--interactions', type=int, default=2000000)
+        parser.add_argument('--sellers', type=int, default=50000)
+        parser.add_argument('--count', type=int, default=20)
+        parser.add_argument('--block-size', type=int, default=20000)
+        parser.add_argument('--db-users', type=int, default=20000, help='Users for the end-to-end run (0 to skip)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if follow_suggestions.sparse is None:
+            raise CommandError('Follow suggestions require numpy and scipy (pip install numpy scipy)')
+        self.in_memory(options)
+        if options['db_users']:
+            self.end_to_end(options)
+
+    def in_memory(self, options):
+        tracemalloc.start()
+        start = time.perf_counter()
+        graph = synthetic_graph(options['users'], options['edges'], options['interactions'], options['sellers'],
+                                options['seed'])
+        matrices = time.perf_counter() - start
+        _, peak_inputs = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        suggestions = users_with = 0
+        for _, _, users, _, _, _, _ in follow_suggestions.compute(graph, options['count'], options['block_size']):
+            suggestions += len(users)
+            users_with += len(np.unique(users))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{options['users']} users, {graph.follows.nnz} follow edges, {graph.interactions.nnz} interactions: "
+            f'matrices {matrices:.1f}s, scoring {elapsed:.1f}s; {suggestions} suggestions for {users_with} users')
+        self.stdout.write(
+            f'peak traced memory {peak / 2 ** 20:.0f}MB (inputs {peak_inputs / 2 ** 20:.0f}MB), '
+            f'peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB')
+
+    def end_to_end(self, options):
+        """完整流程（读库、计算、写回）：规模按 --db-users 缩小，关注边数同比例"""
+        from api.models import User, Product
+        users = options['db_users']
+        edges = options['edges'] * users // options['users']
+        rng = np.random.default_rng(options['seed'])
+        with bench.test_database():
+            ids = [f'ub{i:07d}' for i in range(users)]
+            User.objects.bulk_create([User(id=user_id, username=user_id) for user_id in ids], batch_size=2000)
+            through = User.following.through
+            pairs = {(int(a), int(b)) for a, b in zip(rng.integers(0, users, edges),
+                                                      (users * rng.random(edges) ** 3).astype(np.int64)) if a != b}
+            through.objects.bulk_create([through(from_user_id=ids[a], to_user_id=ids[b]) for a, b in pairs],
+                                        batch_size=2000)
+            Product.objects.bulk_create([
+                Product(id=f'pf{i:07d}', seller_id=ids[int(users * rng.random() ** 2)],
+                        buyer_id=ids[int(rng.integers(users))], status='SOLD', title='x', price=1, description='x',
+                        category='x', image='https://example.com/x.png')
+                for i in range(users)], batch_size=2000)
+            result = follow_suggestions.build(k=options['count'], block_size=options['block_size'])
+            timings = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in result['timings'].items())
+            self.stdout.write(f"end to end: {result['users']} users, {result['edges']} edges, "
+                              f"{result['suggestions']} suggestions written ({timings})")
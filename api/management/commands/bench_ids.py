@@ -0,0 +1,84 @@
+# api/management/commands/bench_ids.py
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+
+from api import ids
+from api.bench import test_database
+from api.models import User, Product
+
+SCHEMES = ('legacy', 'time')
+
+
+def table_bytes(table):
+    """表数据 + 索引占用的字节数；不支持的数据库返回 None"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT data_length + index_length FROM information_schema.TABLES '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        elif connection.vendor == 'sqlite':
+            try:
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name LIKE %s',
+                               [table, f'sqlite_autoindex_{table}_%'])
+            except Exception:
+                return None
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput and index locality of legacy random ids vs time-ordered ids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000)
+        parser.add_argument('--batch', type=int, default=500, help='Rows per bulk_create; 1 inserts row by row')
+        parser.add_argument('--scheme', action='append', choices=SCHEMES, help='Repeatable; default: both')
+
+    def handle(self, *args, **options):
+        schemes = options['scheme'] or SCHEMES
+        rows, batch = options['rows'], max(1, options['batch'])
+
+        for scheme in schemes:
+            with override_settings(ID_SCHEME=scheme):
+                start = time.perf_counter()
+                generated = [ids.new_id('p') for _ in range(rows)]
+                gen_elapsed = time.perf_counter() - start
+            collisions = rows - len(set(generated))
+            self.stdout.write(
+                f'{scheme:>6}: {rows / gen_elapsed:,.0f} ids/s, {collisions} duplicate ids in {rows}, '
+                f'e.g. {generated[0]}')
+
+        with test_database():
+            seller = User.objects.create(id='ubenchids', username='bench_ids', password='!')
+            table = Product._meta.db_table
+            for scheme in schemes:
+                Product.objects.all().delete()
+                with override_settings(ID_SCHEME=scheme):
+                    appended, latest = 0, ''
+                    start = time.perf_counter()
+                    for offset in range(0, rows, batch):
+                        chunk = []
+                        for _ in range(min(batch, rows - offset)):
+                            pk = ids.new_id('p')
+                            # 比当前最大主键还大的 id 追加在聚簇索引末尾，否则要插入到中间
+                            if pk > latest:
+                                appended += 1
+                                latest = pk
+                            chunk.append(Product(
+                                id=pk, seller=seller, title='bench', price=Decimal('1.00'),
+                                description='', category='Other', image='https://picsum.photos/400',
+                            ))
+                        with transaction.atomic():
+                            Product.objects.bulk_create(chunk)
+                    elapsed = time.perf_counter() - start
+                size = table_bytes(table)
+                size_text = f', table+index {size / 1024:,.0f} KiB' if size is not None else ''
+                self.stdout.write(
+                    f'{scheme:>6}: inserted {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), '
+                    f'{appended / rows:.1%} appended at index end{size_text}')
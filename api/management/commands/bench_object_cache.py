@@ -0,0 +1,65 @@
+# api/management/commands/bench_object_cache.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api import bench, objcache
+from api.models import User, Product
+
+
+def workload(product_ids, user_ids, count, seed):
+    """详情请求：少数热门商品和卖家占大部分流量（帕累托分布）"""
+    rng = random.Random(seed)
+
+    def pick(ids):
+        return ids[min(int(rng.paretovariate(1.1)) - 1, len(ids) - 1)]
+    urls = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            urls.append(f'/api/products/{pick(product_ids)}/')
+        else:
+            urls.append(f'/api/users/{pick(user_ids)}/')
+    return urls
+
+
+class Command(BaseCommand):
+    help = 'Compare product / user detail requests with and without the process-local object cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--max-entries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with bench.test_database():
+            bench.seed_dataset(**bench.DEFAULT_DATASET)
+            product_ids = list(Product.objects.order_by('-view_count', 'id').values_list('id', flat=True))
+            user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+            urls = workload(product_ids, user_ids, options['requests'], options['seed'])
+            for enabled in (False, True):
+                with override_settings(OBJECT_CACHE_ENABLED=enabled, OBJECT_CACHE_MAX_ENTRIES=options['max_entries']):
+                    objcache.cache.reset()
+                    self.run(urls, 'object cache' if enabled else 'no cache')
+            samples = {(name, labels): value for name, labels, value in objcache.cache.collect()}
+            for label in objcache.LABELS.values():
+                self.stdout.write(
+                    f"  {label}: hit ratio {samples['unitrade_object_cache_hit_ratio', (('model', label),)]:.1%}, "
+                    f"{samples['unitrade_object_cache_entries', (('model', label),)]} entries")
+
+    def run(self, urls, name):
+        client = Client()
+        latencies, queries = [], 0
+        for url in urls:
+            connection.queries_log.clear()  # 查询日志有上限，每个请求前清空
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                client.get(url)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries += len(captured)
+        self.stdout.write(
+            f'{name}: p50 {bench.percentile(latencies, 50):.3f}ms, p99 {bench.percentile(latencies, 99):.3f}ms, '
+            f'{queries / len(urls):.2f} queries/request over {len(urls)} requests')
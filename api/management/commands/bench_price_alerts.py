@@ -0,0 +1,54 @@
+# api/management/commands/bench_price_alerts.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import bench, jobs
+from api.models import User, Product, Message, Job
+
+
+class Command(BaseCommand):
+    help = 'Measure a price update on a heavily wishlisted product and the background fan-out of alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wishlisters', type=int, default=50000)
+        parser.add_argument('--updates', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with bench.test_database():
+            User.objects.create_user(username='bench_alert_admin', password='x', role='ADMIN')
+            seller = User.objects.create_user(username='bench_alert_seller', password='x')
+            product = Product.objects.create(seller=seller, title='Bench bike', price='1000.00', description='x',
+                                             category='Sports', image='https://example.com/bike.png')
+            fans = User.objects.bulk_create(
+                [User(username=f'bench_fan_{i}') for i in range(options['wishlisters'])], batch_size=1000)
+            through = User.wishlist.through
+            through.objects.bulk_create([through(user_id=fan.pk, product_id=product.pk) for fan in fans],
+                                        batch_size=1000)
+
+            client = APIClient()
+            client.force_authenticate(seller)
+            latencies, queries = [], 0
+            for i in range(options['updates']):
+                connection.queries_log.clear()  # 查询日志有上限，每个请求前清空
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    client.patch(f'/api/products/{product.pk}/', {'price': f'{999 - i}.00'}, format='json')
+                    latencies.append((time.perf_counter() - start) * 1000)
+                queries += len(captured)
+            self.stdout.write(
+                f"{options['updates']} price cuts with {len(fans)} wishlisters: p50 {bench.percentile(latencies, 50):.2f}ms, "
+                f"p99 {bench.percentile(latencies, 99):.2f}ms, {queries / options['updates']:.1f} queries/request, "
+                f"{Job.objects.filter(kind='price_drop_alert').count()} alert job(s) queued")
+
+            Job.objects.filter(kind='price_drop_alert').update(run_at=timezone.now())
+            start = time.perf_counter()
+            done, _, _ = jobs.run_pending()
+            elapsed = time.perf_counter() - start
+            sent = Message.objects.filter(msg_type='SYSTEM').count()
+            self.stdout.write(f'fan-out: {sent} messages in {elapsed:.2f}s over {done} jobs '
+                              f'({sent / elapsed:.0f} messages/s)')
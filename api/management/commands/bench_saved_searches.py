@@ -0,0 +1,114 @@
+# api/management/commands/bench_saved_searches.py
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api import saved_searches, tasks
+from api.bench import percentile, test_database
+from api.management.commands.bench_suggest import BRANDS, synthetic_rows
+from api.management.commands.seed_synthetic import CATALOG, chunked
+from api.models import User, Product, Message, SavedSearch
+
+
+def synthetic_searches(rng, count, user_ids):
+    """关键词取自商品目录的词，部分带分类、价格区间或只按标签"""
+    catalog = list(CATALOG.items())
+    for _ in range(count):
+        category, (adjectives, nouns, tags, _) = rng.choice(catalog)
+        search = SavedSearch(user_id=rng.choice(user_ids))
+        kind = rng.random()
+        if kind < 0.2:
+            search.tags = rng.sample(tags, rng.randint(1, 2))
+        else:
+            words = [rng.choice(nouns)]
+            if rng.random() < 0.5:
+                words.insert(0, rng.choice(adjectives))
+            if rng.random() < 0.4:
+                words.insert(0, rng.choice(BRANDS))
+            search.keywords = ' '.join(words)
+        if rng.random() < 0.3:
+            search.category = category
+        if rng.random() < 0.3:
+            low = rng.randint(0, 200)
+            search.min_price, search.max_price = Decimal(low), Decimal(low + rng.randint(20, 500))
+        yield saved_searches.prepare(search)
+
+
+class Command(BaseCommand):
+    help = 'Measure per-listing saved-search matching cost (reverse index vs checking every search)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--listings', type=int, default=300)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with test_database():
+            User.objects.create(id='ubssadmin', username='bench_ss_admin', password='!', role='ADMIN')
+            seller = User.objects.create(id='ubssseller', username='bench_ss_seller', password='!')
+            user_ids = [f'ubss{i:06d}' for i in range(options['users'])]
+            for chunk in chunked(user_ids, 5000):
+                User.objects.bulk_create([User(id=pk, username=pk, password='!', avatar='') for pk in chunk])
+            start = time.perf_counter()
+            for chunk in chunked(synthetic_searches(rng, options['searches'], user_ids), 5000):
+                with transaction.atomic():
+                    SavedSearch.objects.bulk_create(chunk)
+            self.stdout.write(f"stored {options['searches']} saved searches in {time.perf_counter() - start:.1f}s")
+
+            products = []
+            for pk, title, _, tags in synthetic_rows(options['listings'], options['seed']):
+                category = rng.choice(list(CATALOG))
+                products.append(Product.objects.create(
+                    id=pk, seller=seller, title=title, description='', category=category,
+                    price=Decimal(rng.randint(5, 600)), image='https://picsum.photos/400', tags=tags))
+
+            latencies, candidates, matched = [], [], []
+            for product in products:
+                start = time.perf_counter()
+                found = saved_searches.candidates(product)
+                terms = saved_searches.product_terms(product)
+                hits = [s for s in found if all(t in terms for t in s.terms)
+                        and all(f'tag:{tag}' in terms for tag in s.tags)]
+                latencies.append((time.perf_counter() - start) * 1000)
+                candidates.append(len(found))
+                matched.append(len(hits))
+            self.stdout.write(
+                f"reverse index: p50 {percentile(latencies, 50):.2f}ms, p99 {percentile(latencies, 99):.2f}ms "
+                f"per listing; {sum(candidates) / len(products):.0f} candidates, "
+                f"{sum(matched) / len(products):.1f} matches on average")
+
+            # 对比：每个新商品都检查全部搜索（即使搜索已预先载入内存，也要逐个校验）
+            start = time.perf_counter()
+            every = list(SavedSearch.objects.only('user_id', 'category', 'min_price', 'max_price', 'tags', 'terms'))
+            load = time.perf_counter() - start
+            latencies = []
+            for product in products[:50]:
+                start = time.perf_counter()
+                terms = saved_searches.product_terms(product)
+                [s for s in every if (not s.category or s.category == product.category)
+                 and (s.min_price is None or s.min_price <= product.price)
+                 and (s.max_price is None or s.max_price >= product.price)
+                 and all(t in terms for t in s.terms) and all(f'tag:{tag}' in terms for tag in s.tags)]
+                latencies.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f"check every search: p50 {percentile(latencies, 50):.2f}ms per listing "
+                f"(plus {load:.1f}s to load all searches)")
+
+            # 完整的后台任务：匹配 + 批量写入系统消息
+            latencies, queries = [], []
+            for product in products[:100]:
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    with transaction.atomic():
+                        tasks.notify_saved_search_matches({'productId': product.pk})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                queries.append(len(captured))
+            self.stdout.write(
+                f"match + notify job: p50 {percentile(latencies, 50):.2f}ms, p99 {percentile(latencies, 99):.2f}ms, "
+                f"{max(queries)} queries max; {Message.objects.count()} messages written")
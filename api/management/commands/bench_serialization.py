@@ -0,0 +1,83 @@
+# api/management/commands/bench_serialization.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api import bench, fastpath
+from api.models import User, Product
+from api.renderers import FastJSONRenderer
+from api.serializers import UserSerializer, ProductSerializer
+
+
+def drf_path(serializer_class, queryset):
+    def fetch():
+        return list(queryset.all())
+
+    def render(instances):
+        return JSONRenderer().render(serializer_class(instances, many=True).data)
+    return fetch, render
+
+
+def fast_path(mapper, queryset):
+    def fetch():
+        return list(queryset.values_list(*mapper.columns))
+
+    def render(rows):
+        map_row = mapper.map_row
+        tz = timezone.get_current_timezone()
+        return FastJSONRenderer().render([map_row(row, tz) for row in rows])
+    return fetch, render
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF serializer + JSONRenderer throughput with the values_list fast path + FastJSONRenderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with bench.test_database():
+            bench.seed_dataset(users=options['users'], products=options['products'], seed=42)
+            products = Product.objects.order_by('-created_at')
+            users = User.objects.order_by('id')
+            count = products.count()
+            # 分别计时取数 (SQL + ORM 转换) 和序列化 + 渲染两个阶段
+            self.stdout.write(f"{'path':<6}{'fetch s':>10}{'render s':>10}{'total s':>10}{'rows/s':>12}{'bytes':>12}")
+            best = {}
+            for name, (fetch, render) in (('drf', drf_path(ProductSerializer, products)),
+                                          ('fast', fast_path(fastpath.PRODUCT_MAPPER, products))):
+                fetch_times, render_times = [], []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    rows = fetch()
+                    middle = time.perf_counter()
+                    body = render(rows)
+                    fetch_times.append(middle - start)
+                    render_times.append(time.perf_counter() - middle)
+                best[name] = (min(fetch_times), min(render_times))
+                total = sum(best[name])
+                self.stdout.write(
+                    f"{name:<6}{best[name][0]:>10.3f}{best[name][1]:>10.3f}{total:>10.3f}"
+                    f"{count / total:>12.0f}{len(body):>12}")
+            self.stdout.write(self.style.SUCCESS(
+                f"products: render phase {best['drf'][1] / best['fast'][1]:.1f}x faster, "
+                f"end to end {sum(best['drf']) / sum(best['fast']):.1f}x faster"))
+
+            # 用户列表额外包含 wishlist / following，DRF 路径每个用户两次查询
+            timings = {}
+            for name, render in (
+                    ('drf', lambda: JSONRenderer().render(UserSerializer(users, many=True).data)),
+                    ('fast', lambda: FastJSONRenderer().render(fastpath.user_rows(users)))):
+                samples = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    render()
+                    samples.append(time.perf_counter() - start)
+                timings[name] = min(samples)
+            self.stdout.write(self.style.SUCCESS(
+                f"users ({users.count()} rows): drf {timings['drf']:.3f}s, fast {timings['fast']:.3f}s, "
+                f"{timings['drf'] / timings['fast']:.1f}x faster"))
@@ -0,0 +1,118 @@
+# api/management/commands/bench_suggest.py
+import random
+import time
+import resource
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api import suggest
+from api.bench import percentile, test_database
+from api.management.commands.seed_synthetic import CATALOG, chunked
+from api.models import User, Product
+from api.views import filter_products
+
+CONDITIONS = ['like new', 'barely used', 'good condition', 'with box', 'cheap', 'must go', '9成新', '全新未拆']
+BRANDS = ['Logitech', 'Sony', 'IKEA', 'Nike', 'Anker', 'Xiaomi', 'Dell', 'Uniqlo', 'Decathlon', 'Muji',
+          'Apple', 'Huawei', 'Lenovo', 'Adidas', 'Casio', 'Philips']
+
+
+def synthetic_rows(count, seed):
+    """(id, title, view_count, tags)：标题由目录词、品牌、型号和成色组合，浏览量长尾分布"""
+    rng = random.Random(seed)
+    catalog = list(CATALOG.values())
+    for i in range(count):
+        adjectives, nouns, tags, _ = rng.choice(catalog)
+        title = (f'{rng.choice(BRANDS)} {rng.choice(adjectives)} {rng.choice(nouns)} '
+                 f'{rng.choice("ABCDEFGHJKMNPRSTVWXZ")}{rng.randint(1, 999)} {rng.choice(CONDITIONS)}')
+        yield f'pbs{i:09d}', title, int(rng.paretovariate(1.2)) - 1, rng.sample(tags, rng.randint(0, 3))
+
+
+def query_workload(rows, count, seed):
+    """模拟逐字输入：取随机标题的前 1~12 个字符，短前缀更常见"""
+    rng = random.Random(seed + 1)
+    titles = [row[1] for row in rows]
+    queries = []
+    for _ in range(count):
+        title = rng.choice(titles)
+        length = min(len(title), int(rng.triangular(1, 12, 2)))
+        queries.append(title[:length])
+    return queries
+
+
+class Command(BaseCommand):
+    help = 'Build the search-as-you-type prefix index and measure suggestion latency (target: p99 < 5 ms)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--target-ms', type=float, default=5.0, help='p99 latency target')
+        parser.add_argument('--from-db', action='store_true',
+                            help='Insert the titles into a throwaway database and build from values_list, '
+                                 'also timing the icontains search it replaces')
+
+    def handle(self, *args, **options):
+        count, seed = options['titles'], options['seed']
+        with override_settings(SUGGEST_MAX_TITLES=count):
+            if options['from_db']:
+                with test_database():
+                    self.stdout.write(f'Inserting {count} products...')
+                    rows = self.seed(count, seed)
+                    self.run(rows, options, lambda: suggest.index.rebuild())
+                    self.compare_icontains(query_workload(rows, 200, seed))
+            else:
+                rows = list(synthetic_rows(count, seed))
+                self.run(rows, options, lambda: suggest.index.rebuild(rows))
+
+    def seed(self, count, seed):
+        seller = User.objects.create(id='ubenchsug', username='bench_suggest', password='!')
+        rows = []
+        for chunk in chunked(synthetic_rows(count, seed), 5000):
+            rows.extend(chunk)
+            Product.objects.bulk_create([
+                Product(id=pk, seller=seller, title=title, price=1, description='', category='Other',
+                        image='https://picsum.photos/400', view_count=views, tags=tags)
+                for pk, title, views, tags in chunk
+            ])
+        return rows
+
+    def run(self, rows, options, rebuild):
+        suggest.index.reset()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        rebuild()
+        build_seconds = time.perf_counter() - start
+        # 峰值 RSS 的增长（KiB），包含构建时的临时对象，是索引常驻内存的上界
+        memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) * 1024
+        titles = suggest.index._titles
+        self.stdout.write(
+            f'built {len(titles)} titles / {len(suggest.index._tags)} tags in {build_seconds:.2f}s, '
+            f'{len(titles.top)} cached prefixes, peak RSS +{memory / 2 ** 20:,.0f} MiB')
+
+        # 增量层中有一些修改时的查询代价
+        for pk, title, views, _ in random.Random(options['seed']).sample(rows, min(500, len(rows))):
+            suggest.index.apply(pk, title + ' (edited)', views, active=True)
+
+        queries = query_workload(rows, options['queries'], options['seed'])
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            suggest.index.suggest(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        p99 = percentile(latencies, 99)
+        verdict = self.style.SUCCESS('PASS') if p99 < options['target_ms'] else self.style.ERROR('FAIL')
+        self.stdout.write(
+            f'{len(queries)} queries: p50 {percentile(latencies, 50):.3f}ms, p95 {percentile(latencies, 95):.3f}ms, '
+            f'p99 {p99:.3f}ms, max {max(latencies):.3f}ms  [{verdict} target p99 < {options["target_ms"]}ms]')
+
+    def compare_icontains(self, queries):
+        """对比原先搜索框每次按键调用的列表搜索：只取前 8 条、不序列化，是原接口耗时的下界"""
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            list(filter_products(Product.objects.all(), {'search': query}).values_list('id', 'title')[:8])
+            latencies.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'list search, first 8 rows ({len(queries)} queries): p50 {percentile(latencies, 50):.3f}ms, '
+            f'p99 {percentile(latencies, 99):.3f}ms')
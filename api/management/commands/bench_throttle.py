@@ -0,0 +1,83 @@
+# api/management/commands/bench_throttle.py
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, RequestFactory, override_settings
+
+from api import throttling
+from api.bench import percentile, test_database
+from api.models import User
+
+
+def _hammer(path, attempts, results):
+    """子进程：对同一个键连续取令牌，返回放行次数"""
+    store = throttling.SharedStore(path, 1024)
+    now = time.time()
+    results.put(sum(store.take('login:ip:10.0.0.1', 100, 0.0, 1, now)[0] for _ in range(attempts)))
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of a throttle check and verify that limits hold across processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=50000)
+        parser.add_argument('--clients', type=int, default=10000, help='Distinct client IPs')
+        parser.add_argument('--processes', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'throttle.bin')
+            # 桶足够大，测量的是放行路径（绝大多数请求）
+            buckets = {'client': (10 ** 9, 1.0), 'search': (10 ** 9, 1.0)}
+            for name, store_path in (('in-process store', None), ('shared mmap store', path)):
+                with override_settings(THROTTLE_STORE_PATH=store_path, THROTTLE_BUCKETS=buckets):
+                    throttling.reset_store()
+                    self.measure(name, options)
+            self.cross_process(path, options['processes'])
+        throttling.reset_store()
+        self.compare_login()
+
+    def measure(self, name, options):
+        factory = RequestFactory()
+        requests = [factory.get('/api/products/', {'search': 'desk'},
+                                REMOTE_ADDR=f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}')
+                    for i in range(options['clients'])]
+        latencies = []
+        for i in range(options['checks']):
+            request = requests[i % len(requests)]
+            start = time.perf_counter()
+            throttling.check(request, throttling.endpoint_name(request, 'product-list'))
+            latencies.append((time.perf_counter() - start) * 1e6)
+        self.stdout.write(
+            f'{name}: p50 {percentile(latencies, 50):.1f}us, p99 {percentile(latencies, 99):.1f}us per check '
+            f'(two buckets, {len(requests)} clients)')
+
+    def cross_process(self, path, processes):
+        results = multiprocessing.get_context('fork').Queue()
+        workers = [multiprocessing.get_context('fork').Process(target=_hammer, args=(path + '.mp', 100, results))
+                   for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        allowed = sum(results.get() for _ in workers)
+        for worker in workers:
+            worker.join()
+        self.stdout.write(f'{processes} processes x 100 attempts on a 100-token bucket: {allowed} allowed')
+
+    def compare_login(self):
+        """被拒绝的登录请求不做 PBKDF2 哈希"""
+        with test_database(), override_settings(THROTTLE_ENABLED=True, THROTTLE_STORE_PATH=None,
+                                                THROTTLE_BUCKETS={'client': (1000, 0.0), 'login': (5, 0.0)}):
+            User.objects.create_user(username='bench_throttle', password='password123')
+            logging.getLogger('django.request').setLevel(logging.ERROR)  # 不逐条输出 429 警告
+            client = Client()
+            timings = {200: [], 429: []}
+            for _ in range(20):
+                start = time.perf_counter()
+                response = client.post('/api/auth/login/', {'username': 'bench_throttle', 'password': 'password123'})
+                timings[response.status_code].append((time.perf_counter() - start) * 1000)
+            for code, samples in timings.items():
+                self.stdout.write(f'login {code}: {len(samples)} requests, p50 {percentile(samples, 50):.2f}ms')
@@ -0,0 +1,104 @@
+# api/management/commands/bench_uploads.py
+import io
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import media
+from api.bench import percentile
+from api.models import User
+from api.views import ImageUploadView
+
+
+def make_jpeg(seed, width, height):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    # 画几块随机色块，让压缩后的大小接近真实照片
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + width // 6, y + height // 6))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark image uploads per second, thumbnail pool saturation and variant throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent uploading threads')
+        parser.add_argument('--duplicate-rate', type=float, default=0.2, help='Fraction of repeated images')
+        parser.add_argument('--workers', type=int, default=2, help='Thumbnail pool processes')
+        parser.add_argument('--max-pending', type=int, default=32)
+        parser.add_argument('--size', default='1600x1200')
+
+    def handle(self, *args, **options):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError('Pillow is required to generate thumbnails: pip install Pillow')
+
+        width, height = (int(v) for v in options['size'].split('x'))
+        rng = random.Random(42)
+        distinct = max(1, int(options['uploads'] * (1 - options['duplicate_rate'])))
+        self.stdout.write(f"Generating {distinct} distinct {width}x{height} JPEGs...")
+        images = [make_jpeg(i, width, height) for i in range(distinct)]
+        payloads = [images[i] if i < distinct else rng.choice(images) for i in range(options['uploads'])]
+
+        # 不需要数据库：未保存的 User 实例即视为已登录
+        user = User(id='ubench', username='bench')
+        view = ImageUploadView.as_view()
+        factory = APIRequestFactory()
+
+        def upload(i):
+            request = factory.post('/api/uploads/images/', {
+                'file': SimpleUploadedFile(f'{i}.jpg', payloads[i], content_type='image/jpeg'),
+            }, format='multipart')
+            force_authenticate(request, user=user)
+            start = time.perf_counter()
+            response = view(request)
+            return response.status_code, time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root, IMAGE_POOL_WORKERS=options['workers'],
+                IMAGE_POOL_MAX_PENDING=options['max_pending']):
+            media._pool = None
+            pool = media.get_pool()
+            # 预先启动工作进程，避免把进程启动时间算进第一批上传
+            pool._get_executor().submit(time.sleep, 0).result()
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                results = list(executor.map(upload, range(options['uploads'])))
+            upload_elapsed = time.perf_counter() - start
+            while pool.pending:
+                time.sleep(0.01)
+            drain_elapsed = time.perf_counter() - start
+            peak = pool.peak_pending
+            pool.shutdown()
+            media._pool = None
+
+        statuses = [status for status, _ in results]
+        latencies = [elapsed * 1000 for _, elapsed in results]
+        accepted = sum(1 for status in statuses if status in (200, 201))
+        rendered = statuses.count(201)
+        self.stdout.write(
+            f"uploads: {len(results)} in {upload_elapsed:.2f}s ({len(results) / upload_elapsed:.1f}/s), "
+            f"201 new={rendered}, 200 deduplicated={statuses.count(200)}, 503 saturated={statuses.count(503)}")
+        self.stdout.write(
+            f"request latency ms: p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+            f"p99={percentile(latencies, 99):.1f}")
+        self.stdout.write(
+            f"thumbnail pool: peak pending {peak}/{options['max_pending']} with {options['workers']} workers, "
+            f"all variants done after {drain_elapsed:.2f}s "
+            f"({rendered / drain_elapsed:.1f} images/s)")
+        self.stdout.write(self.style.SUCCESS(f"Accepted {accepted}/{len(results)} uploads"))
@@ -0,0 +1,24 @@
+# api/management/commands/build_follow_suggestions.py
+import resource
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import follow_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Recompute "who to follow" suggestions from the follow graph and purchase / wishlist signals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, help='Suggestions kept per user (FOLLOW_SUGGESTION_COUNT)')
+        parser.add_argument('--block-size', type=int, help='Users per block (FOLLOW_SUGGESTION_BLOCK_SIZE)')
+
+    def handle(self, *args, **options):
+        if follow_suggestions.sparse is None:
+            raise CommandError('Follow suggestions require numpy and scipy (pip install numpy scipy)')
+        result = follow_suggestions.build(k=options['count'], block_size=options['block_size'])
+        timings = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in result['timings'].items())
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 上单位为 KB
+        self.stdout.write(
+            f"{result['users']} users, {result['edges']} follow edges: {result['suggestions']} suggestions "
+            f"({timings}; peak RSS {peak:.0f}MB)")
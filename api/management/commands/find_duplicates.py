@@ -0,0 +1,36 @@
+# api/management/commands/find_duplicates.py
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api import duplicates
+
+
+class Command(BaseCommand):
+    help = 'Report clusters of near-duplicate listings over the whole catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='Fingerprint products that have none yet first')
+        parser.add_argument('--cross-seller', action='store_true', help='Also cluster listings of different sellers')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            start = time.perf_counter()
+            written = duplicates.backfill()
+            self.stderr.write(f'fingerprinted {written} products in {time.perf_counter() - start:.2f}s')
+        start = time.perf_counter()
+        total, report = duplicates.clusters(same_seller=not options['cross_seller'], limit=options['limit'])
+        elapsed = time.perf_counter() - start
+        if options['json']:
+            self.stdout.write(json.dumps({'total': total, 'clusters': report}, cls=DjangoJSONEncoder,
+                                         ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(f'{total} clusters ({elapsed:.2f}s)')
+        for cluster in report:
+            self.stdout.write(f"- {cluster['size']} listings from {cluster['sellers']} seller(s)")
+            for item in cluster['products']:
+                self.stdout.write(f"    {item['id']}  {item['sellerId']}  {item['status']:<8}  {item['title']}")
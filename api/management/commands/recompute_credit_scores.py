@@ -0,0 +1,30 @@
+# api/management/commands/recompute_credit_scores.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api import credit
+
+
+class Command(BaseCommand):
+    help = 'Recompute User.credit_score from reviews, completed trades and moderation history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only rescore users with events since the last successful run')
+        parser.add_argument('--since', help='ISO datetime; overrides the last run as the incremental start')
+
+    def handle(self, *args, **options):
+        if credit.np is None:
+            raise CommandError('Credit scoring requires numpy (pip install numpy)')
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        run = credit.recompute(incremental=options['incremental'] or since is not None, since=since)
+        timings = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in run.timings.items())
+        self.stdout.write(
+            f'{run.mode}: scored {run.users_scored} users, {run.users_changed} changed ({timings})')
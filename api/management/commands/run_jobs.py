@@ -0,0 +1,107 @@
+# api/management/commands/run_jobs.py
+import logging
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from api import jobs, metrics, objcache
+
+logger = logging.getLogger('api.jobs')
+
+# 维护操作（回收崩溃 worker 的任务、清理旧任务和对象缓存的失效记录）的间隔秒数
+MAINTENANCE_INTERVAL = 60
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """worker 进程自己的指标（任务吞吐、耗时、排队延迟），Prometheus 文本格式"""
+
+    def do_GET(self):
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Run the database-backed background job worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Worker threads')
+        parser.add_argument('--batch-size', type=int, default=None, help='Jobs claimed per dequeue (JOB_BATCH_SIZE)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--kind', action='append', help='Only run these job kinds (repeatable)')
+        parser.add_argument('--once', action='store_true', help='Drain due jobs and exit')
+        parser.add_argument('--metrics-port', type=int, default=None, help='Serve worker metrics on this port')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or getattr(settings, 'JOB_BATCH_SIZE', 50)
+        kinds = options['kind']
+        if options['once']:
+            start = time.perf_counter()
+            done, retry, failed = jobs.run_pending(batch_size, kinds)
+            self.stdout.write(f'done={done} retry={retry} failed={failed} in {time.perf_counter() - start:.2f}s')
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        if options['metrics_port']:
+            server = ThreadingHTTPServer(('0.0.0.0', options['metrics_port']), MetricsHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        totals = [0, 0, 0]
+        totals_lock = threading.Lock()
+
+        def work():
+            while not stop.is_set():
+                close_old_connections()
+                try:
+                    batch = jobs.dequeue(batch_size, kinds)
+                except DatabaseError as exc:
+                    # 如 SQLite 的 database is locked：稍后重试，不让线程退出
+                    logger.warning('Dequeue failed: %s', exc)
+                    batch = []
+                if not batch:
+                    stop.wait(options['poll_interval'])
+                    continue
+                counts = jobs.execute(batch)
+                with totals_lock:
+                    for i, count in enumerate(counts):
+                        totals[i] += count
+            connection.close()
+
+        threads = [threading.Thread(target=work, name=f'job-worker-{i}') for i in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Job worker started: {options['concurrency']} threads, batch size {batch_size}")
+
+        start = time.perf_counter()
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                requeued = jobs.requeue_stale()
+                purged = jobs.purge_finished()
+                invalidations = objcache.purge_log()
+                if requeued or purged or invalidations:
+                    self.stdout.write(f'Requeued {requeued} stale jobs, purged {purged} finished jobs '
+                                      f'and {invalidations} cache invalidations')
+                stop.wait(MAINTENANCE_INTERVAL)
+        except KeyboardInterrupt:
+            stop.set()
+        # 等待各线程执行完手上的批次
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        done, retry, failed = totals
+        self.stdout.write(
+            f'Stopped after {elapsed:.0f}s: done={done} retry={retry} failed={failed} '
+            f'({done / elapsed if elapsed else 0:.1f} jobs/s)')
@@ -0,0 +1,271 @@
+# api/management/commands/seed_synthetic.py
+import itertools
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from api.models import User, Product, Message, Review
+
+# 合成数据的主键前缀，便于 --clear 精确清理，不会误删真实数据
+USER_ID_PREFIX = 'ug'
+PRODUCT_ID_PREFIX = 'pg'
+
+CATALOG = {
+    'Books': (['Calculus', 'Economics', 'Python', 'Chemistry', 'Psychology', 'History', 'Physics', 'Marketing'],
+              ['Textbook', 'Workbook', 'Reader', 'Lab Manual', 'Guide'],
+              ['textbook', 'math', 'science', 'study', 'exam', 'reading'], 25),
+    'Electronics': (['Wireless', 'Mechanical', 'Portable', 'Bluetooth', 'USB-C', 'Noise Cancelling'],
+                    ['Mouse', 'Keyboard', 'Headphones', 'Speaker', 'Power Bank', 'Hub', 'Monitor'],
+                    ['tech', 'audio', 'gaming', 'pc', 'charging', 'accessory'], 60),
+    'Furniture': (['Foldable', 'Wooden', 'Swivel', 'Compact', 'Minimalist'],
+                  ['Desk', 'Chair', 'Bookshelf', 'Lamp', 'Mirror', 'Ottoman'],
+                  ['dorm', 'storage', 'study', 'living', 'wooden'], 35),
+    'Clothing': (['Navy', 'Waterproof', 'Formal', 'Vintage', 'Winter'],
+                 ['Hoodie', 'Jacket', 'Sneakers', 'Scarf', 'Backpack'],
+                 ['campus', 'casual', 'fashion', 'winter', 'shoes'], 30),
+    'Sports': (['Adjustable', 'Weighted', 'Pro', 'Lightweight'],
+               ['Dumbbells', 'Yoga Mat', 'Racket', 'Basketball', 'Helmet'],
+               ['fitness', 'gym', 'outdoor', 'sport', 'cardio'], 25),
+    'Others': (['Electric', 'Reusable', 'Silent', 'Windproof'],
+               ['Kettle', 'Umbrella', 'Skateboard', 'Board Game', 'Bicycle Lock'],
+               ['kitchen', 'essential', 'fun', 'eco', 'bike'], 15),
+}
+
+# 商品状态分布：大部分在售，少量成交/下架
+STATUS_WEIGHTS = [('ACTIVE', 70), ('SOLD', 12), ('RECEIVED', 15), ('BANNED', 3)]
+# 评分明显偏向好评
+RATING_WEIGHTS = [(1, 2), (2, 3), (3, 10), (4, 30), (5, 55)]
+
+
+def zipf_cum_weights(n, exponent):
+    """返回 Zipf 分布的累计权重，配合 random.choices(cum_weights=...) 做 O(log n) 抽样"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, skewed, deterministic synthetic dataset for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--follows', type=float, default=8.0, help='Average follows per user')
+        parser.add_argument('--wishlists', type=float, default=5.0, help='Average wishlist items per user')
+        parser.add_argument('--messages', type=int, default=None, help='Defaults to half the product count')
+        parser.add_argument('--review-rate', type=float, default=0.6,
+                            help='Fraction of RECEIVED products that get a review')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--seller-skew', type=float, default=1.1, help='Zipf exponent for seller activity')
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated synthetic rows first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.now = timezone.now()
+        n_users = options['users']
+        n_products = options['products']
+        n_messages = options['messages'] if options['messages'] is not None else n_products // 2
+
+        if options['clear']:
+            self.clear()
+
+        self.user_ids = [f"{USER_ID_PREFIX}{i:07d}" for i in range(n_users)]
+        # 少数 "强力卖家" 发布大部分商品；关注/私信也按同样的人气分布倾斜
+        self.user_weights = zipf_cum_weights(n_users, options['seller_skew'])
+
+        totals = {}
+        totals['api_user'] = self.run_step('api_user', self.iter_users(), User)
+        received, view_counts = [], []
+        totals['api_product'] = self.run_step(
+            'api_product', self.iter_products(n_products, received, view_counts), Product)
+        # 热门商品更容易被收藏：按浏览量从高到低排名，再按排名的 Zipf 分布抽样
+        ranked = sorted(range(n_products), key=lambda i: -view_counts[i])
+        self.product_ids = [f"{PRODUCT_ID_PREFIX}{i:08d}" for i in ranked]
+        self.product_weights = zipf_cum_weights(n_products, 1.0)
+
+        follow_model = User.following.through
+        totals['api_user_following'] = self.run_step(
+            'api_user_following', self.iter_follows(options['follows'], follow_model), follow_model)
+        wishlist_model = User.wishlist.through
+        totals['api_user_wishlist'] = self.run_step(
+            'api_user_wishlist', self.iter_wishlists(options['wishlists'], wishlist_model), wishlist_model)
+        totals['api_message'] = self.run_step('api_message', self.iter_messages(n_messages), Message)
+        totals['api_review'] = self.run_step(
+            'api_review', self.iter_reviews(received, options['review_rate']), Review)
+
+        rows = sum(count for count, _ in totals.values())
+        elapsed = sum(seconds for _, seconds in totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s overall)"))
+
+    def clear(self):
+        """
+        直接执行 DELETE，不经过 Collector：ORM 的 delete() 会把百万行连同级联的行全部载入内存。
+        按依赖顺序先处理引用这些行的表，不发送删除信号，其他进程的对象缓存由过期时间兜底。
+        """
+        products = Product.objects.filter(
+            Q(id__startswith=PRODUCT_ID_PREFIX) | Q(seller__id__startswith=USER_ID_PREFIX))
+        users = User.objects.filter(id__startswith=USER_ID_PREFIX)
+        start = time.perf_counter()
+        with transaction.atomic():
+            deleted = self.delete_rows(products) + self.delete_rows(users)
+        self.stdout.write(
+            f"Cleared {deleted} rows of previous synthetic data in {time.perf_counter() - start:.1f}s.")
+
+    def delete_rows(self, queryset):
+        """删除 queryset 的行及引用它们的行（含多对多中间表），返回删除的行数"""
+        model = queryset.model
+        deleted = 0
+        for relation in model._meta.get_fields(include_hidden=True):
+            if not (relation.auto_created and not relation.concrete and (relation.one_to_many or relation.one_to_one)):
+                continue
+            field = relation.field
+            related = relation.related_model._base_manager.filter(**{f'{field.name}__in': queryset.values('pk')})
+            on_delete = field.remote_field.on_delete
+            if on_delete is models.SET_NULL:
+                related.update(**{field.name: None})
+            elif on_delete in (models.CASCADE, models.DO_NOTHING):
+                # DO_NOTHING 只有评价对商品的软引用，与 api/archive.py 中删除商品时的处理一致
+                deleted += self.delete_rows(related)
+            else:
+                raise CommandError(f'Cannot clear {model.__name__}: {related.model.__name__}.{field.name} '
+                                   f'uses on_delete={on_delete.__name__}')
+        return deleted + queryset._raw_delete(queryset.db)
+
+    def run_step(self, table, objects, model):
+        """分块 bulk_create 并统计每张表的写入速度"""
+        start = time.perf_counter()
+        count = 0
+        for chunk in chunked(objects, self.chunk_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, batch_size=self.chunk_size)
+            count += len(chunk)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{table}: {count} rows in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+        return count, elapsed
+
+    def pick_user(self, k=1):
+        return self.rng.choices(self.user_ids, cum_weights=self.user_weights, k=k)
+
+    def iter_users(self):
+        # PBKDF2 很慢，所有合成用户共用一个哈希
+        password = make_password('password123')
+        for i, uid in enumerate(self.user_ids):
+            joined = self.now - timedelta(days=self.rng.randint(0, 4 * 365))
+            yield User(
+                id=uid,
+                username=f"syn_user_{i}",
+                password=password,
+                role='STUDENT',
+                credit_score=min(950, int(self.rng.gauss(720, 80))),
+                bio=f"Synthetic student #{i}.",
+                avatar=f"https://api.dicebear.com/7.x/avataaars/svg?seed={uid}",
+                date_joined=joined,
+                join_date=joined.date(),
+                wallet_balance=Decimal(self.rng.randint(0, 50000)) / 100,
+            )
+
+    def iter_products(self, n_products, received, view_counts):
+        rng = self.rng
+        categories = list(CATALOG)
+        statuses = [status for status, _ in STATUS_WEIGHTS]
+        status_weights = [weight for _, weight in STATUS_WEIGHTS]
+        sellers = self.pick_user
+        for i in range(n_products):
+            pid = f"{PRODUCT_ID_PREFIX}{i:08d}"
+            category = rng.choice(categories)
+            adjectives, nouns, tags, median_price = CATALOG[category]
+            title = f"{rng.choice(adjectives)} {rng.choice(nouns)}"
+            seller_id = sellers()[0]
+            status = rng.choices(statuses, weights=status_weights)[0]
+            buyer_id = None
+            if status in ('SOLD', 'RECEIVED'):
+                buyer_id = rng.choice(self.user_ids)
+                if buyer_id == seller_id:
+                    status, buyer_id = 'ACTIVE', None
+                elif status == 'RECEIVED':
+                    received.append((pid, seller_id, buyer_id))
+            # 价格服从对数正态分布，浏览量服从重尾的帕累托分布
+            price = Decimal(round(rng.lognormvariate(0, 0.6) * median_price, 2)).quantize(Decimal('0.01'))
+            view_counts.append(min(10 ** 6, int(rng.paretovariate(1.16) * 5) - 5))
+            yield Product(
+                id=pid,
+                seller_id=seller_id,
+                buyer_id=buyer_id,
+                title=title,
+                price=price,
+                description=f"{title} in good condition. Listing #{i}, pick up on campus.",
+                category=category,
+                image=f"https://picsum.photos/seed/{pid}/400/300",
+                status=status,
+                view_count=view_counts[-1],
+                tags=rng.sample(tags, 2),
+            )
+
+    def iter_follows(self, average, through):
+        rng = self.rng
+        for uid in self.user_ids:
+            count = min(int(rng.expovariate(1.0 / average)), len(self.user_ids) - 1) if average else 0
+            for target in set(self.pick_user(count)):
+                if target != uid:
+                    yield through(from_user_id=uid, to_user_id=target)
+
+    def iter_wishlists(self, average, through):
+        rng = self.rng
+        for uid in self.user_ids:
+            count = min(int(rng.expovariate(1.0 / average)), len(self.product_ids)) if average else 0
+            for pid in set(rng.choices(self.product_ids, cum_weights=self.product_weights, k=count)):
+                yield through(user_id=uid, product_id=pid)
+
+    def iter_messages(self, n_messages):
+        # 预先分配自增主键，避免批量插入时回读 id
+        start = (Message.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+        rng = self.rng
+        for i in range(n_messages):
+            sender_id = rng.choice(self.user_ids)
+            receiver_id = self.pick_user()[0]
+            while receiver_id == sender_id and len(self.user_ids) > 1:
+                receiver_id = self.pick_user()[0]
+            yield Message(
+                id=start + i,
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                content=f"Hi, is item #{rng.randint(0, 10 ** 6)} still available?",
+                is_read=rng.random() < 0.7,
+                msg_type='CHAT',
+            )
+
+    def iter_reviews(self, received, rate):
+        start = (Review.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+        rng = self.rng
+        ratings = [rating for rating, _ in RATING_WEIGHTS]
+        weights = [weight for _, weight in RATING_WEIGHTS]
+        next_id = start
+        for pid, seller_id, buyer_id in received:
+            if rng.random() >= rate:
+                continue
+            yield Review(
+                id=next_id,
+                seller_id=seller_id,
+                buyer_id=buyer_id,
+                product_id=pid,
+                rating=rng.choices(ratings, weights=weights)[0],
+                content="Smooth trade, item as described.",
+            )
+            next_id += 1
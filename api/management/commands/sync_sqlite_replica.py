@@ -0,0 +1,42 @@
+# api/management/commands/sync_sqlite_replica.py
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.db_router import PRIMARY
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary into the SQLite replica(s), simulating replication for local testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Repeat every N seconds (the simulated replication lag); 0 copies once')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[PRIMARY]
+        targets = [settings.DATABASES[alias] for alias in getattr(settings, 'DATABASE_REPLICAS', [])]
+        if 'sqlite3' not in primary['ENGINE'] or not targets or any('sqlite3' not in t['ENGINE'] for t in targets):
+            raise CommandError('Needs a SQLite primary and SQLite DATABASE_REPLICAS (see settings_replica.py)')
+
+        while True:
+            start = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            try:
+                for target in targets:
+                    replica = sqlite3.connect(target['NAME'])
+                    try:
+                        source.backup(replica)
+                        # 记录复制时间，db_router.probe_lag 据此计算延迟
+                        replica.execute(f'PRAGMA user_version = {int(time.time())}')
+                        replica.commit()
+                    finally:
+                        replica.close()
+            finally:
+                source.close()
+            self.stdout.write(f'Synced {len(targets)} replica(s) in {(time.perf_counter() - start) * 1000:.0f}ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,324 @@
+# api/media.py
+"""
+本地图片上传：原图按 SHA-256 内容寻址存放在 MEDIA_ROOT/img/<hh>/<hash>/ 下（相同内容只存一份），
+缩略图和 WebP 变体在有界的进程池中生成，不占用请求线程。
+
+变体 URL 由原图 URL 确定性地推导（见 variant_urls），序列化时无需查询文件系统；
+变体尚未生成时，文件服务视图回退为返回原图（不缓存），并在进程池有空闲时重新提交生成。
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 允许的图片类型：扩展名 -> 文件头
+IMAGE_SIGNATURES = {
+    'jpg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'gif': (b'GIF87a', b'GIF89a'),
+    'webp': (b'RIFF',),
+}
+# 变体名 -> 最长边像素；每个变体同时生成 JPEG 和 WebP
+DEFAULT_VARIANTS = {'thumb': 320, 'medium': 960}
+
+metrics.describe('unitrade_image_uploads_total', 'counter', 'Image uploads by result.')
+metrics.describe('unitrade_image_variant_seconds', 'histogram', 'Time to render all variants of one image.')
+metrics.describe('unitrade_image_pool_pending', 'gauge', 'Images queued or rendering in the thumbnail pool.')
+
+
+def variant_sizes():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def image_root():
+    return Path(settings.MEDIA_ROOT) / 'img'
+
+
+def image_dir(digest):
+    return image_root() / digest[:2] / digest
+
+
+def image_url(digest, name):
+    return f'{settings.MEDIA_URL}img/{digest}/{name}'
+
+
+def digest_from_url(url):
+    """本地上传图片的 URL 中取出哈希；外部 URL（picsum、dicebear）返回 None"""
+    prefix = f'{settings.MEDIA_URL}img/'
+    if not url or not url.startswith(prefix):
+        return None
+    digest = url[len(prefix):].split('/', 1)[0]
+    return digest if len(digest) == 64 else None
+
+
+def variant_urls(url):
+    """{'thumb': {'jpg': ..., 'webp': ...}, ...}；外部图片没有变体，返回 {}"""
+    digest = digest_from_url(url)
+    if digest is None:
+        return {}
+    return {
+        name: {'jpg': image_url(digest, f'{name}.jpg'), 'webp': image_url(digest, f'{name}.webp')}
+        for name in variant_sizes()
+    }
+
+
+def sniff_extension(head):
+    for ext, signatures in IMAGE_SIGNATURES.items():
+        if any(head.startswith(signature) for signature in signatures):
+            if ext == 'webp' and head[8:12] != b'WEBP':
+                continue
+            return ext
+    return None
+
+
+class UploadRejected(Exception):
+    pass
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def store_original(uploaded_file):
+    """
+    边读边计算哈希写入临时文件，再原子地移动到内容寻址路径。
+    返回 (digest, 原图文件名, 是否为重复上传)。
+    """
+    max_bytes = getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+    root = image_root()
+    root.mkdir(parents=True, exist_ok=True)
+    sha = hashlib.sha256()
+    size = 0
+    head = b''
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for chunk in uploaded_file.chunks():
+                if len(head) < 16:
+                    head += chunk[:16]
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f'Image exceeds {max_bytes} bytes')
+                sha.update(chunk)
+                tmp.write(chunk)
+        ext = sniff_extension(head)
+        if ext is None:
+            raise UploadRejected('Unsupported image type')
+
+        digest = sha.hexdigest()
+        target_dir = image_dir(digest)
+        name = f'original.{ext}'
+        if (target_dir / name).exists():
+            os.unlink(tmp_path)
+            return digest, name, True
+        target_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target_dir / name)
+        return digest, name, False
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def render_variants(original, target_dir, sizes):
+    """在进程池中执行：为原图生成各尺寸的 JPEG 和 WebP，先写临时文件再改名"""
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    with Image.open(original) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'L'):
+            source = source.convert('RGB')
+        for name, edge in sizes.items():
+            image = source.copy()
+            image.thumbnail((edge, edge))
+            for ext, options in (('jpg', {'format': 'JPEG', 'quality': 85, 'optimize': True}),
+                                 ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4})):
+                final = os.path.join(target_dir, f'{name}.{ext}')
+                tmp = f'{final}.{os.getpid()}.tmp'
+                image.save(tmp, **options)
+                os.replace(tmp, final)
+    return time.perf_counter() - start
+
+
+class ThumbnailPool:
+    """
+    有界进程池：最多 IMAGE_POOL_WORKERS 个进程，排队 + 执行中的任务不超过
+    IMAGE_POOL_MAX_PENDING 个；满了以后 reserve 返回 False / submit 返回 None，由调用方返回 503。
+    同一张图片同时只渲染一次；渲染失败的图片在 IMAGE_RERENDER_COOLDOWN 秒内不再重试。
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._inflight = {}
+        self._failed = {}
+        self.pending = 0
+        self.peak_pending = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def reserve(self):
+        """预占一个名额；之后必须调用 start 或 release"""
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+        return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def start(self, digest, original_name):
+        """用已预占的名额提交渲染；同一张图片已在渲染时归还名额并返回已有的 future"""
+        target_dir = image_dir(digest)
+        try:
+            executor = self._get_executor()
+            with self._lock:
+                running = self._inflight.get(digest)
+                if running is None:
+                    future = self._inflight[digest] = executor.submit(
+                        render_variants, str(target_dir / original_name), str(target_dir), dict(variant_sizes()))
+        except BaseException:
+            self.release()
+            raise
+        if running is not None:
+            self.release()
+            return running
+        future.add_done_callback(lambda done: self._done(digest, done))
+        return future
+
+    def submit(self, digest, original_name):
+        if not self.reserve():
+            return None
+        return self.start(digest, original_name)
+
+    def recently_failed(self, digest):
+        cooldown = getattr(settings, 'IMAGE_RERENDER_COOLDOWN', 300)
+        with self._lock:
+            failed_at = self._failed.get(digest)
+        return failed_at is not None and time.monotonic() - failed_at < cooldown
+
+    def _done(self, digest, future):
+        with self._lock:
+            self._inflight.pop(digest, None)
+        self.release()
+        error = future.exception()
+        if error is not None:
+            with self._lock:
+                self._failed[digest] = time.monotonic()
+            metrics.inc('unitrade_image_uploads_total', (('result', 'variant_error'),))
+            logger.warning('Rendering image variants failed: %s', error)
+        else:
+            with self._lock:
+                self._failed.pop(digest, None)
+            metrics.observe('unitrade_image_variant_seconds', future.result())
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThumbnailPool(
+                workers=getattr(settings, 'IMAGE_POOL_WORKERS', 2),
+                max_pending=getattr(settings, 'IMAGE_POOL_MAX_PENDING', 32),
+            )
+        return _pool
+
+
+@metrics.register_collector
+def _pool_metrics():
+    if _pool is None:
+        return []
+    return [('unitrade_image_pool_pending', (), _pool.pending)]
+
+
+def variants_ready(digest):
+    return all((image_dir(digest) / f'{variant}.webp').exists() for variant in variant_sizes())
+
+
+def handle_upload(uploaded_file):
+    """
+    保存原图并提交变体生成任务，返回接口响应数据。
+    先预占进程池名额再写原图：进程池已满时直接抛出 PoolSaturated，不留下没有变体的原图。
+    """
+    pool = get_pool()
+    if not pool.reserve():
+        metrics.inc('unitrade_image_uploads_total', (('result', 'saturated'),))
+        raise PoolSaturated()
+    started = False
+    try:
+        digest, name, duplicate = store_original(uploaded_file)
+        if not variants_ready(digest):
+            pool.start(digest, name)
+            started = True
+    finally:
+        if not started:
+            pool.release()
+    metrics.inc('unitrade_image_uploads_total', (('result', 'duplicate' if duplicate else 'stored'),))
+    url = image_url(digest, name)
+    return {
+        'hash': digest,
+        'url': url,
+        'variants': variant_urls(url),
+        'deduplicated': duplicate,
+    }
+
+
+def rerender_missing(digest, original):
+    """
+    文件服务回退为原图时调用：上次渲染失败或进程重启丢了任务的图片，在进程池有空闲时重新生成变体。
+    进程池已满或刚失败过则跳过，下次请求再试。
+    """
+    pool = get_pool()
+    if variants_ready(digest) or pool.recently_failed(digest):
+        return None
+    return pool.submit(digest, original.name)
+
+
+def resolve_file(digest, name):
+    """
+    文件服务：返回 (磁盘路径, 是否回退)。变体尚未生成时回退到原图（是否回退为 True），
+    找不到返回 (None, False)。
+    """
+    if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+        return None, False
+    directory = image_dir(digest)
+    stem, _, ext = name.partition('.')
+    if stem == 'original' or stem in variant_sizes():
+        path = directory / name
+        if path.exists():
+            return path, False
+        for candidate in directory.glob('original.*'):
+            return candidate, True
+    return None, False
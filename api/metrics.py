@@ -0,0 +1,193 @@
+# api/metrics.py
+"""
+进程内指标收集，输出 Prometheus 文本格式。
+
+写入路径无锁：每个线程只写自己的 dict（首次使用时登记到 _stores），
+抓取 /api/metrics/ 时再把所有线程的数据汇总，因此记录一次请求只是几次 dict 操作。
+线程结束时它的 dict 由 weakref.finalize 标记为退役，下次登记或抓取时并入 _retired 并从 _stores
+移除；每个请求一个线程的服务器上，_stores 的长度只与当前存活的线程数有关。
+"""
+import bisect
+import threading
+import weakref
+from collections import defaultdict
+
+# 请求延迟直方图的桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 指标名 -> (类型, 说明)，用于输出 HELP/TYPE 行
+METRIC_HELP = {
+    'unitrade_http_requests_total': ('counter', 'HTTP requests handled, by route and action.'),
+    'unitrade_http_request_duration_seconds': ('histogram', 'HTTP request latency.'),
+    'unitrade_http_sql_queries_total': ('counter', 'SQL queries executed while handling requests.'),
+    'unitrade_http_sql_duration_seconds_total': ('counter', 'Time spent in SQL while handling requests.'),
+    'unitrade_http_response_bytes_total': ('counter', 'Response body bytes sent.'),
+}
+
+_local = threading.local()
+_stores = []
+_stores_lock = threading.Lock()
+_retired = {}  # 已结束线程的数据之和，格式与线程的 dict 相同
+_dead = []  # 线程已结束、尚未并入 _retired 的 dict
+_buckets = {}
+_collectors = []
+
+
+class _Holder:
+    # threading.local 在线程结束时释放它的属性；dict 不能被弱引用，用这个对象触发 finalize
+    __slots__ = ('store', '__weakref__')
+
+
+def _fold(target, store):
+    for key, value in list(store.items()):
+        if key[0] == 'c':
+            target[key] = target.get(key, 0) + value
+        else:
+            merged = target.get(key)
+            if merged is None:
+                target[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    merged[i] += v
+
+
+def _retire_dead():
+    """把已结束线程的数据并入 _retired；调用方持有 _stores_lock"""
+    while _dead:
+        store = _dead.pop()
+        _fold(_retired, store)
+        _stores.remove(store)
+
+
+def _store():
+    holder = getattr(_local, 'holder', None)
+    if holder is None:
+        holder = _local.holder = _Holder()
+        holder.store = {}
+        # finalize 可能在任意线程的垃圾回收中执行，只做不需要加锁的 list.append
+        finalizer = weakref.finalize(holder, _dead.append, holder.store)
+        finalizer.atexit = False
+        # 每个线程只在第一次记录时加锁登记一次
+        with _stores_lock:
+            _retire_dead()
+            _stores.append(holder.store)
+    return holder.store
+
+
+def describe(name, metric_type, help_text):
+    METRIC_HELP[name] = (metric_type, help_text)
+
+
+def inc(name, labels=(), value=1):
+    """计数器累加；labels 为 ((key, value), ...) 元组"""
+    store = _store()
+    key = ('c', name, labels)
+    store[key] = store.get(key, 0) + value
+
+
+def observe(name, value, labels=(), buckets=LATENCY_BUCKETS):
+    """直方图观测；线程内只记录落入的桶，不做累计"""
+    store = _store()
+    key = ('h', name, labels)
+    series = store.get(key)
+    if series is None:
+        _buckets.setdefault(name, buckets)
+        # [各桶计数..., +Inf 桶, sum]
+        series = store[key] = [0] * (len(buckets) + 1) + [0.0]
+    series[bisect.bisect_left(buckets, value)] += 1
+    series[-1] += value
+
+
+def register_collector(collector):
+    """
+    注册抓取时调用的回调，返回 [(name, labels, value), ...]，按 gauge 输出。
+    用于缓存命中率、队列长度等由其他模块维护的状态。
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def record_request(route, action, method, duration, sql_count, sql_time, response_bytes):
+    labels = (('route', route), ('action', action), ('method', method))
+    inc('unitrade_http_requests_total', labels)
+    observe('unitrade_http_request_duration_seconds', duration, labels)
+    inc('unitrade_http_sql_queries_total', labels, sql_count)
+    inc('unitrade_http_sql_duration_seconds_total', labels, sql_time)
+    inc('unitrade_http_response_bytes_total', labels, response_bytes)
+
+
+def snapshot():
+    """汇总所有线程的数据，返回 (counters, histograms)"""
+    totals = {}
+    with _stores_lock:
+        _retire_dead()
+        _fold(totals, _retired)
+        for store in _stores:
+            _fold(totals, store)
+    counters = defaultdict(float)
+    histograms = {}
+    for (kind, name, labels), value in totals.items():
+        if kind == 'c':
+            counters[(name, labels)] += value
+        else:
+            histograms[(name, labels)] = value
+    return counters, histograms
+
+
+def reset():
+    """清空所有线程的数据（测试用）"""
+    with _stores_lock:
+        _retire_dead()
+        _retired.clear()
+        for store in _stores:
+            store.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    counters, histograms = snapshot()
+    families = defaultdict(list)
+
+    for (name, labels), value in sorted(counters.items()):
+        families[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    for (name, labels), series in sorted(histograms.items()):
+        buckets = _buckets[name]
+        cumulative = 0
+        for bound, count in zip(buckets, series):
+            cumulative += count
+            families[name].append(
+                f'{name}_bucket{_format_labels(labels, (("le", bound),))} {cumulative}')
+        cumulative += series[len(buckets)]
+        families[name].append(f'{name}_bucket{_format_labels(labels, (("le", "+Inf"),))} {cumulative}')
+        families[name].append(f'{name}_sum{_format_labels(labels)} {_format_value(series[-1])}')
+        families[name].append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    for collector in _collectors:
+        for name, labels, value in collector():
+            families[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    lines = []
+    for name, samples in families.items():
+        metric_type, help_text = METRIC_HELP.get(name, ('gauge', ''))
+        if help_text:
+            lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,201 @@
+# api/middleware.py
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+from types import SimpleNamespace
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, profiling
+
+logger = logging.getLogger('api.performance')
+
+
+class QueryRecorder:
+    """connection.execute_wrapper 回调：统计 SQL 条数、耗时，并记住最慢的一条"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = (0.0, None)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed > self.slowest[0]:
+                self.slowest = (elapsed, sql)
+
+
+def resolve_route(request, view_func):
+    """返回 (route, action)：DRF 路由名（如 product-detail）和 ViewSet 的 action 名"""
+    match = request.resolver_match
+    route = match.url_name if match and match.url_name else 'unnamed'
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+    else:
+        action = getattr(getattr(view_func, 'view_class', None), '__name__', route)
+    return route, action
+
+
+class PerformanceMiddleware:
+    """
+    记录每个路由/action 的请求数、延迟直方图、SQL 条数与耗时、响应大小，
+    并把超过 PERF_SLOW_REQUEST_MS / PERF_SLOW_QUERY_COUNT 的请求连同最慢 SQL 写入日志。
+    同时支持同步和异步调用，ASGI 下不会迫使异步视图退回线程中执行。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'PERF_SLOW_REQUEST_MS', 500)
+        self.slow_queries = getattr(settings, 'PERF_SLOW_QUERY_COUNT', 50)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+        return self._record(request, response, time.perf_counter() - start, recorder)
+
+    async def __acall__(self, request):
+        # 连接对象按异步上下文共享，异步 ORM 在线程中执行的查询同样会经过这里的 wrapper
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = await self.get_response(request)
+        return self._record(request, response, time.perf_counter() - start, recorder)
+
+    def _record(self, request, response, duration, recorder):
+        route, action = getattr(request, '_perf_route', ('unmatched', 'none'))
+        size = 0 if response.streaming else len(response.content)
+        metrics.record_request(route, action, request.method, duration, recorder.count, recorder.duration, size)
+
+        if duration * 1000 >= self.slow_ms or recorder.count >= self.slow_queries:
+            slowest_time, slowest_sql = recorder.slowest
+            logger.warning(
+                'Slow request %s %s (%s.%s): %.1fms, %d queries (%.1fms SQL); slowest %.1fms: %s',
+                request.method, request.path, route, action, duration * 1000,
+                recorder.count, recorder.duration * 1000, slowest_time * 1000, slowest_sql,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._perf_route = resolve_route(request, view_func)
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    按需分析请求：管理员带 X-Profile 头或 ?_profile=1 时分析该请求，
+    或按 PROFILE_SAMPLE_RATE 抽样。未触发时只做一次 dict 查找和一次字符串查找。
+    异步请求采样的是事件循环线程，异步 ORM 在工作线程中的执行不会出现在调用栈里。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+        self.interval = getattr(settings, 'PROFILE_INTERVAL_MS', 5) / 1000
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = None
+        if self._requested(request):
+            if self._is_admin(request):
+                trigger = 'admin'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sample'
+        if trigger is None:
+            return self.get_response(request)
+        return self._profile(request, trigger)
+
+    async def __acall__(self, request):
+        trigger = None
+        if self._requested(request):
+            if await sync_to_async(self._is_admin)(request):
+                trigger = 'admin'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sample'
+        if trigger is None:
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        timeline = profiling.SQLTimeline(start)
+        sampler = profiling.StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timeline))
+                response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        return self._save(request, response, sampler, timeline, time.perf_counter() - start, trigger)
+
+    @staticmethod
+    def _requested(request):
+        if 'HTTP_X_PROFILE' in request.META:
+            return True
+        # 子串只是快速过滤，再按参数名确认（?x_profile=1 不算）
+        return '_profile=' in request.META.get('QUERY_STRING', '') and '_profile' in request.GET
+
+    @staticmethod
+    def _is_admin(request):
+        # JWT 认证在 DRF 视图里才发生，这里只为触发分析的请求单独校验一次
+        from rest_framework.exceptions import AuthenticationFailed
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        from .views import IsAdminRole
+
+        # 没有 Bearer token 的请求不可能是管理员，不做认证也不查询数据库
+        if not request.META.get('HTTP_AUTHORIZATION', '').startswith('Bearer '):
+            return False
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        if result is None:
+            return False
+        return IsAdminRole().has_permission(SimpleNamespace(user=result[0]), None)
+
+    def _profile(self, request, trigger):
+        start = time.perf_counter()
+        timeline = profiling.SQLTimeline(start)
+        sampler = profiling.StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(timeline))
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        return self._save(request, response, sampler, timeline, time.perf_counter() - start, trigger)
+
+    @staticmethod
+    def _save(request, response, sampler, timeline, duration, trigger):
+        profile_id = profiling.save_profile(request, sampler, timeline, duration, response.status_code, trigger)
+        response['X-Profile-Id'] = profile_id
+        return response
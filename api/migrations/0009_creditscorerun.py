@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditScoreRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(max_length=12)),
+                ('since', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('users_scored', models.IntegerField(default=0)),
+                ('users_changed', models.IntegerField(default=0)),
+                ('timings', models.JSONField(default=dict)),
+            ],
+        ),
+    ]
@@ -1,21 +1,23 @@
 # api/models.py
 import random
-import uuid
 
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
+from . import ids
+
 def generate_user_id():
-    """生成唯一的 ID，如 u + 随机字符，或直接使用 UUID 的一部分"""
-    return "u" + uuid.uuid4().hex[:8]
+    """生成用户 ID：u + 时间有序的编码（见 api/ids.py），ID_SCHEME='legacy' 时为旧的随机格式；不查询数据库"""
+    return ids.new_id("u")
 
 def get_random_avatar():
     # 使用 Dicebear 生成基于随机字符串的头像
     seed = "".join(random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=8))
     return f"https://api.dicebear.com/7.x/avataaars/svg?seed={seed}"
 
-class User(AbstractUser):
+class User(ids.GeneratedIdMixin, AbstractUser):
+    ID_PREFIX = "u"
     # 使用自定义 ID 以匹配 mock 中的 'u1', 'u2'
     id = models.CharField(primary_key=True, max_length=20, default=generate_user_id, editable=False)
     avatar = models.URLField(default=get_random_avatar)
@@ -27,12 +29,14 @@ class User(AbstractUser):
     wishlist = models.ManyToManyField('Product', blank=True, related_name='wishlisted_by')
     following = models.ManyToManyField('self', symmetrical=False, blank=True, related_name='followers')
     wallet_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)  # 新增钱包字段
+    updated_at = models.DateTimeField(auto_now=True)  # 用于 ETag / Last-Modified
 
 def generate_product_id():
-    """生成唯一的产品 ID，如 p + 随机字符"""
-    return "p" + uuid.uuid4().hex[:8]
+    """生成产品 ID：p + 时间有序的编码；插入时冲突由 ids.GeneratedIdMixin 重试"""
+    return ids.new_id("p")
 
-class Product(models.Model):
+class Product(ids.GeneratedIdMixin, models.Model):
+    ID_PREFIX = "p"
     id = models.CharField(primary_key=True, max_length=50, default=generate_product_id, editable=False)
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
     buyer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='purchases')
@@ -45,6 +49,8 @@ class Product(models.Model):
     view_count = models.IntegerField(default=0)
     tags = models.JSONField(default=list) # 存储 ['tech', 'audio'] 等
     created_at = models.DateTimeField(auto_now_add=True)
+    # 浏览量通过 update() 单独累加，不会刷新 updated_at，因此详情页 ETag 不受浏览量影响
+    updated_at = models.DateTimeField(auto_now=True)
 
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_msgs')
@@ -57,7 +63,115 @@ class Message(models.Model):
 class Review(models.Model):
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_as_seller')
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_as_buyer')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # 软引用：商品归档（见 api/archive.py）后评价保留，product_id 指向 ArchivedProduct 中的同一 id；
+    # 其他方式删除商品时由 archive.py 中的 post_delete 信号删除评价
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False)
     rating = models.IntegerField()
     content = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class SavedSearch(models.Model):
+    """买家保存的搜索；新商品上架后由后台任务匹配并发送系统消息（见 api/saved_searches.py）"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    keywords = models.CharField(max_length=200, blank=True)
+    category = models.CharField(max_length=50, blank=True)  # 空表示任意分类
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    tags = models.JSONField(default=list, blank=True)  # 商品须包含全部标签
+    terms = models.JSONField(default=list)  # keywords 的分词结果，商品须包含全部词
+    anchor = models.CharField(max_length=100, db_index=True)  # 反向索引键：商品包含该词时才是候选
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedProduct(models.Model):
+    """已结束（RECEIVED / BANNED）且长期未变化的商品，由 manage.py archive_data 从 Product 移入，列与 Product 相同"""
+    id = models.CharField(primary_key=True, max_length=50)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    buyer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    description = models.TextField()
+    category = models.CharField(max_length=50)
+    image = models.URLField(max_length=500)
+    status = models.CharField(max_length=10)
+    view_count = models.IntegerField(default=0)
+    tags = models.JSONField(default=list)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedMessage(models.Model):
+    """超过保留期的聊天记录，保留原 id"""
+    id = models.BigIntegerField(primary_key=True)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+    msg_type = models.CharField(max_length=10, default='CHAT')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+class Job(models.Model):
+    """数据库后台任务队列（见 api/jobs.py），由 manage.py run_jobs 执行"""
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, default='PENDING')  # PENDING / RUNNING / DONE / FAILED
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)  # 重试时推迟到退避结束
+    # 相同 key 的任务只会入队一次
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    claim = models.CharField(max_length=32, blank=True)  # 取走该任务的 worker 批次
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'], name='api_job_status_run_at')]
+
+class CreditScoreRun(models.Model):
+    """信用分批量计算的运行记录（见 api/credit.py）；增量模式从上一次成功运行的开始时间算起"""
+    mode = models.CharField(max_length=12)  # 'full' / 'incremental'
+    since = models.DateTimeField(null=True, blank=True)  # 增量模式的事件起点
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    users_scored = models.IntegerField(default=0)
+    users_changed = models.IntegerField(default=0)
+    timings = models.JSONField(default=dict)  # 各阶段耗时（秒）
+
+class CacheInvalidation(models.Model):
+    """进程内对象缓存（见 api/objcache.py）的失效记录：各进程定期读取，删除其他进程修改过的缓存行"""
+    model = models.CharField(max_length=20)  # 'product' / 'user'
+    object_id = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class ProductFingerprint(models.Model):
+    """商品标题 + 描述的 MinHash 签名，用于发现近似重复的商品（见 api/duplicates.py）"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    signature = models.BinaryField()  # 64 个 32 位最小哈希值
+    duplicate_of = models.CharField(max_length=50, blank=True)  # 发布时判定为其近似重复的商品 id
+    created_at = models.DateTimeField(auto_now_add=True)
+
+class ProductFingerprintBand(models.Model):
+    """LSH 分段索引：签名每 4 个值一段，每段的哈希一行；任一段相同的商品是近似重复的候选"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')  # 冗余：按卖家查找候选
+    key = models.BigIntegerField()  # 段号和段内 4 个值的哈希
+
+    class Meta:
+        indexes = [models.Index(fields=['seller', 'key'], name='api_fpband_seller_key'),
+                   models.Index(fields=['key'], name='api_fpband_key')]
+
+class FollowSuggestion(models.Model):
+    """推荐关注：批量计算的每个用户前 K 个推荐（见 api/follow_suggestions.py）"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    rank = models.SmallIntegerField()  # 从 0 开始
+    score = models.FloatField()
+    mutual_follows = models.IntegerField(default=0)  # 你关注的人中有多少关注了 TA
+    reason = models.CharField(max_length=10)  # 'follows'：共同关注为主；'sellers'：与你买过 / 收藏过的卖家相似
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'rank'], name='api_followsuggestion_user_rank')]
@@ -0,0 +1,258 @@
+# api/objcache.py
+"""
+Product / User 的进程内对象缓存：读穿透、容量有上限的 LRU。
+
+- 读取：ProductViewSet / UserViewSet 只读请求的 get_object，以及序列化器中按主键查找关联对象
+  （CachedPrimaryKeyRelatedField、identity.related(cached=True)）在请求的身份映射（api/identity.py）
+  未命中时查缓存。缓存中保存的是 CACHED_COLUMNS 列的字段值元组：User 只保存接口输出和 ETag
+  用到的列，密码哈希等不进入进程内缓存，取出的实例中其他列为延迟加载。
+  每次取出都构造新的模型实例，调用方修改实例（如 retrieve 中的 view_count += 1）不会影响缓存。
+  未命中时读主库：从库可能落后于失效信号，读到的旧行会一直留在缓存中直到过期。
+- 写入：写请求（purchase / toggle_status / withdraw 等 POST action）的 get_object 不走缓存；
+  Product / User 的 save() 和 delete() 通过信号立即删除本进程中的缓存行，事务提交后再删除一次，
+  并在 api_cacheinvalidation 表中写一条失效记录；save(update_fields=...) 只涉及未缓存的列（如登录时的
+  last_login、修改密码）时不失效也不写记录。绕过信号的 update() 需要调用 invalidate()
+  （如 api/credit.py 写回信用分）；浏览量的批量累加不发失效信号，由 OBJECT_CACHE_TTL_SECONDS 兜底。
+- 跨进程失效：每个进程最多每 OBJECT_CACHE_SYNC_SECONDS 秒读一次新的失效记录，其他进程中的修改
+  最多滞后这么久。读取时多回看 OBJECT_CACHE_SYNC_OVERLAP_SECONDS 秒，容忍事务提交顺序和服务器
+  时钟的偏差。失效记录由 run_jobs 的维护循环清理；超过保留期未同步的进程清空整个缓存。
+- 指标：命中 / 未命中 / 过期、容量淘汰和失效删除的条数、命中率、距上次同步的秒数。
+"""
+import copy
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, models, router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics
+from .db_router import PRIMARY
+from .models import User, Product, CacheInvalidation
+
+logger = logging.getLogger(__name__)
+
+LABELS = {Product: 'product', User: 'user'}
+# 缓存的列（None 为全部列）：序列化器输出的字段、ETag 用的 updated_at
+CACHED_COLUMNS = {
+    Product: None,
+    User: ('id', 'username', 'avatar', 'role', 'credit_score', 'bio', 'is_banned', 'date_joined',
+           'wallet_balance', 'updated_at'),
+}
+
+metrics.describe('unitrade_object_cache_requests_total', 'counter',
+                 'Object cache lookups, by model and result (hit / miss / expired).')
+metrics.describe('unitrade_object_cache_evictions_total', 'counter',
+                 'Object cache entries dropped, by model and reason (capacity / local / remote / reset).')
+metrics.describe('unitrade_object_cache_entries', 'gauge', 'Rows held in the object cache, by model.')
+metrics.describe('unitrade_object_cache_hit_ratio', 'gauge', 'Object cache hits / lookups since start, by model.')
+metrics.describe('unitrade_object_cache_sync_age_seconds', 'gauge',
+                 'Seconds since invalidations from other processes were last read (bounds staleness).')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enabled():
+    return _setting('OBJECT_CACHE_ENABLED', False)
+
+
+class ModelLayout:
+    """缓存的列（按模型的列顺序，from_db 要求），以及取出时需要复制的可变（JSON）列"""
+
+    def __init__(self, model, columns=None):
+        self.model = model
+        fields = [field for field in model._meta.concrete_fields
+                  if columns is None or field.attname in columns or field.name in columns]
+        self.attnames = [field.attname for field in fields]
+        # update_fields 可能用字段名或列属性名
+        self.names = frozenset(self.attnames) | frozenset(field.name for field in fields)
+        self.mutable = [i for i, field in enumerate(fields) if isinstance(field, models.JSONField)]
+
+    def covers(self, update_fields):
+        """这次保存是否可能改变缓存的列"""
+        return update_fields is None or not self.names.isdisjoint(update_fields)
+
+    def build(self, values):
+        if self.mutable:
+            values = list(values)
+            for i in self.mutable:
+                values[i] = copy.deepcopy(values[i])
+        # 与普通查询一样由路由选择实例所在的库，只读请求中后续的关联查询仍走从库
+        return self.model.from_db(router.db_for_read(self.model), self.attnames, values)
+
+
+class ObjectCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._entries = OrderedDict()  # (label, pk) -> (字段值元组, 载入时间)
+        self._layouts = {model: ModelLayout(model, CACHED_COLUMNS[model]) for model in LABELS}
+        # 每次删除缓存行时加一；载入期间发生过删除的行不放入缓存，避免写回旧数据
+        self._generation = 0
+        self._next_sync = 0.0
+        self._synced_at = None  # 上次成功同步的 (monotonic, 数据库时间基准)
+        self._seen = {}  # 同步窗口内已处理的失效记录 id -> created_at
+        self._stats = Counter()
+
+    def reset(self):
+        """清空缓存、同步状态和统计（测试用）"""
+        self.clear()
+        with self._lock:
+            self._next_sync, self._synced_at, self._seen = 0.0, None, {}
+            self._stats.clear()
+
+    def clear(self, reason='reset'):
+        with self._lock:
+            self._generation += 1
+            for label, _ in self._entries:
+                self._stats['evictions', label, reason] += 1
+            self._entries.clear()
+
+    def get(self, model, pk):
+        """返回 pk 对应的新实例，不存在时返回 None"""
+        label = LABELS[model]
+        key = (label, str(pk))
+        self.sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < _setting('OBJECT_CACHE_TTL_SECONDS', 300):
+                self._entries.move_to_end(key)
+                self._stats['requests', label, 'hit'] += 1
+                return self._layouts[model].build(entry[0])
+            self._stats['requests', label, 'miss' if entry is None else 'expired'] += 1
+            generation = self._generation
+
+        layout = self._layouts[model]
+        values = model._base_manager.using(PRIMARY).filter(pk=key[1]).values_list(*layout.attnames).first()
+        if values is None:
+            return None
+        with self._lock:
+            if self._generation == generation:
+                self._entries[key] = (values, now)
+                self._entries.move_to_end(key)
+                limit = _setting('OBJECT_CACHE_MAX_ENTRIES', 20000)
+                while len(self._entries) > limit:
+                    (evicted, _), _ = self._entries.popitem(last=False)
+                    self._stats['evictions', evicted, 'capacity'] += 1
+        return layout.build(values)
+
+    def _drop(self, keys, reason):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._stats['evictions', key[0], reason] += 1
+
+    def invalidate(self, model, pks):
+        """删除本进程中的缓存行；事务提交后再删除一次，并写入失效记录通知其他进程"""
+        if not enabled():
+            return
+        label = LABELS[model]
+        keys = [(label, str(pk)) for pk in pks]
+        if not keys:
+            return
+        self._drop(keys, 'local')
+
+        def broadcast():
+            # 提交前被其他线程重新载入的旧行在这里删除
+            self._drop(keys, 'local')
+            try:
+                CacheInvalidation.objects.bulk_create(
+                    [CacheInvalidation(model=label, object_id=pk) for _, pk in keys], batch_size=500)
+            except DatabaseError:
+                logger.exception('Failed to record object cache invalidation for %d %s rows', len(keys), label)
+        transaction.on_commit(broadcast)
+
+    def sync(self):
+        """读取其他进程写入的失效记录；距上次不足 OBJECT_CACHE_SYNC_SECONDS 秒时直接返回"""
+        now = time.monotonic()
+        if now < self._next_sync or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = now + _setting('OBJECT_CACHE_SYNC_SECONDS', 1)
+            started = timezone.now()
+            synced = self._synced_at
+            if synced is None or now - synced[0] > _setting('OBJECT_CACHE_LOG_RETENTION_SECONDS', 3600):
+                # 首次同步，或太久未同步（期间的失效记录可能已被清理）：从空缓存开始
+                if synced is not None:
+                    self.clear()
+                self._seen = {}
+                self._synced_at = (now, started)
+                return
+            since = synced[1] - timedelta(seconds=_setting('OBJECT_CACHE_SYNC_OVERLAP_SECONDS', 5))
+            try:
+                rows = list(CacheInvalidation.objects.using(PRIMARY).filter(created_at__gte=since)
+                            .values_list('id', 'model', 'object_id', 'created_at'))
+            except DatabaseError as exc:
+                logger.warning('Object cache sync failed: %s', exc)
+                return
+            seen = {pk: created for pk, created in self._seen.items() if created >= since}
+            keys = []
+            for pk, label, object_id, created in rows:
+                if pk not in seen:
+                    seen[pk] = created
+                    keys.append((label, object_id))
+            self._seen = seen
+            if keys:
+                self._drop(keys, 'remote')
+            self._synced_at = (now, started)
+        finally:
+            self._sync_lock.release()
+
+    def collect(self):
+        with self._lock:
+            stats = dict(self._stats)
+            entries = Counter(label for label, _ in self._entries)
+        samples = []
+        for label in LABELS.values():
+            lookups = 0
+            for result in ('hit', 'miss', 'expired'):
+                count = stats.get(('requests', label, result), 0)
+                lookups += count
+                samples.append(('unitrade_object_cache_requests_total',
+                                (('model', label), ('result', result)), count))
+            for reason in ('capacity', 'local', 'remote', 'reset'):
+                samples.append(('unitrade_object_cache_evictions_total',
+                                (('model', label), ('reason', reason)), stats.get(('evictions', label, reason), 0)))
+            samples.append(('unitrade_object_cache_entries', (('model', label),), entries[label]))
+            hits = stats.get(('requests', label, 'hit'), 0)
+            samples.append(('unitrade_object_cache_hit_ratio', (('model', label),),
+                            round(hits / lookups, 4) if lookups else 0.0))
+        if self._synced_at is not None:
+            samples.append(('unitrade_object_cache_sync_age_seconds', (),
+                            round(time.monotonic() - self._synced_at[0], 3)))
+        return samples
+
+
+cache = ObjectCache()
+metrics.register_collector(cache.collect)
+
+
+def get(model, pk):
+    return cache.get(model, pk)
+
+
+def purge_log():
+    """删除超过 OBJECT_CACHE_LOG_RETENTION_SECONDS 秒的失效记录，返回删除的行数"""
+    cutoff = timezone.now() - timedelta(seconds=_setting('OBJECT_CACHE_LOG_RETENTION_SECONDS', 3600))
+    deleted, _ = CacheInvalidation.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+@receiver(post_save, sender=Product, dispatch_uid='objcache_product_saved')
+@receiver(post_save, sender=User, dispatch_uid='objcache_user_saved')
+@receiver(post_delete, sender=Product, dispatch_uid='objcache_product_deleted')
+@receiver(post_delete, sender=User, dispatch_uid='objcache_user_deleted')
+def _row_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    # 新建的行不可能已在任何进程的缓存中（缓存不记录不存在的主键）；
+    # 只保存了未缓存的列时缓存中的值仍然正确，不必失效，也不必在热表的写入之外再写一条失效记录
+    if not created and cache._layouts[sender].covers(update_fields):
+        cache.invalidate(sender, [instance.pk])
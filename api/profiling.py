@@ -0,0 +1,144 @@
+# api/profiling.py
+"""
+按需采样分析单个请求。
+
+管理员通过请求头 ``X-Profile: 1`` 或查询参数 ``?_profile=1`` 触发，
+或按 PROFILE_SAMPLE_RATE 随机抽样一部分流量。分析期间由后台线程周期性读取
+请求线程的调用栈 (sys._current_frames)，同时记录 SQL 时间线；结果以
+collapsed stacks 格式（可直接交给 flamegraph.pl / speedscope）和 JSON 元数据
+保存在 PROFILE_DIR 下，由管理员接口列出和下载。只保留最新的 PROFILE_MAX_COUNT 个，
+每次保存后删除更早的。
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+class StackSampler:
+    """后台线程按固定间隔采样目标线程的调用栈，累计为 collapsed stacks"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class SQLTimeline:
+    """connection.execute_wrapper 回调：记录每条 SQL 相对请求开始的起止时间"""
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.entries.append({
+                'alias': context['connection'].alias,
+                'startMs': round((start - self.origin) * 1000, 3),
+                'durationMs': round((end - start) * 1000, 3),
+                'sql': sql,
+            })
+
+
+def save_profile(request, sampler, timeline, duration, status_code, trigger):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # 时间（精确到纳秒）在前，同一秒内保存的结果也按名字排序即按时间排序
+    seconds, nanos = divmod(time.time_ns(), 10 ** 9)
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(seconds))}-{nanos:09d}{uuid.uuid4().hex[:4]}"
+
+    with (directory / f'{profile_id}.collapsed').open('w', encoding='utf-8') as fp:
+        for stack, count in sampler.stacks.most_common():
+            fp.write(f'{stack} {count}\n')
+
+    meta = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': status_code,
+        'trigger': trigger,
+        'durationMs': round(duration * 1000, 3),
+        'samples': sampler.samples,
+        'intervalMs': sampler.interval * 1000,
+        'sqlCount': len(timeline.entries),
+        'sqlMs': round(sum(entry['durationMs'] for entry in timeline.entries), 3),
+        'sql': timeline.entries,
+    }
+    with (directory / f'{profile_id}.json').open('w', encoding='utf-8') as fp:
+        json.dump(meta, fp, ensure_ascii=False, indent=2)
+    prune(directory)
+    return profile_id
+
+
+def prune(directory=None):
+    """删除超出 PROFILE_MAX_COUNT 的旧结果；文件名以时间开头，按名字排序即按时间排序"""
+    directory = directory or profile_dir()
+    keep = getattr(settings, 'PROFILE_MAX_COUNT', 200)
+    removed = 0
+    for path in sorted(directory.glob('*.json'), reverse=True)[keep:]:
+        for stale in (path, path.with_suffix('.collapsed')):
+            try:
+                stale.unlink()
+            except FileNotFoundError:
+                pass  # 另一个进程同时在清理
+        removed += 1
+    return removed
+
+
+def list_profiles():
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    profiles = []
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        with path.open(encoding='utf-8') as fp:
+            meta = json.load(fp)
+        meta.pop('sql', None)
+        profiles.append(meta)
+    return profiles
+
+
+def profile_path(profile_id, fmt):
+    """返回某次分析结果的文件路径；profile_id 只允许文件名字符，防止路径穿越"""
+    if fmt not in ('collapsed', 'json') or not profile_id or not all(c.isalnum() or c in '-T' for c in profile_id):
+        return None
+    path = profile_dir() / f'{profile_id}.{fmt}'
+    return path if path.exists() else None
@@ -0,0 +1,34 @@
+# api/renderers.py
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时退回标准库 json
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    使用 orjson 输出与 DRF JSONRenderer 字节一致的 JSON（紧凑格式、不转义非 ASCII）。
+    orjson 不能原生处理的类型（Decimal、惰性翻译字符串等）交给 DRF 的 JSONEncoder.default；
+    需要缩进（可浏览 API）或 orjson 不可用时直接走父类。
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # datetime 交给 DRF encoder，保持毫秒精度和 'Z' 后缀的格式
+            ret = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:  # orjson.JSONEncodeError，如超过 64 位的整数
+            return super().render(data, accepted_media_type, renderer_context)
+        # 与 JSONRenderer 一致：转义 JavaScript 中非法的 U+2028 / U+2029
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+_encoder = JSONEncoder()
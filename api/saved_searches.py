@@ -0,0 +1,145 @@
+# api/saved_searches.py
+"""
+保存的搜索与新商品匹配（反向索引）。
+
+不为每个保存的搜索轮询商品列表，而是在商品上架时反过来找可能匹配它的搜索：
+
+- 每个搜索保存时选出一个锚点词（anchor）：关键词中最长的词，没有关键词时用标签
+  （tag:xxx）、分类（cat:xxx），都没有时为 '*'。锚点列有索引。
+- 新商品上架时（ProductViewSet.perform_create 入队 match_saved_searches 任务，见 api/tasks.py），
+  提取商品的全部词（标题和描述的分词、tag:xxx、cat:xxx、'*'），用一条 anchor IN (...)
+  查询取出候选搜索，同时在 SQL 中过滤分类和价格区间；再在内存中校验全部关键词和标签。
+  每个商品只需检查锚点出现在商品中的少量搜索，与保存的搜索总数无关。
+- 匹配到的用户（不含卖家本人，同一用户多个搜索只通知一次）用 bulk_create 一次写入系统消息。
+- 批量上架（见 api/listings.py）时 matches_many() 用一组 anchor IN 查询取出整批商品的候选，
+  分类和价格改在内存中校验；每个用户只收到一条列出所有匹配商品的消息。
+
+分词：英文和数字按单词切分（casefold）；中文没有空格，按单字和相邻两字切分，
+关键词中的中文只用两字词（单字的中文关键词用单字），近似子串匹配。
+"""
+import re
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .fastpath import IN_BATCH_SIZE
+from .models import SavedSearch
+
+WORD_RE = re.compile(r'[^\W_]+')
+CJK_RE = re.compile(r'[㐀-鿿豈-﫿]+')
+ANY = '*'
+ANCHOR_MAX_LENGTH = SavedSearch._meta.get_field('anchor').max_length
+
+
+def _split(text):
+    """返回 (单词, 中文片段)"""
+    text = text.casefold()
+    runs = CJK_RE.findall(text)
+    words = WORD_RE.findall(CJK_RE.sub(' ', text))
+    return words, runs
+
+
+def keyword_terms(text):
+    """关键词必须全部出现的词"""
+    words, runs = _split(text)
+    terms = set(words)
+    for run in runs:
+        terms.update([run] if len(run) == 1 else (run[i:i + 2] for i in range(len(run) - 1)))
+    return sorted(terms)
+
+
+def document_terms(text):
+    """商品文本中的全部词（中文包含单字和两字词）"""
+    words, runs = _split(text)
+    terms = set(words)
+    for run in runs:
+        terms.update(run)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def normalize_tags(tags):
+    return sorted({tag.strip().casefold() for tag in tags or () if isinstance(tag, str) and tag.strip()})
+
+
+def prepare(search):
+    """保存前计算 terms 和 anchor"""
+    search.tags = normalize_tags(search.tags)
+    search.terms = keyword_terms(search.keywords)
+    anchors = [term for term in search.terms if len(term) <= ANCHOR_MAX_LENGTH]
+    if anchors:
+        # 越长的词通常越少见，候选越少
+        search.anchor = max(anchors, key=lambda term: (len(term), term))
+    elif search.tags:
+        search.anchor = f'tag:{search.tags[0]}'
+    elif search.category:
+        search.anchor = f'cat:{search.category}'
+    else:
+        search.anchor = ANY
+    return search
+
+
+def product_terms(product):
+    terms = document_terms(f'{product.title} {product.description}')
+    terms.update(f'tag:{tag}' for tag in normalize_tags(product.tags))
+    terms.add(f'cat:{product.category}')
+    terms.add(ANY)
+    return terms
+
+
+def candidates(product, terms=None):
+    """锚点出现在商品中、且分类和价格区间符合的搜索"""
+    terms = sorted(product_terms(product) if terms is None else terms)
+    conditions = (
+        (Q(category='') | Q(category=product.category))
+        & (Q(min_price__isnull=True) | Q(min_price__lte=product.price))
+        & (Q(max_price__isnull=True) | Q(max_price__gte=product.price))
+    )
+    found = []
+    for start in range(0, len(terms), IN_BATCH_SIZE):
+        found.extend(SavedSearch.objects.filter(conditions, anchor__in=terms[start:start + IN_BATCH_SIZE])
+                     .exclude(user_id=product.seller_id)
+                     .only('id', 'user_id', 'keywords', 'category', 'tags', 'terms'))
+    return found
+
+
+def _has_terms(search, terms):
+    return all(term in terms for term in search.terms) and all(f'tag:{tag}' in terms for tag in search.tags)
+
+
+def matches(product):
+    """返回匹配该商品的搜索列表"""
+    terms = product_terms(product)
+    return [search for search in candidates(product, terms) if _has_terms(search, terms)]
+
+
+def matches_many(products):
+    """返回 {商品 id: [匹配的搜索, ...]}；整批商品的候选按锚点一次取出"""
+    terms = {product.pk: product_terms(product) for product in products}
+    anchors = sorted(set().union(*terms.values())) if terms else []
+    by_anchor = defaultdict(list)
+    for start in range(0, len(anchors), IN_BATCH_SIZE):
+        for search in (SavedSearch.objects.filter(anchor__in=anchors[start:start + IN_BATCH_SIZE])
+                       .only('id', 'user_id', 'keywords', 'category', 'min_price', 'max_price', 'tags', 'terms',
+                             'anchor')):
+            by_anchor[search.anchor].append(search)
+    result = {}
+    for product in products:
+        words = terms[product.pk]
+        result[product.pk] = [
+            search for anchor in words for search in by_anchor.get(anchor, ())
+            if search.user_id != product.seller_id
+            and (not search.category or search.category == product.category)
+            and (search.min_price is None or search.min_price <= product.price)
+            and (search.max_price is None or search.max_price >= product.price)
+            and _has_terms(search, words)
+        ]
+    return result
+
+
+def describe(search):
+    parts = [search.keywords.strip()] if search.keywords.strip() else []
+    if search.category:
+        parts.append(search.category)
+    parts.extend(f'#{tag}' for tag in search.tags)
+    return ' / '.join(parts) or '全部商品'
@@ -1,9 +1,63 @@
 # api/serializers.py
 from rest_framework import serializers
-from .models import User, Product, Message, Review
+from django.conf import settings
+from .models import User, Product, Message, Review, SavedSearch
+from . import identity, media, objcache, saved_searches
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 
+class SparseFieldsMixin:
+    """接受 fields=[...] 参数，只保留列出的字段（稀疏字段集，见 api/fieldsets.py）"""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """按主键查找 Product / User 时经过请求的身份映射（见 api/identity.py），未命中再查进程内对象缓存"""
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        if model not in objcache.LABELS:
+            return super().to_internal_value(data)
+        if isinstance(data, bool) or not isinstance(data, (str, int)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = identity.get(model, data, cached=True)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+def prefetch_related_ids(serializer, rows):
+    """登记各行中 CachedPrimaryKeyRelatedField 的主键：同一模型的查找在第一次取用时合并为一条查询"""
+    by_model = {}
+    for name, field in serializer.fields.items():
+        if isinstance(field, CachedPrimaryKeyRelatedField) and not field.read_only:
+            by_model.setdefault(field.get_queryset().model, []).append(name)
+    for model, names in by_model.items():
+        identity.prefetch(model, [row.get(name) for row in rows if hasattr(row, 'get') for name in names
+                                  if isinstance(row.get(name), (str, int))])
+
+
+class BatchedListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            prefetch_related_ids(self.child, data)
+        return super().to_internal_value(data)
+
+
+class BatchedLookupMixin:
+    """校验前登记关联主键（见 prefetch_related_ids），many=True 时整批登记"""
+
+    def to_internal_value(self, data):
+        prefetch_related_ids(self, [data])
+        return super().to_internal_value(data)
+
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
         data = super().validate(attrs)
@@ -30,16 +84,17 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     creditScore = serializers.IntegerField(source='credit_score', required=False)
     isBanned = serializers.BooleanField(source='is_banned', required=False)
     walletBalance = serializers.FloatField(source='wallet_balance', read_only=True)  # 余额建议只读，通过提现/交易逻辑修改
     joinDate = serializers.DateTimeField(source='date_joined', read_only=True)
+    avatarVariants = serializers.SerializerMethodField()  # 本地上传头像的缩略图 URL
 
     class Meta:
         model = User
         fields = [
-            'id', 'username', 'password', 'avatar', 'role',
+            'id', 'username', 'password', 'avatar', 'avatarVariants', 'role',
             'creditScore', 'bio', 'isBanned', 'joinDate',
             'wishlist', 'following', 'walletBalance'
         ]
@@ -51,47 +106,104 @@ class UserSerializer(serializers.ModelSerializer):
             'bio': {'required': False},
         }
 
+    def get_avatarVariants(self, obj):
+        return media.variant_urls(obj.avatar)
+
     def create(self, validated_data):
         # 使用 create_user 确保密码被正确哈希加密
         user = User.objects.create_user(**validated_data)
         return user
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # sellerId 在创建时自动设置为当前用户，因此设为只读
     sellerId = serializers.PrimaryKeyRelatedField(source='seller', read_only=True)
     # 修复：允许 buyer 为空，解决未售出商品详情页报错导致的 "Product not found"
-    buyerId = serializers.PrimaryKeyRelatedField(source='buyer', queryset=User.objects.all(), required=False,
-                                                 allow_null=True)
+    buyerId = CachedPrimaryKeyRelatedField(source='buyer', queryset=User.objects.all(), required=False,
+                                           allow_null=True)
     viewCount = serializers.IntegerField(source='view_count', read_only=True)
     createdAt = serializers.DateTimeField(source='created_at', read_only=True)
+    # 本地上传图片的缩略图 / WebP 变体 URL，外部图片为 {}
+    imageVariants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'sellerId', 'buyerId', 'title', 'price', 'description', 'category', 'image', 'status',
-                  'viewCount', 'createdAt', 'tags']
+        fields = ['id', 'sellerId', 'buyerId', 'title', 'price', 'description', 'category', 'image',
+                  'imageVariants', 'status', 'viewCount', 'createdAt', 'tags']
+        list_serializer_class = BatchedListSerializer  # 批量发布时各行的 buyerId 一条查询
+
+    def get_imageVariants(self, obj):
+        return media.variant_urls(obj.image)
 
 
-class MessageSerializer(serializers.ModelSerializer):
-    senderId = serializers.PrimaryKeyRelatedField(source='sender', queryset=User.objects.all())
-    receiverId = serializers.PrimaryKeyRelatedField(source='receiver', queryset=User.objects.all())
+class MessageSerializer(BatchedLookupMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    senderId = CachedPrimaryKeyRelatedField(source='sender', queryset=User.objects.all())
+    receiverId = CachedPrimaryKeyRelatedField(source='receiver', queryset=User.objects.all())
     type = serializers.CharField(source='msg_type', default='CHAT')
 
     class Meta:
         model = Message
         fields = ['id', 'senderId', 'receiverId', 'content', 'timestamp', 'is_read', 'type']
+        list_serializer_class = BatchedListSerializer
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(BatchedLookupMixin, SparseFieldsMixin, serializers.ModelSerializer):
     # 修复：添加 queryset 参数解决 ImproperlyConfigured 错误
-    sellerId = serializers.PrimaryKeyRelatedField(source='seller', queryset=User.objects.all())
-    buyerId = serializers.PrimaryKeyRelatedField(source='buyer', queryset=User.objects.all())
-    productId = serializers.PrimaryKeyRelatedField(source='product', queryset=Product.objects.all())
+    sellerId = CachedPrimaryKeyRelatedField(source='seller', queryset=User.objects.all())
+    buyerId = CachedPrimaryKeyRelatedField(source='buyer', queryset=User.objects.all())
+    productId = CachedPrimaryKeyRelatedField(source='product', queryset=Product.objects.all())
 
-    # 额外修复：返回买家用户名，解决前端评价区显示 User_u1 的问题
-    buyerName = serializers.ReadOnlyField(source='buyer.username')
+    # 额外修复：返回买家用户名，解决前端评价区显示 User_u1 的问题；买家经过身份映射和对象缓存取
+    buyerName = serializers.SerializerMethodField()
     createdAt = serializers.DateTimeField(source='created_at', read_only=True)
 
     class Meta:
         model = Review
-        fields = ['id', 'sellerId', 'buyerId', 'buyerName', 'productId', 'rating', 'content', 'createdAt']
\ No newline at end of file
+        fields = ['id', 'sellerId', 'buyerId', 'buyerName', 'productId', 'rating', 'content', 'createdAt']
+        list_serializer_class = BatchedListSerializer
+
+    def get_buyerName(self, obj):
+        return identity.related(obj, 'buyer', cached=True).username
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    minPrice = serializers.DecimalField(source='min_price', max_digits=10, decimal_places=2, required=False,
+                                        allow_null=True)
+    maxPrice = serializers.DecimalField(source='max_price', max_digits=10, decimal_places=2, required=False,
+                                        allow_null=True)
+    tags = serializers.ListField(child=serializers.CharField(max_length=50), required=False, max_length=10)
+    createdAt = serializers.DateTimeField(source='created_at', read_only=True)
+
+    class Meta:
+        model = SavedSearch
+        fields = ['id', 'keywords', 'category', 'minPrice', 'maxPrice', 'tags', 'createdAt']
+        extra_kwargs = {'keywords': {'required': False}, 'category': {'required': False}}
+
+    def validate(self, attrs):
+        merged = {field: getattr(self.instance, field, None) for field in
+                  ('keywords', 'category', 'min_price', 'max_price', 'tags')}
+        merged.update(attrs)
+        if not (merged['keywords'] or '').strip() and not merged['category'] and not merged['tags'] \
+                and merged['min_price'] is None and merged['max_price'] is None:
+            raise serializers.ValidationError('至少需要一个搜索条件')
+        if merged['min_price'] is not None and merged['max_price'] is not None \
+                and merged['min_price'] > merged['max_price']:
+            raise serializers.ValidationError('最低价不能高于最高价')
+        if self.instance is None:
+            user = self.context['request'].user
+            limit = getattr(settings, 'SAVED_SEARCH_MAX_PER_USER', 20)
+            if SavedSearch.objects.filter(user=user).count() >= limit:
+                raise serializers.ValidationError(f'最多保存 {limit} 个搜索')
+        return attrs
+
+    # 保存前计算反向索引的锚点词（见 api/saved_searches.py）
+    def create(self, validated_data):
+        search = saved_searches.prepare(SavedSearch(**validated_data))
+        search.save()
+        return search
+
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        saved_searches.prepare(instance).save()
+        return instance
@@ -0,0 +1,265 @@
+# api/suggest.py
+"""
+搜索框输入联想：进程内的前缀索引，不查询数据库。
+
+- 索引内容：在售（ACTIVE）商品的标题，按浏览量排序；以及这些商品上最常见的标签，
+  按商品数排序。键统一为 casefold 并压缩空白后的文本，只做前缀匹配。
+- 结构：按键排序的数组 + 二分查找定位前缀范围。范围较小时直接在范围内取 top-k；
+  超过 SUGGEST_SCAN_LIMIT 的前缀（如单个字母）在构建时预先算好 top-k，查询不随数据量变慢。
+- 构建：首次查询时（或 wsgi/asgi 启动时 warm()）用一条 values_list 查询一次性取出，
+  最多 SUGGEST_MAX_TITLES 个浏览量最高的商品、SUGGEST_MAX_TAGS 个标签，内存有上限。
+- 更新：商品保存/删除（事务提交后）写入增量层，查询时与基础数组合并；增量超过
+  SUGGEST_OVERLAY_MAX 或索引超过 SUGGEST_REBUILD_SECONDS 秒时在后台线程重建后原子替换。
+  浏览量和标签计数只在重建时刷新；其他进程中的修改同样要等本进程重建后才可见。
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# 构建时为每个前缀缓存的候选数，需大于单次查询的 limit（去重和过滤增量后仍够用）
+CACHED_TOP = 50
+MAX_LIMIT = 20
+# 大于所有字符的哨兵，prefix + HIGHEST 是前缀范围的上界
+HIGHEST = '\U0010ffff'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+class PrefixIndex:
+    """按键排序的 (键, 分数, 数据) 数组；search(prefix, k) 返回前缀匹配中分数最高的 k 个位置"""
+
+    def __init__(self, entries, scan_limit=None):
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.keys = [entry[0] for entry in entries]
+        self.scores = array('q', (entry[1] for entry in entries))
+        self.values = [entry[2] for entry in entries]
+        self.scan_limit = scan_limit or _setting('SUGGEST_SCAN_LIMIT', 256)
+        self.top = self._build_top()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _largest(self, lo, hi, k):
+        # 分数相同时按键的顺序，结果稳定
+        return heapq.nlargest(k, range(lo, hi), key=self.scores.__getitem__)
+
+    def _build_top(self):
+        """
+        为匹配超过 scan_limit 个键的每个前缀缓存 top-k 位置。自顶向下细分前缀范围，
+        父前缀的候选由子前缀的 top-k 和小范围中的全部位置组成，每个位置只被扫描一次。
+        """
+        keys, scores, limit = self.keys, self.scores, self.scan_limit
+        top = {}
+
+        def visit(lo, hi, depth):
+            # keys[lo:hi] 共享长度为 depth 的前缀，且数量超过 limit
+            candidates = []
+            i = lo
+            while i < hi:
+                if len(keys[i]) == depth:
+                    # 与前缀完全相同的键排在范围开头
+                    candidates.append(i)
+                    i += 1
+                    continue
+                j = bisect_left(keys, keys[i][:depth + 1] + HIGHEST, i, hi)
+                if j - i > limit:
+                    candidates.extend(visit(i, j, depth + 1))
+                else:
+                    candidates.extend(range(i, j))
+                i = j
+            # candidates 中分数相同的位置保持升序，nlargest 稳定，结果与直接扫描一致
+            result = top[keys[lo][:depth]] = heapq.nlargest(CACHED_TOP, candidates, key=scores.__getitem__)
+            return result
+
+        if len(keys) > limit:
+            visit(0, len(keys), 0)
+        return top
+
+    def search(self, prefix, k):
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + HIGHEST, lo)
+        if hi - lo <= self.scan_limit:
+            return self._largest(lo, hi, k)
+        cached = self.top.get(prefix)
+        return cached[:k] if cached is not None else self._largest(lo, hi, k)
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # 首次构建期间其他请求等待
+        self._titles = None  # PrefixIndex，值为 (商品 id, 标题)；None 表示尚未构建
+        self._tags = None
+        self._built_at = 0.0
+        self._rebuilding = False
+        self._seq = 0
+        # 增量层：构建后发生的修改。_overlay 为商品最新的 (键, 标题, 分数, 序号)，
+        # _stale 中的商品 id 在基础数组中的条目已失效。只整体替换，读取时无需加锁
+        self._overlay = {}
+        self._stale = {}
+
+    @property
+    def built(self):
+        return self._titles is not None
+
+    def reset(self):
+        with self._lock:
+            self._titles = self._tags = None
+            self._overlay, self._stale = {}, {}
+
+    @staticmethod
+    def load_rows():
+        """(id, title, view_count, tags)：浏览量最高的 SUGGEST_MAX_TITLES 个在售商品"""
+        limit = _setting('SUGGEST_MAX_TITLES', 200000)
+        queryset = (Product.objects.filter(status='ACTIVE').order_by('-view_count', 'id')
+                    .values_list('id', 'title', 'view_count', 'tags')[:limit])
+        return queryset.iterator(chunk_size=5000)
+
+    @staticmethod
+    def build(rows):
+        """由 (id, title, view_count, tags) 一次遍历构建 (标题索引, 标签索引)"""
+        titles, tag_counts, tag_names = [], Counter(), {}
+        for pk, title, view_count, tags in rows:
+            titles.append((normalize(title), view_count, (pk, title)))
+            for tag in tags or ():
+                if isinstance(tag, str) and tag.strip():
+                    key = normalize(tag)
+                    tag_counts[key] += 1
+                    tag_names.setdefault(key, tag.strip())
+        popular = tag_counts.most_common(_setting('SUGGEST_MAX_TAGS', 2000))
+        return PrefixIndex(titles), PrefixIndex((key, count, tag_names[key]) for key, count in popular)
+
+    def rebuild(self, rows=None):
+        with self._lock:
+            started = self._seq
+        start = time.perf_counter()
+        titles, tags = self.build(self.load_rows() if rows is None else rows)
+        with self._lock:
+            self._titles, self._tags = titles, tags
+            self._built_at = time.monotonic()
+            # 只保留构建开始后才发生的修改
+            self._overlay = {pk: entry for pk, entry in self._overlay.items() if entry[3] > started}
+            self._stale = {pk: seq for pk, seq in self._stale.items() if seq > started}
+        logger.info('Suggest index rebuilt: %d titles, %d tags in %.2fs',
+                    len(titles), len(tags), time.perf_counter() - start)
+
+    def ensure_built(self):
+        if self._titles is None:
+            with self._build_lock:
+                if self._titles is None:
+                    self.rebuild()
+        elif (time.monotonic() - self._built_at > _setting('SUGGEST_REBUILD_SECONDS', 600)
+              or len(self._stale) > _setting('SUGGEST_OVERLAY_MAX', 1000)):
+            self.rebuild_in_background()
+
+    def rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            try:
+                self.rebuild()
+            except DatabaseError:
+                logger.exception('Suggest index rebuild failed')
+                # 稍后再试，不在每个请求上重试
+                self._built_at = time.monotonic()
+            finally:
+                self._rebuilding = False
+                connection.close()
+        threading.Thread(target=run, name='suggest-rebuild', daemon=True).start()
+
+    def apply(self, pk, title=None, score=0, active=False):
+        """记录一个商品的修改：active 为 False 表示从索引中移除"""
+        self.apply_many([(pk, title, score, active)])
+
+    def apply_many(self, changes):
+        """批量记录修改，changes 为 (pk, title, score, active)；整批只复制一次增量层"""
+        if self._titles is None:
+            return
+        with self._lock:
+            overlay, stale = dict(self._overlay), dict(self._stale)
+            for pk, title, score, active in changes:
+                self._seq += 1
+                if active:
+                    overlay[pk] = (normalize(title), score, title, self._seq)
+                else:
+                    overlay.pop(pk, None)
+                stale[pk] = self._seq
+            self._overlay, self._stale = overlay, stale
+
+    def suggest(self, query, limit=8):
+        self.ensure_built()
+        titles, tags, overlay, stale = self._titles, self._tags, self._overlay, self._stale
+        prefix = normalize(query)
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        candidates = []
+        # 取缓存的全部候选，抵消失效条目和重复标题
+        for position in titles.search(prefix, CACHED_TOP):
+            pk, title = titles.values[position]
+            if pk not in stale:
+                candidates.append((titles.scores[position], titles.keys[position], pk, title))
+        for pk, (key, score, title, _) in overlay.items():
+            if key.startswith(prefix):
+                candidates.append((score, key, pk, title))
+        candidates.sort(key=lambda candidate: -candidate[0])
+
+        seen, results = set(), []
+        for score, key, pk, title in candidates:
+            if key not in seen:
+                seen.add(key)
+                results.append({'id': pk, 'title': title})
+                if len(results) == limit:
+                    break
+        return {
+            'titles': results,
+            'tags': [tags.values[position] for position in tags.search(prefix, limit)],
+        }
+
+
+index = SuggestIndex()
+
+
+def warm():
+    """进程启动时构建索引（gunicorn --preload 时 fork 出的 worker 共享这份内存）"""
+    if not _setting('SUGGEST_WARM_ON_STARTUP', False):
+        return
+    try:
+        index.ensure_built()
+    except DatabaseError:
+        logger.exception('Suggest index warm-up failed; it will be built on first use')
+
+
+@receiver(post_save, sender=Product, dispatch_uid='suggest_product_saved')
+def _product_saved(sender, instance, **kwargs):
+    if index.built:
+        pk, title, views, active = instance.pk, instance.title, instance.view_count, instance.status == 'ACTIVE'
+        transaction.on_commit(lambda: index.apply(pk, title, views, active))
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='suggest_product_deleted')
+def _product_deleted(sender, instance, **kwargs):
+    if index.built:
+        pk = instance.pk
+        transaction.on_commit(lambda: index.apply(pk))
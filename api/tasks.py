@@ -0,0 +1,225 @@
+# api/tasks.py
+"""
+后台任务处理函数（由 api/jobs.py 的 worker 执行），以及请求中产生这些任务的辅助函数。
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+from . import identity, jobs, saved_searches
+from .models import User, Product, Message
+
+logger = logging.getLogger(__name__)
+
+
+def system_sender():
+    """系统消息的发送者：第一个管理员，没有时使用第一个 staff 账号；同一请求或同一批任务中只查询一次"""
+    return identity.memo('system_sender', lambda: User.objects.filter(role='ADMIN').first()
+                         or User.objects.filter(is_staff=True).first())
+
+
+@jobs.register('system_message')
+def send_system_message(payload):
+    sender = system_sender()
+    if sender is None:
+        logger.warning('No admin account to send system message to %s', payload['receiverId'])
+        return
+    Message.objects.create(sender=sender, receiver_id=payload['receiverId'], content=payload['content'],
+                           msg_type='SYSTEM')
+
+
+def notify(receiver_id, content, key):
+    """入队一条系统消息；key 用于去重（如同一笔订单只通知一次）"""
+    return jobs.enqueue('system_message', {'receiverId': receiver_id, 'content': content}, key=key)
+
+
+@jobs.register('apply_view_counts')
+def apply_view_counts(payload):
+    # 按增量分组，同样增量的商品一条 UPDATE；update() 不刷新 updated_at，ETag 不受影响
+    by_increment = defaultdict(list)
+    for product_id, count in payload['counts'].items():
+        by_increment[count].append(product_id)
+    for count, product_ids in by_increment.items():
+        Product.objects.filter(pk__in=product_ids).update(view_count=F('view_count') + count)
+
+
+# 一条消息中最多列出的商品数
+MATCH_MESSAGE_MAX_ITEMS = 5
+
+
+@jobs.register('match_saved_searches')
+def notify_saved_search_matches(payload):
+    # 只有锚点出现在商品中的搜索是候选（见 api/saved_searches.py）；同一用户只通知一次
+    product_ids = payload.get('productIds') or [payload['productId']]
+    products = list(Product.objects.filter(pk__in=product_ids, status='ACTIVE').order_by('pk'))
+    if not products:
+        return
+    if len(products) == 1:
+        matched = {products[0].pk: saved_searches.matches(products[0])}
+    else:
+        # 批量上架：整批商品一次取出候选
+        matched = saved_searches.matches_many(products)
+    by_user = {}
+    for product in products:
+        for search in matched[product.pk]:
+            entry = by_user.setdefault(search.user_id, (search, []))
+            if not entry[1] or entry[1][-1] is not product:
+                entry[1].append(product)
+    sender = system_sender() if by_user else None
+    if sender is None:
+        return
+    Message.objects.bulk_create([
+        Message(sender=sender, receiver_id=user_id, msg_type='SYSTEM', content=match_message(search, items))
+        for user_id, (search, items) in by_user.items()
+    ], batch_size=500)
+
+
+def match_message(search, products):
+    if len(products) == 1:
+        product = products[0]
+        return (f'您保存的搜索「{saved_searches.describe(search)}」有新商品上架：'
+                f'{product.title}（¥{product.price}），商品编号 {product.pk}')
+    listed = '；'.join(f'{product.title}（¥{product.price}，编号 {product.pk}）'
+                      for product in products[:MATCH_MESSAGE_MAX_ITEMS])
+    more = f' 等 {len(products)} 件' if len(products) > MATCH_MESSAGE_MAX_ITEMS else ''
+    return f'您保存的搜索「{saved_searches.describe(search)}」有 {len(products)} 件新商品上架：{listed}{more}'
+
+
+def match_saved_searches(product_id):
+    """新商品上架后入队匹配任务；在调用方事务中入队，商品保存回滚时任务也不会出现"""
+    return jobs.enqueue('match_saved_searches', {'productId': product_id}, key=f'saved-search-match:{product_id}')
+
+
+def match_saved_searches_many(product_ids):
+    """批量上架的商品合并为一个匹配任务"""
+    return jobs.enqueue('match_saved_searches', {'productIds': list(product_ids)},
+                        key=f'saved-search-match:{product_ids[0]}:{len(product_ids)}')
+
+
+@jobs.register('price_drop_alert')
+def send_price_drop_alerts(payload):
+    # 收藏者按 user_id 键集分页流式读取，每块一条 bulk_create；
+    # 处理 PRICE_ALERT_CHUNKS_PER_JOB 块后剩余部分交给后续任务（payload 带 after 和已生成的 content）
+    product_id = payload['productId']
+    content = payload.get('content')
+    if content is None:
+        product = Product.objects.filter(pk=product_id, status='ACTIVE').only('title', 'price').first()
+        old_price = Decimal(payload['oldPrice'])
+        if product is None or product.price >= old_price:
+            return  # 窗口内价格又调回去了，或商品已售出 / 下架
+        content = f'您收藏的商品「{product.title}」降价了：¥{old_price} → ¥{product.price}，商品编号 {product.pk}'
+    sender = system_sender()
+    if sender is None:
+        logger.warning('No admin account to send price drop alerts for %s', product_id)
+        return
+    chunk_size = getattr(settings, 'PRICE_ALERT_CHUNK_SIZE', 1000)
+    recipients = (User.wishlist.through.objects.filter(product_id=product_id)
+                  .exclude(user_id=payload['sellerId']).order_by('user_id').values_list('user_id', flat=True))
+    after = payload.get('after', '')
+    for _ in range(getattr(settings, 'PRICE_ALERT_CHUNKS_PER_JOB', 10)):
+        user_ids = list(recipients.filter(user_id__gt=after)[:chunk_size])
+        Message.objects.bulk_create([
+            Message(sender=sender, receiver_id=user_id, msg_type='SYSTEM', content=content) for user_id in user_ids
+        ])
+        if len(user_ids) < chunk_size:
+            return
+        after = user_ids[-1]
+    jobs.enqueue('price_drop_alert', {**payload, 'content': content, 'after': after},
+                 key=f"price-drop:{product_id}:{payload['window']}:{after}")
+
+
+def alert_price_drop(product, old_price):
+    """
+    商品降价后入队提醒，不在请求中读取收藏者。同一商品在一个 PRICE_ALERT_WINDOW_SECONDS 窗口内
+    多次调价只入队一次（幂等键），窗口结束时比较当时的价格与窗口内第一次降价前的价格。
+    """
+    window = getattr(settings, 'PRICE_ALERT_WINDOW_SECONDS', 600)
+    now = time.time()
+    index = int(now // window)
+    payload = {'productId': product.pk, 'sellerId': product.seller_id, 'oldPrice': str(old_price), 'window': index}
+    return jobs.enqueue('price_drop_alert', payload, key=f'price-drop:{product.pk}:{index}',
+                        delay=(index + 1) * window - now)
+
+
+class ViewCountBuffer:
+    """
+    进程内累计商品浏览量，每 VIEW_COUNT_FLUSH_SECONDS 秒或累计 VIEW_COUNT_FLUSH_SIZE 次
+    合并为一个 apply_view_counts 任务，详情接口不再每次请求都 UPDATE 一行。
+    VIEW_COUNT_AUTO_FLUSH 为 True 时，缓冲区有计数后启动一个定时器，之后没有新的浏览也会在
+    一个刷新周期内写入；进程正常退出时（atexit）刷新剩余的计数。进程被强制结束时最多丢失
+    一个刷新周期的浏览量，浏览量允许这种误差。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._atexit = False
+
+    def add(self, product_id):
+        """记录一次浏览；需要刷新时取出并返回累计的计数，否则返回 None"""
+        with self._lock:
+            self._counts[product_id] += 1
+            self._pending += 1
+            if (self._pending < getattr(settings, 'VIEW_COUNT_FLUSH_SIZE', 200)
+                    and time.monotonic() - self._last_flush < getattr(settings, 'VIEW_COUNT_FLUSH_SECONDS', 5)):
+                self._schedule()
+                return None
+            return self._take()
+
+    def _schedule(self):
+        if self._timer is not None or not getattr(settings, 'VIEW_COUNT_AUTO_FLUSH', False):
+            return
+        if not self._atexit:
+            atexit.register(self.flush)
+            self._atexit = True
+        self._timer = threading.Timer(getattr(settings, 'VIEW_COUNT_FLUSH_SECONDS', 5), self._flush_in_thread)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing buffered view counts failed')
+        finally:
+            connection.close()  # 定时器线程自己的连接
+
+    def _take(self):
+        counts, self._counts, self._pending = dict(self._counts), Counter(), 0
+        self._last_flush = time.monotonic()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return counts
+
+    def flush(self):
+        with self._lock:
+            counts = self._take()
+        if counts:
+            jobs.enqueue('apply_view_counts', {'counts': counts})
+
+
+view_counts = ViewCountBuffer()
+
+
+def record_view(product_id):
+    counts = view_counts.add(product_id)
+    if counts:
+        jobs.enqueue('apply_view_counts', {'counts': counts})
+
+
+async def arecord_view(product_id):
+    counts = view_counts.add(product_id)
+    if counts:
+        await sync_to_async(jobs.enqueue)('apply_view_counts', {'counts': counts})
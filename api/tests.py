@@ -1,3 +1,1265 @@
-from django.test import TestCase
+import gc
+import io
+import random
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import archive, batch, bench, credit, db_router, duplicates, fastpath, fieldsets, follow_suggestions, \
+    identity, ids, jobs, media, metrics, objcache, saved_searches, suggest, tasks, throttling
+from .models import User, Product, Message, Review, Job, ArchivedProduct, ArchivedMessage, SavedSearch, \
+    CacheInvalidation, ProductFingerprint, FollowSuggestion
+from .renderers import FastJSONRenderer
+from .serializers import UserSerializer, ProductSerializer, MessageSerializer, ReviewSerializer
+
+
+class PerformanceBudgetTests(TestCase):
+    """每个公开接口的 SQL 查询数不得超过 bench_baseline.json 中记录的预算"""
+
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(**bench.DEFAULT_DATASET)
+
+    def test_query_counts_within_baseline(self):
+        baseline = bench.load_baseline()
+        self.assertIsNotNone(baseline, 'api/bench_baseline.json is missing')
+        self.assertEqual(baseline['dataset'], bench.DEFAULT_DATASET)
+
+        results = bench.run_scenarios(iterations=2, client=self.client)
+        self.assertEqual(set(results), set(bench.SCENARIOS))
+        self.assertEqual(bench.compare(results, baseline), [])
+
+    def test_unexpected_status_is_a_violation(self):
+        baseline = {'scenarios': {'login': {'queries': 3, 'p95': 1, 'p99': 1, 'status': 200}}}
+        throttled = {'login': {'queries': 1, 'p95': 1, 'p99': 1, 'status': 200, 'statuses': [200, 429]}}
+        self.assertEqual(bench.compare(throttled, baseline), ['login: HTTP 429 (expected 200)'])
+        self.assertEqual(bench.compare({'other': {**throttled['login'], 'statuses': [500]}}, baseline),
+                         ['other: HTTP 500'])
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(bench.percentile(samples, 50), 50)
+        self.assertEqual(bench.percentile(samples, 99), 99)
+        self.assertEqual(bench.percentile([7.0], 95), 7.0)
+
+
+class FastPathParityTests(TestCase):
+    """快速序列化路径必须与 DRF 序列化器 + JSONRenderer 输出字节一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(users=30, products=200, seed=7)
+        seller = User.objects.get(id='ug0000000')
+        # 边界情况：非 ASCII、U+2028、整数价格、空标签、无买家
+        Product.objects.create(
+            id='pedge', seller=seller, title='二手吉他 "quoted" \u2028', price=5, description='',
+            category='Others', image='https://example.com/x.png', tags=[],
+        )
+
+    def assertSameBytes(self, serializer_data, fast_rows):
+        self.assertEqual(FastJSONRenderer().render(fast_rows), JSONRenderer().render(serializer_data))
+
+    def test_products(self):
+        queryset = Product.objects.order_by('-created_at', 'id')
+        self.assertSameBytes(ProductSerializer(queryset, many=True).data, fastpath.product_rows(queryset))
+
+    def test_users(self):
+        queryset = User.objects.order_by('id')
+        self.assertSameBytes(UserSerializer(queryset, many=True).data, fastpath.user_rows(queryset))
+
+    def test_messages(self):
+        queryset = Message.objects.order_by('timestamp', 'id')
+        self.assertSameBytes(MessageSerializer(queryset, many=True).data, fastpath.message_rows(queryset))
+
+    def test_reviews(self):
+        queryset = Review.objects.order_by('id')
+        self.assertSameBytes(ReviewSerializer(queryset, many=True).data, fastpath.review_rows(queryset))
+
+    def test_sparse_fieldsets(self):
+        products = Product.objects.order_by('id')
+        card = fieldsets.PRESETS['product']['card']
+        self.assertSameBytes(ProductSerializer(products, many=True, fields=card).data,
+                             fastpath.product_rows(products, card))
+        users = User.objects.order_by('id')
+        self.assertSameBytes(UserSerializer(users, many=True, fields=['username', 'following']).data,
+                             fastpath.user_rows(users, ['username', 'following']))
+
+    def test_renderer_matches_stdlib_renderer(self):
+        data = {'price': '1.50', 'text': '  é\n', 'nested': [1, 2.5, None, True], 'empty': {}}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(users=20, products=100, seed=3)
+        cls.product = Product.objects.order_by('id').first()
+
+    def test_product_etag_ignores_view_count(self):
+        # 丢弃其他测试留在进程内缓冲区中的浏览量
+        tasks.view_counts.flush()
+        Job.objects.all().delete()
+
+        url = f'/api/products/{self.product.pk}/'
+        first = self.client.get(url)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        # 浏览量由后台任务批量写入
+        tasks.view_counts.flush()
+        jobs.run_pending()
+        self.assertEqual(Product.objects.get(pk=self.product.pk).view_count, self.product.view_count + 2)
+
+        Product.objects.get(pk=self.product.pk).save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_profile_data_changes_with_wishlist(self):
+        user = User.objects.get(id='ug0000001')
+        url = f'/api/users/{user.pk}/profile_data/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        client.post(f'/api/users/{user.pk}/toggle_wishlist/', {'productId': self.product.pk})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(users=5, products=10, seed=23)
+        cls.admin = User.objects.create_user(username='metrics_admin', password='x', role='ADMIN', is_staff=True)
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_middleware_records_requests_in_prometheus_format(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        client = APIClient()
+        self.assertEqual(client.get('/api/metrics/').status_code, 401)
+        client.force_authenticate(self.admin)
+        response = client.get('/api/metrics/')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+
+        labels = 'route="product-list",action="list",method="GET"'
+        self.assertIn('# TYPE unitrade_http_requests_total counter', text)
+        self.assertIn(f'unitrade_http_requests_total{{{labels}}} 2', text)
+        self.assertIn('# TYPE unitrade_http_request_duration_seconds histogram', text)
+        self.assertIn(f'unitrade_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'unitrade_http_request_duration_seconds_count{{{labels}}} 2', text)
+        buckets = [int(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+                   if line.startswith(f'unitrade_http_request_duration_seconds_bucket{{{labels}')]
+        self.assertEqual(len(buckets), len(metrics.LATENCY_BUCKETS) + 1)
+        self.assertEqual(buckets, sorted(buckets))
+
+        metrics.inc('unitrade_test_total', (('name', 'a "b"\n'),))
+        self.assertIn(r'unitrade_test_total{name="a \"b\"\n"} 1', metrics.render_prometheus())
+
+    def test_finished_threads_are_folded_into_the_aggregate(self):
+        def record():
+            metrics.inc('unitrade_test_total')
+            metrics.observe('unitrade_test_seconds', 0.02)
+
+        live = len(metrics._stores)
+        for _ in range(50):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        gc.collect()
+        text = metrics.render_prometheus()
+        self.assertIn('unitrade_test_total 50', text)
+        self.assertIn('unitrade_test_seconds_count 50', text)
+        self.assertLessEqual(len(metrics._stores), live + 1)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(users=5, products=10, seed=29)
+        cls.admin = User.objects.create_user(username='profile_admin', password='x', role='ADMIN', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(PROFILE_DIR=Path(directory.name), PROFILE_MAX_COUNT=2)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+
+    def test_admin_profiles_are_saved_listed_and_pruned(self):
+        ids = [self.client.get('/api/products/?_profile=1', **self.auth)['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(sorted(path.name for path in Path(settings.PROFILE_DIR).iterdir()),
+                         sorted(f'{pk}.{fmt}' for pk in ids[1:] for fmt in ('collapsed', 'json')))
+        listed = self.client.get('/api/profiles/', **self.auth).json()
+        self.assertEqual({meta['id'] for meta in listed}, set(ids[1:]))
+        self.assertEqual(listed[0]['trigger'], 'admin')
+
+    def test_only_admin_requests_with_the_exact_parameter_are_profiled(self):
+        self.assertFalse(self.client.get('/api/products/?x_profile=1', **self.auth).has_header('X-Profile-Id'))
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get('/api/products/')
+        with CaptureQueriesContext(connection) as anonymous:
+            response = self.client.get('/api/products/?_profile=1', HTTP_X_PROFILE='1')
+        # 匿名请求不做 JWT 认证，也不多查询
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(len(anonymous), len(plain))
+        self.assertFalse(Path(settings.PROFILE_DIR).exists() and any(Path(settings.PROFILE_DIR).iterdir()))
+
+
+class SeedSyntheticTests(TestCase):
+    def test_clear_removes_synthetic_rows_and_their_references_only(self):
+        bench.seed_dataset(users=30, products=300, seed=31)
+        self.assertFalse(Message.objects.filter(sender_id=F('receiver_id')).exists())
+        real = User.objects.create_user(username='seed_real', password='x')
+        own = Product.objects.create(seller=real, buyer_id='ug0000001', title='real', price=1, description='',
+                                     category='Others', image='https://example.com/x.png')
+        real.wishlist.add('pg00000001', own)
+        real.following.add('ug0000002')
+        Message.objects.create(sender=real, receiver_id='ug0000003', content='hi')
+        SavedSearch.objects.create(user_id='ug0000004', keywords='desk')
+
+        with CaptureQueriesContext(connection) as captured:
+            call_command('seed_synthetic', users=0, products=0, clear=True, stdout=io.StringIO())
+        # 不经过 Collector 载入行：除生成消息、评价 id 的 MAX 之外没有 SELECT
+        self.assertFalse([query['sql'] for query in captured
+                          if query['sql'].startswith('SELECT') and 'MAX(' not in query['sql']])
+        self.assertFalse(User.objects.filter(id__startswith='ug').exists())
+        self.assertFalse(Product.objects.filter(id__startswith='pg').exists())
+        self.assertFalse(Review.objects.exists())
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(SavedSearch.objects.exists())
+        self.assertEqual(list(real.wishlist.all()), [own])
+        self.assertFalse(real.following.exists())
+        own.refresh_from_db()
+        self.assertIsNone(own.buyer_id)
+
+
+class ImageStorageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        # 用线程池代替进程池，测试里可以直接等待渲染完成
+        self.pool = media.ThumbnailPool(workers=1, max_pending=2)
+        self.pool._executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.pool.shutdown)
+        patcher = mock.patch.object(media, 'get_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for_renders(self):
+        # 单线程执行器按顺序执行，完成回调在工作线程里跑完才会取下一个任务
+        self.pool._executor.submit(lambda: None).result()
+
+    @staticmethod
+    def png():
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), (200, 10, 10)).save(buffer, format='PNG')
+        return SimpleUploadedFile('a.png', buffer.getvalue(), content_type='image/png')
+
+    def test_same_content_is_stored_once(self):
+        digest, name, duplicate = media.store_original(self.png())
+        self.assertEqual((name, duplicate), ('original.png', False))
+        self.assertEqual(media.store_original(self.png()), (digest, name, True))
+        # 变体还没生成时回退为原图
+        path, is_fallback = media.resolve_file(digest, 'thumb.webp')
+        self.assertEqual((path.name, is_fallback), ('original.png', True))
+        self.assertEqual(media.resolve_file('../' + digest[3:], 'thumb.webp'), (None, False))
+
+        url = media.image_url(digest, name)
+        self.assertEqual(media.variant_urls(url)['thumb']['webp'], media.image_url(digest, 'thumb.webp'))
+        self.assertEqual(media.variant_urls('https://picsum.photos/400'), {})
+
+    def test_fallback_is_not_cached_and_renders_missing_variants(self):
+        digest, name, _ = media.store_original(self.png())
+        url = media.image_url(digest, 'thumb.webp')
+        fallback = self.client.get(url)
+        self.assertEqual(fallback.status_code, 200)
+        self.assertEqual(fallback['Cache-Control'], 'no-cache')
+        fallback.close()
+
+        # 回退请求触发了变体生成，之后返回变体本身并允许长期缓存
+        self.wait_for_renders()
+        exact = self.client.get(url)
+        self.assertEqual(exact['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(b''.join(exact.streaming_content)[8:12], b'WEBP')
+        exact.close()
+        original = self.client.get(media.image_url(digest, name))
+        self.assertEqual(original['Cache-Control'], 'public, max-age=31536000, immutable')
+        original.close()
+
+    def test_saturated_pool_rejects_before_storing(self):
+        self.assertTrue(self.pool.reserve())
+        self.assertTrue(self.pool.reserve())
+        with self.assertRaises(media.PoolSaturated):
+            media.handle_upload(self.png())
+        self.assertFalse(media.image_root().exists() and any(media.image_root().iterdir()))
+
+        self.pool.release()
+        data = media.handle_upload(self.png())
+        self.wait_for_renders()
+        self.assertTrue(media.variants_ready(data['hash']))
+        self.assertEqual(self.pool.pending, 1)
+
+    def test_failed_render_is_retried_after_cooldown(self):
+        digest, name, _ = media.store_original(self.png())
+        original = media.image_dir(digest) / name
+        with mock.patch.object(media, 'render_variants', side_effect=OSError('disk full')), \
+                self.assertLogs('api.media', 'WARNING'):
+            self.pool.submit(digest, name)
+            self.wait_for_renders()
+        self.assertTrue(self.pool.recently_failed(digest))
+        self.assertIsNone(media.rerender_missing(digest, original))
+        with override_settings(IMAGE_RERENDER_COOLDOWN=0):
+            media.rerender_missing(digest, original).result()
+        self.assertTrue(media.variants_ready(digest))
+
+    def test_rejects_non_images(self):
+        with self.assertRaises(media.UploadRejected):
+            media.store_original(SimpleUploadedFile('a.png', b'<?php echo 1; ?>'))
+        self.assertEqual([p.name for p in media.image_root().iterdir()], [])
+
+
+class TimeOrderedIdTests(TestCase):
+    def test_ids_are_monotonic_and_sortable(self):
+        generated = [ids.new_id('p') for _ in range(5000)]
+        self.assertEqual(generated, sorted(generated))
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertTrue(all(len(pk) == 17 for pk in generated))
+        self.assertAlmostEqual(ids.decode_timestamp(generated[0]) / 1000, time.time(), delta=5)
+
+    def test_sequence_overflow_borrows_next_millisecond(self):
+        generator = ids.TimeOrderedIds()
+        generator.last_ms = time.time_ns() // 1_000_000 + 1000
+        generator.sequence = ids.SEQUENCE_MASK
+        first_ms = generator.last_ms
+        pk = generator.next('u')
+        self.assertEqual(ids.decode_timestamp(pk), first_ms + 1)
+
+    def test_models_use_configured_scheme(self):
+        user = User.objects.create_user(username='ids_time', password='x')
+        self.assertIsNotNone(ids.decode_timestamp(user.pk))
+        with override_settings(ID_SCHEME='legacy'):
+            legacy = User.objects.create_user(username='ids_legacy', password='x')
+        self.assertRegex(legacy.pk, r'^u[0-9a-f]{8}$')
+        self.assertIsNone(ids.decode_timestamp(legacy.pk))
+
+    def test_default_id_does_not_query_and_collisions_retry_on_insert(self):
+        seller = User.objects.create_user(username='ids_seller', password='x')
+        fields = {'seller': seller, 'title': 't', 'price': 1, 'description': '', 'category': 'Others', 'image': ''}
+        with self.assertNumQueries(0):
+            Product(**fields)
+            User(username='unsaved')
+        existing = Product.objects.create(**fields)
+
+        product = Product(**fields)
+        product.pk = existing.pk  # 模拟生成的 id 碰撞
+        product.save()
+        self.assertNotEqual(product.pk, existing.pk)
+        self.assertEqual(Product.objects.count(), 2)
+        # 调用方指定的主键冲突不重试
+        with self.assertRaises(IntegrityError):
+            Product(id=existing.pk, **fields).save()
+
+
+class AsyncViewParityTests(TestCase):
+    """/api/async/ 下的异步视图与同步接口输出一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(users=20, products=150, seed=11)
+        cls.seller = User.objects.order_by('id').values_list('id', flat=True).first()
+
+    async def test_payloads_match(self):
+        client = AsyncClient()
+        for path in ['/api/products/?sort=price_desc&hideSold=true', '/api/products/?preset=card',
+                     f'/api/users/{self.seller}/profile_data/', f'/api/reviews/?sellerId={self.seller}',
+                     '/api/reviews/?omit=content', '/api/reviews/?fields=bogus', '/api/messages/?userId=x',
+                     '/api/products/missing/']:
+            expected = await client.get(path)
+            actual = await client.get(path.replace('/api/', '/api/async/', 1))
+            self.assertEqual((actual.status_code, actual.content), (expected.status_code, expected.content), path)
+            self.assertEqual(actual.get('ETag'), expected.get('ETag'), path)
+
+    async def test_product_detail_counts_views_and_revalidates(self):
+        product = await Product.objects.order_by('id').afirst()
+        client = AsyncClient()
+        first = await client.get(f'/api/async/products/{product.pk}/')
+        self.assertEqual(first.json()['viewCount'], product.view_count + 1)
+        second = await client.get(f'/api/async/products/{product.pk}/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(users=10, products=30, seed=5)
+        cls.admin = User.objects.create_user(username='jobs_admin', password='x', role='ADMIN', is_staff=True)
+
+    def test_purchase_message_is_sent_by_worker_once(self):
+        product = Product.objects.filter(status='ACTIVE').exclude(seller=self.admin).first()
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        client.post(f'/api/products/{product.pk}/purchase/', {'buyerId': self.admin.pk, 'address': 'A1'})
+        self.assertFalse(Message.objects.filter(receiver=product.seller, msg_type='SYSTEM').exists())
+        # 相同的幂等键不会重复入队
+        self.assertFalse(tasks.notify(product.seller_id, 'dup', key=f'product-purchased:{product.pk}:{self.admin.pk}'))
+
+        self.assertEqual(jobs.run_pending(), (1, 0, 0))
+        message = Message.objects.get(receiver=product.seller, msg_type='SYSTEM')
+        self.assertEqual(message.sender, self.admin)
+        self.assertIn('A1', message.content)
+
+    def test_failed_jobs_retry_with_backoff_then_fail(self):
+        jobs.enqueue('no_such_kind', {})
+        jobs.enqueue('system_message', {'content': 'x'}, max_attempts=2)
+        self.assertEqual(jobs.run_pending(), (0, 1, 1))
+        retry = Job.objects.get(kind='system_message')
+        self.assertEqual((retry.status, retry.attempts), ('PENDING', 1))
+        self.assertGreater(retry.run_at, retry.created_at)
+        self.assertEqual(Job.objects.get(kind='no_such_kind').status, 'FAILED')
+
+        Job.objects.filter(pk=retry.pk).update(run_at=retry.created_at)
+        self.assertEqual(jobs.run_pending(), (0, 0, 1))
+        self.assertEqual(Job.objects.get(pk=retry.pk).status, 'FAILED')
+
+    def test_batched_dequeue_claims_each_job_once(self):
+        for i in range(5):
+            jobs.enqueue('apply_view_counts', {'counts': {}})
+        first, second = jobs.dequeue(3), jobs.dequeue(3)
+        self.assertEqual((len(first), len(second)), (3, 2))
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertEqual(jobs.dequeue(3), [])
+
+    def test_crash_mid_batch_does_not_rerun_committed_jobs(self):
+        for i in range(2):
+            tasks.notify(self.admin.pk, f'crash {i}', key=f'crash:{i}')
+        batch = jobs.dequeue(2)
+        handler = jobs.get_handler('system_message')
+        calls = []
+
+        def crash_after_first(payload):
+            if calls:
+                raise KeyboardInterrupt  # 模拟 worker 进程在批次中途退出
+            calls.append(payload)
+            handler(payload)
+
+        with mock.patch.dict(jobs._handlers, {'system_message': crash_after_first}):
+            with self.assertRaises(KeyboardInterrupt):
+                jobs.execute(batch)
+        self.assertEqual(Job.objects.get(pk=batch[0].pk).status, 'DONE')
+        self.assertEqual(Job.objects.get(pk=batch[1].pk).status, 'RUNNING')
+
+        with override_settings(JOB_LOCK_TIMEOUT=0):
+            self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.run_pending(), (1, 0, 0))
+        self.assertEqual(Message.objects.filter(receiver=self.admin, msg_type='SYSTEM').count(), 2)
+
+    def test_requeued_job_is_rolled_back_by_the_old_batch(self):
+        tasks.notify(self.admin.pk, 'slow', key='slow')
+        batch = jobs.dequeue(1)
+        with override_settings(JOB_LOCK_TIMEOUT=0):
+            jobs.requeue_stale()  # 批次执行超过锁定时间，任务已回到队列
+        self.assertEqual(jobs.execute(batch), (0, 0, 0))
+        self.assertFalse(Message.objects.filter(receiver=self.admin, msg_type='SYSTEM').exists())
+        self.assertEqual(jobs.run_pending(), (1, 0, 0))
+        self.assertEqual(Message.objects.filter(receiver=self.admin, msg_type='SYSTEM').count(), 1)
+
+    @override_settings(VIEW_COUNT_AUTO_FLUSH=True, VIEW_COUNT_FLUSH_SECONDS=0.2)
+    def test_view_counts_flush_without_further_views(self):
+        buffer = tasks.ViewCountBuffer()
+        flushed = threading.Event()
+        enqueued = []
+
+        def enqueue(kind, payload):
+            enqueued.append((kind, payload))
+            flushed.set()
+
+        with mock.patch.object(jobs, 'enqueue', enqueue), mock.patch.object(tasks, 'connection'), \
+                mock.patch('atexit.register') as register:
+            self.assertIsNone(buffer.add('p1'))
+            self.assertIsNone(buffer.add('p1'))
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(enqueued, [('apply_view_counts', {'counts': {'p1': 2}})])
+        register.assert_called_once_with(buffer.flush)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'], REPLICA_MAX_LAG_SECONDS=2)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        db_router.lag_monitor.reset()
+        self.addCleanup(db_router.lag_monitor.reset)
+        db_router.lag_monitor.record('replica_a', 0.5)
+        db_router.lag_monitor.record('replica_b', 30)
+
+    def route(self, method, cookies=None):
+        """经过中间件处理一个请求，返回请求中读、写查询会使用的库和响应"""
+        router = db_router.PrimaryReplicaRouter()
+        seen = {}
+
+        def view(request):
+            seen['read'] = {router.db_for_read(Product) for _ in range(5)}
+            seen['write'] = router.db_for_write(Product)
+            return HttpResponse()
+        request = getattr(RequestFactory(), method.lower())('/api/products/')
+        request.COOKIES.update(cookies or {})
+        response = db_router.ReplicaRoutingMiddleware(view)(request)
+        return seen['read'], seen['write'], response
+
+    def test_reads_go_to_healthy_replica_and_writes_to_primary(self):
+        self.assertEqual(self.route('GET')[:2], ({'replica_a'}, 'default'))
+        reads, write, response = self.route('POST')
+        self.assertEqual((reads, write), ({'default'}, 'default'))
+        self.assertIn('unitrade_primary', response.cookies)
+        # 写入后带着粘滞 cookie 的读请求仍走主库
+        self.assertEqual(self.route('GET', {'unitrade_primary': '1'})[0], {'default'})
+        # 请求之外（管理命令、后台任务）读主库
+        self.assertEqual(db_router.PrimaryReplicaRouter().db_for_read(Product), 'default')
+
+    def test_lagging_replicas_are_skipped(self):
+        db_router.lag_monitor.record('replica_a', 5)
+        self.assertEqual(self.route('GET')[0], {'default'})
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username='archive_seller', password='x')
+        cls.buyer = User.objects.create_user(username='archive_buyer', password='x')
+        old = timezone.now() - timedelta(days=400)
+        cls.finished = []
+        for i in range(3):
+            product = Product.objects.create(
+                seller=cls.seller, buyer=cls.buyer, title=f'old {i}', price=10, description='',
+                category='Other', image='https://example.com/x.png', status='RECEIVED')
+            cls.finished.append(product.pk)
+        cls.active = Product.objects.create(
+            seller=cls.seller, title='new', price=10, description='', category='Other',
+            image='https://example.com/y.png')
+        Product.objects.filter(pk__in=cls.finished).update(updated_at=old)
+        Review.objects.create(seller=cls.seller, buyer=cls.buyer, product_id=cls.finished[0], rating=5, content='ok')
+        cls.buyer.wishlist.add(cls.finished[1])
+        for i in range(4):
+            Message.objects.create(sender=cls.buyer, receiver=cls.seller, content=f'm{i}')
+        Message.objects.filter(content__in=['m0', 'm1']).update(timestamp=old)
+
+    def test_archived_rows_are_still_readable(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        before = {
+            'profile': self.client.get(f'/api/users/{self.buyer.pk}/profile_data/').json(),
+            'detail': self.client.get(f'/api/products/{self.finished[0]}/').json(),
+            'messages': client.get(f'/api/messages/?userId={self.buyer.pk}').json(),
+            'reviews': self.client.get(f'/api/reviews/?sellerId={self.seller.pk}').json(),
+        }
+
+        self.assertEqual(archive.run(archive.archive_products(batch_size=2))[0], 3)
+        self.assertEqual(archive.run(archive.archive_messages())[0], 2)
+        self.assertEqual(Product.objects.filter(seller=self.seller).count(), 1)
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(ArchivedMessage.objects.count(), 2)
+        self.assertFalse(self.buyer.wishlist.exists())
+
+        profile = self.client.get(f'/api/users/{self.buyer.pk}/profile_data/').json()
+        self.assertEqual(sorted(row['id'] for row in profile['bought']), sorted(self.finished))
+        detail = self.client.get(f'/api/products/{self.finished[0]}/').json()
+        # 归档商品不再计浏览量，详情页缓冲中尚未写入的浏览量也不会写入
+        self.assertEqual({**detail, 'viewCount': None}, {**before['detail'], 'viewCount': None})
+        self.assertEqual(self.client.get(f'/api/products/{self.finished[0]}/?hideSold=true').status_code, 404)
+        self.assertEqual(client.get(f'/api/messages/?userId={self.buyer.pk}').json(), before['messages'])
+        self.assertEqual(self.client.get(f'/api/reviews/?sellerId={self.seller.pk}').json(), before['reviews'])
+        self.assertNotIn(self.active.pk, {row['id'] for row in profile['bought']})
+
+    def test_interrupted_run_resumes_without_duplicates(self):
+        batches = archive.archive_products(batch_size=1)
+        self.assertEqual(next(batches), 1)
+        batches.close()  # 模拟进程在两批之间中断
+        self.assertEqual(ArchivedProduct.objects.count(), 1)
+        self.assertEqual(archive.run(archive.archive_products(batch_size=1))[0], 2)
+        self.assertEqual(sorted(ArchivedProduct.objects.values_list('id', flat=True)), sorted(self.finished))
+        # 最近修改过的已结束商品不归档
+        Product.objects.filter(pk=self.active.pk).update(status='BANNED')
+        self.assertEqual(archive.run(archive.archive_products())[0], 0)
+
+    def test_deleting_outside_the_archive_removes_reviews(self):
+        Review.objects.create(seller=self.seller, buyer=self.buyer, product=self.active, rating=4, content='ok')
+        Product.objects.filter(pk__in=[self.active.pk, self.finished[1]]).delete()  # 如 admin 的批量删除
+        self.assertFalse(Review.objects.filter(product_id=self.active.pk).exists())
+        archive.run(archive.archive_products())
+        self.assertTrue(Review.objects.filter(product_id=self.finished[0]).exists())
+
+
+class SuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username='suggest_seller', password='x')
+        for title, views, tags, status in [
+            ('Wireless Mouse', 5, ['tech'], 'ACTIVE'),
+            ('wireless  mouse', 1, ['tech'], 'ACTIVE'),
+            ('Wireless Keyboard', 50, ['tech', 'pc'], 'ACTIVE'),
+            ('Wireless Headphones', 500, ['audio'], 'SOLD'),
+            ('Wooden Desk', 9, ['wooden'], 'ACTIVE'),
+        ]:
+            Product.objects.create(seller=cls.seller, title=title, price=1, description='', category='Other',
+                                   image='https://example.com/x.png', view_count=views, tags=tags, status=status)
+
+    def setUp(self):
+        suggest.index.reset()
+        self.addCleanup(suggest.index.reset)
+
+    def test_prefix_matches_ranked_by_popularity(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/products/suggest/?q=WIRE').json()
+        # 只有在售商品；大小写和空白不同的重复标题只出现一次
+        self.assertEqual([row['title'] for row in data['titles']], ['Wireless Keyboard', 'Wireless Mouse'])
+        self.assertEqual(self.client.get('/api/products/suggest/?q=w').json()['tags'], ['wooden'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/products/suggest/?q=t').json()['tags'], ['tech'])
+
+    def test_product_changes_update_index(self):
+        suggest.index.suggest('')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                seller=self.seller, title='Wireless Charger', price=1, description='', category='Other',
+                image='https://example.com/x.png', view_count=20)
+        titles = [row['title'] for row in suggest.index.suggest('wireless c')['titles']]
+        self.assertEqual(titles, ['Wireless Charger'])
+
+        keyboard = Product.objects.get(title='Wireless Keyboard')
+        with self.captureOnCommitCallbacks(execute=True):
+            keyboard.status = 'SOLD'
+            keyboard.save()
+            product.delete()
+        titles = [row['title'] for row in suggest.index.suggest('wireless')['titles']]
+        self.assertEqual(titles, ['Wireless Mouse'])
+
+    def test_cached_prefixes_match_full_scan(self):
+        rng = random.Random(1)
+        entries = [(''.join(rng.choices('abc', k=rng.randint(1, 6))), rng.randint(0, 100), i) for i in range(3000)]
+        prefix_index = suggest.PrefixIndex(entries, scan_limit=20)
+        self.assertIn('a', prefix_index.top)
+        for prefix in ['', 'a', 'ab', 'cab', 'abca', 'bbbbbb', 'x']:
+            expected = sorted((-score, key) for key, score, _ in entries if key.startswith(prefix))[:10]
+            positions = prefix_index.search(prefix, 10)
+            self.assertEqual([(-prefix_index.scores[p], prefix_index.keys[p]) for p in positions], expected)
+
+
+@unittest.skipIf(credit.np is None, 'numpy is not installed')
+class CreditScoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username='credit_seller', password='x')
+        cls.buyer = User.objects.create_user(username='credit_buyer', password='x')
+        cls.idle = User.objects.create_user(username='credit_idle', password='x')
+        cls.banned = User.objects.create_user(username='credit_banned', password='x', is_banned=True)
+        for i in range(3):
+            product = Product.objects.create(
+                seller=cls.seller, buyer=cls.buyer, title=f'sold {i}', price=1, description='',
+                category='Other', image='https://example.com/x.png', status='RECEIVED')
+            Review.objects.create(seller=cls.seller, buyer=cls.buyer, product=product, rating=5, content='')
+        Product.objects.create(seller=cls.banned, title='bad', price=1, description='', category='Other',
+                               image='https://example.com/x.png', status='BANNED')
+
+    def scores(self):
+        return dict(User.objects.values_list('username', 'credit_score'))
+
+    def test_full_recompute_matches_rules(self):
+        run = credit.recompute()
+        self.assertEqual((run.mode, run.users_scored), ('full', 4))
+        scores = self.scores()
+        self.assertEqual(scores['credit_idle'], credit.BASE_SCORE)
+        self.assertGreater(scores['credit_seller'], scores['credit_buyer'])
+        self.assertGreater(scores['credit_buyer'], credit.BASE_SCORE)
+        self.assertLess(scores['credit_banned'], credit.BASE_SCORE - credit.BANNED_USER_PENALTY)
+        # 分数不变时不写入
+        self.assertEqual(credit.recompute().users_changed, 0)
+
+    def test_incremental_only_rescores_users_with_events(self):
+        first = credit.recompute()
+        User.objects.filter(pk=self.idle.pk).update(credit_score=1)  # 增量模式不会重算它
+        Product.objects.create(seller=self.buyer, title='banned later', price=1, description='',
+                               category='Other', image='https://example.com/x.png', status='BANNED')
+        before = self.scores()['credit_buyer']
+        run = credit.recompute(incremental=True)
+        self.assertEqual((run.mode, run.since, run.users_changed), ('incremental', first.started_at, 1))
+        scores = self.scores()
+        self.assertLess(scores['credit_buyer'], before)
+        self.assertEqual(scores['credit_idle'], 1)
+
+
+class SavedSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='ss_admin', password='x', role='ADMIN')
+        cls.seller = User.objects.create_user(username='ss_seller', password='x')
+        cls.alice = User.objects.create_user(username='ss_alice', password='x')
+        cls.bob = User.objects.create_user(username='ss_bob', password='x')
+
+    def save_search(self, user, **data):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post('/api/saved-searches/', data, format='json')
+
+    def list_product(self, **data):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        payload = {'title': 'Sony 降噪耳机 WH-1000XM4', 'price': '800.00', 'description': 'wireless headphones',
+                   'category': 'Electronics', 'image': 'https://example.com/x.png', 'tags': ['Audio']}
+        payload.update(data)
+        response = client.post('/api/products/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def test_new_listing_notifies_matching_searches_once_per_user(self):
+        self.assertEqual(self.save_search(self.alice, keywords='sony headphones', maxPrice='1000').status_code, 201)
+        self.save_search(self.alice, keywords='耳机', category='Electronics')
+        self.save_search(self.bob, keywords='headphones', minPrice='900')  # 价格不符
+        self.save_search(self.bob, keywords='bose headphones')  # 缺少关键词
+        self.save_search(self.bob, tags=['audio', 'gaming'])  # 缺少标签
+        self.save_search(self.seller, keywords='sony')  # 卖家本人不通知
+        self.assertEqual(self.save_search(self.bob, keywords='  ').status_code, 400)
+
+        product_id = self.list_product()
+        self.assertFalse(Message.objects.filter(msg_type='SYSTEM').exists())
+        jobs.run_pending()
+        notified = list(Message.objects.filter(msg_type='SYSTEM').values_list('receiver_id', 'content'))
+        self.assertEqual([receiver for receiver, _ in notified], [self.alice.pk])
+        self.assertIn(product_id, notified[0][1])
+
+    def test_only_anchor_candidates_are_loaded(self):
+        for i in range(20):
+            self.save_search(self.bob if i % 2 else self.alice, keywords=f'unrelated{i} desk')
+        self.save_search(self.bob, keywords='desk', category='Furniture')
+        search = SavedSearch.objects.get(keywords='unrelated3 desk')
+        self.assertEqual(search.anchor, 'unrelated3')
+
+        product = Product(seller=self.seller, title='Wooden desk', description='', category='Furniture',
+                          price=50, tags=[])
+        self.assertEqual([s.keywords for s in saved_searches.candidates(product)], ['desk'])
+        self.assertEqual(len(saved_searches.matches(product)), 1)
+
+
+@override_settings(OBJECT_CACHE_ENABLED=True, OBJECT_CACHE_SYNC_SECONDS=0)
+class ObjectCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username='oc_seller', password='x', wallet_balance=100)
+        cls.buyer = User.objects.create_user(username='oc_buyer', password='x')
+        cls.products = [
+            Product.objects.create(seller=cls.seller, title=f'cached {i}', price=10, description='',
+                                   category='Other', image='https://example.com/x.png', tags=['a'])
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        objcache.cache.reset()
+
+    def product_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            data = self.client.get(url).json()
+        return data, [query['sql'] for query in captured if '"api_product"' in query['sql']]
+
+    def test_reads_are_cached_and_writes_refresh_the_row(self):
+        url = f'/api/products/{self.products[0].pk}/'
+        self.assertEqual(len(self.product_queries(url)[1]), 1)
+        data, queries = self.product_queries(url)
+        self.assertEqual((data['status'], queries), ('ACTIVE', []))
+
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        client.post(f'{url}purchase/', {'buyerId': self.buyer.pk}, format='json')
+        self.assertEqual(self.client.get(url).json()['status'], 'SOLD')
+
+        user_url = f'/api/users/{self.seller.pk}/'
+        self.assertEqual(self.client.get(user_url).json()['walletBalance'], 100.0)
+        client.force_authenticate(self.seller)
+        client.post(f'{user_url}withdraw/', {'amount': 40}, format='json')
+        self.assertEqual(self.client.get(user_url).json()['walletBalance'], 60.0)
+
+    def test_invalidations_from_other_processes(self):
+        url = f'/api/products/{self.products[1].pk}/'
+        self.client.get(url)
+        # 另一个进程的修改：本进程收不到信号，读到失效记录前仍返回旧行
+        Product.objects.filter(pk=self.products[1].pk).update(title='changed')
+        self.assertEqual(self.client.get(url).json()['title'], 'cached 1')
+        CacheInvalidation.objects.create(model='product', object_id=self.products[1].pk)
+        self.assertEqual(self.client.get(url).json()['title'], 'changed')
+        self.assertIn('unitrade_object_cache_evictions_total{model="product",reason="remote"} 1',
+                      metrics.render_prometheus())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=self.products[2].pk).save()
+        self.assertTrue(CacheInvalidation.objects.filter(object_id=self.products[2].pk).exists())
+
+    def test_only_serialized_user_columns_are_cached(self):
+        user = objcache.get(User, self.seller.pk)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertEqual(self.client.get(f'/api/users/{self.seller.pk}/').json()['username'], 'oc_seller')
+        self.assertFalse(any(self.seller.password in values for values, _ in objcache.cache._entries.values()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.save(update_fields=['last_login'])
+        self.assertFalse(CacheInvalidation.objects.filter(object_id=self.seller.pk).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.save(update_fields=['updated_at'])
+        self.assertTrue(CacheInvalidation.objects.filter(object_id=self.seller.pk).exists())
+
+    @override_settings(OBJECT_CACHE_MAX_ENTRIES=2)
+    def test_capacity_and_instances_are_copies(self):
+        for product in self.products:
+            objcache.get(Product, product.pk)
+        first = objcache.get(Product, self.products[0].pk)  # 已被淘汰，重新载入
+        first.tags.append('mutated')
+        self.assertEqual(objcache.get(Product, self.products[0].pk).tags, ['a'])
+        samples = {(name, labels): value for name, labels, value in objcache.cache.collect()}
+        self.assertEqual(samples['unitrade_object_cache_evictions_total',
+                                 (('model', 'product'), ('reason', 'capacity'))], 2)
+        self.assertEqual(samples['unitrade_object_cache_requests_total',
+                                 (('model', 'product'), ('result', 'hit'))], 1)
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_STORE_PATH=None,
+                   THROTTLE_BUCKETS={'client': (10, 0.0), 'login': (2, 0.0)},
+                   THROTTLE_COSTS={'login': 1, 'search': 3})
+class ThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='throttle_user', password='x')
+
+    def setUp(self):
+        throttling.reset_store()
+
+    def test_limited_requests_are_rejected_before_the_view(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/auth/login/', {'username': 'throttle_user', 'password': 'x'})
+                             .status_code, 200)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/auth/login/', {'username': 'throttle_user', 'password': 'x'})
+        self.assertEqual((response.status_code, response['Retry-After'], len(captured)), (429, '86400', 0))
+
+        # 搜索消耗 3 个令牌：总桶剩 8 个时只能再搜索两次，剩下的 2 个令牌仍可用于普通请求
+        statuses = [self.client.get('/api/products/?search=x').status_code for _ in range(3)]
+        statuses += [self.client.get('/api/products/').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429, 200, 200, 429])
+
+        # 登录用户按 user_id 计数，与同一 IP 的匿名请求分开
+        access = str(throttling.AccessToken.for_user(self.user))
+        self.assertEqual(self.client.get('/api/products/', HTTP_AUTHORIZATION=f'Bearer {access}').status_code, 200)
+        self.assertIn('unitrade_throttled_requests_total{bucket="login"} 1', metrics.render_prometheus())
+
+    def test_shared_store_is_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/throttle.bin'
+            first, second = throttling.SharedStore(path, 1024), throttling.SharedStore(path, 1024)
+            now = time.time()
+            results = [store.take('client:ip:1.2.3.4', 5, 1.0, 2, now) for store in (first, second, first)]
+            self.assertEqual([allowed for allowed, _ in results], [True, True, False])
+            self.assertAlmostEqual(results[-1][1], 1.0)
+            # 补充令牌按经过的时间计算；其他键不受影响
+            self.assertTrue(second.take('client:ip:1.2.3.4', 5, 1.0, 2, now + 1)[0])
+            self.assertTrue(second.take('client:ip:5.6.7.8', 5, 1.0, 5, now)[0])
+
+
+class BulkListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='bulk_admin', password='x', role='ADMIN')
+        cls.seller = User.objects.create_user(username='bulk_seller', password='x')
+        cls.buyer = User.objects.create_user(username='bulk_buyer', password='x')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    @staticmethod
+    def rows(count, **overrides):
+        return [{'title': f'Desk lamp {i}', 'price': '12.50', 'description': 'warm light', 'category': 'Furniture',
+                 'image': 'https://example.com/lamp.png', 'tags': ['lighting'], **overrides} for i in range(count)]
+
+    def test_queries_do_not_grow_with_row_count(self):
+        counts = []
+        for size in (3, 60):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.post('/api/products/bulk/', self.rows(size), format='json')
+            self.assertEqual((response.status_code, response.json()['created']), (201, size))
+            counts.append(len(captured))
+        # 只有分块（IN 分批、SQLite 每条语句的参数上限）带来的少量额外查询，与行数无关
+        self.assertLess(counts[1] - counts[0], 5)
+        created = Product.objects.filter(seller=self.seller)
+        self.assertEqual(created.count(), 63)
+        self.assertEqual(set(created.values_list('status', flat=True)), {'ACTIVE'})
+        self.assertEqual(Job.objects.filter(kind='match_saved_searches').count(), 2)
+
+    def test_per_row_errors(self):
+        rows = self.rows(3)
+        rows[1]['price'] = 'free'
+        response = self.client.post('/api/products/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [2])
+        self.assertIn('price', response.json()['errors'][0]['errors'])
+        self.assertFalse(Product.objects.exists())
+
+        response = self.client.post('/api/products/bulk/?partial=true', rows, format='json')
+        self.assertEqual((response.status_code, response.json()['created']), (201, 2))
+        self.assertEqual(self.client.post('/api/products/bulk/', {'title': 'x'}, format='json').status_code, 400)
+
+    def test_csv_import_notifies_each_user_once(self):
+        buyer = APIClient()
+        buyer.force_authenticate(self.buyer)
+        buyer.post('/api/saved-searches/', {'keywords': 'desk'}, format='json')
+        content = ('\ufefftitle,price,description,category,image,tags\n'
+                   'Oak desk,80,solid,Furniture,https://example.com/a.png,wood;study\n'
+                   'Pine desk,45,light,Furniture,https://example.com/b.png,\n'
+                   'Chair,20,comfy,Furniture,https://example.com/c.png,\n')
+        upload = SimpleUploadedFile('items.csv', content.encode(), content_type='text/csv')
+        response = self.client.post('/api/products/bulk/', {'file': upload}, format='multipart')
+        self.assertEqual((response.status_code, response.json()['created']), (201, 3))
+        self.assertEqual(Product.objects.get(title='Oak desk').tags, ['wood', 'study'])
+
+        jobs.run_pending()
+        messages = list(Message.objects.filter(msg_type='SYSTEM').values_list('receiver_id', 'content'))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][0], self.buyer.pk)
+        self.assertIn('2 件新商品', messages[0][1])
+
+        bad = SimpleUploadedFile('items.csv', b'name,price\nx,1\n', content_type='text/csv')
+        self.assertIn('missing columns',
+                      self.client.post('/api/products/bulk/', {'file': bad}, format='multipart').json()['error'])
+
+
+class PriceDropAlertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='pd_admin', password='x', role='ADMIN')
+        cls.seller = User.objects.create_user(username='pd_seller', password='x')
+        cls.product = Product.objects.create(seller=cls.seller, title='Road bike', price='100.00', description='x',
+                                             category='Sports', image='https://example.com/bike.png')
+        cls.fans = [User.objects.create_user(username=f'pd_fan{i}', password='x') for i in range(5)]
+        for fan in cls.fans:
+            fan.wishlist.add(cls.product)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def set_price(self, price):
+        response = self.client.patch(f'/api/products/{self.product.pk}/', {'price': price}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def run_alerts(self):
+        # 提醒在窗口结束时才到期
+        Job.objects.filter(kind='price_drop_alert').update(run_at=timezone.now())
+        jobs.run_pending()
+        return Message.objects.filter(msg_type='SYSTEM')
+
+    @override_settings(PRICE_ALERT_CHUNK_SIZE=2, PRICE_ALERT_CHUNKS_PER_JOB=1)
+    def test_edits_in_window_coalesce_into_one_chunked_alert(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.set_price('95.00')
+        self.assertFalse(any('api_user_wishlist' in query['sql'] for query in captured))
+        self.set_price('120.00')
+        self.set_price('80.00')
+        self.assertEqual(Job.objects.filter(kind='price_drop_alert').count(), 1)
+
+        messages = self.run_alerts()
+        self.assertEqual(sorted(messages.values_list('receiver_id', flat=True)), sorted(fan.pk for fan in self.fans))
+        self.assertEqual({message.content for message in messages},
+                         {f'您收藏的商品「Road bike」降价了：¥100.00 → ¥80.00，商品编号 {self.product.pk}'})
+        # 5 个收藏者，每块 2 个、每个任务 1 块：首个任务加 2 个后续任务
+        self.assertEqual(Job.objects.filter(kind='price_drop_alert', status='DONE').count(), 3)
+
+    def test_no_alert_when_price_is_raised_back(self):
+        self.set_price('90.00')
+        self.set_price('100.00')
+        self.assertFalse(self.run_alerts().exists())
+        self.set_price('110.00')
+        self.assertFalse(Job.objects.filter(kind='price_drop_alert', status='PENDING').exists())
+
+
+class DuplicateListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='dup_admin', password='x', role='ADMIN')
+        cls.seller = User.objects.create_user(username='dup_seller', password='x')
+        cls.other = User.objects.create_user(username='dup_other', password='x')
+
+    def post(self, user, title, description, url='/api/products/'):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(url, {'title': title, 'price': '500.00', 'description': description,
+                                 'category': 'Electronics', 'image': 'https://example.com/x.png'}, format='json')
+
+    HEADPHONES = ('Sony WH-1000XM4 noise cancelling headphones',
+                  'Barely used, comes with case and cable. Pick up at north campus.')
+    REPOST = ('Sony WH-1000XM4 noise cancelling headphones!!',
+              'Barely used, comes with case and cable. Pick up at south campus.')
+
+    @override_settings(DUPLICATE_LISTING_ACTION='reject')
+    def test_reject_near_duplicate_from_same_seller(self):
+        original = self.post(self.seller, *self.HEADPHONES).json()['id']
+        response = self.post(self.seller, *self.REPOST)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['duplicateOf'], original)
+        self.assertEqual(self.post(self.other, *self.REPOST).status_code, 201)
+        self.assertEqual(self.post(self.seller, 'Calculus textbook 8th edition',
+                                   'Some highlighting, pick up at north campus.').status_code, 201)
+        # 原商品售出后可以重新发布
+        Product.objects.filter(pk=original).update(status='SOLD')
+        self.assertEqual(self.post(self.seller, *self.REPOST).status_code, 201)
+
+    def test_flag_mode_records_duplicates_including_bulk_batches(self):
+        original = self.post(self.seller, *self.HEADPHONES).json()['id']
+        repost = self.post(self.seller, *self.REPOST).json()['id']
+        self.assertEqual(ProductFingerprint.objects.get(pk=repost).duplicate_of, original)
+
+        client = APIClient()
+        client.force_authenticate(self.other)
+        rows = [{'title': title, 'price': '500.00', 'description': description, 'category': 'Electronics',
+                 'image': 'https://example.com/x.png'} for title, description in (self.HEADPHONES, self.REPOST)]
+        created = client.post('/api/products/bulk/', rows, format='json').json()['ids']
+        self.assertEqual(ProductFingerprint.objects.get(pk=created[1]).duplicate_of, created[0])
+        with override_settings(DUPLICATE_LISTING_ACTION='reject'):
+            response = client.post('/api/products/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [1, 2])
+        self.assertIn(created[0], response.json()['errors'][0]['errors']['duplicateOf'][0])
+
+        # 改成不同的商品后不再是近似重复
+        client.force_authenticate(self.seller)
+        client.patch(f'/api/products/{repost}/', {'title': 'Calculus textbook 8th edition',
+                                                  'description': 'Some highlighting.'}, format='json')
+        self.assertEqual(ProductFingerprint.objects.get(pk=repost).duplicate_of, '')
+
+    def test_cluster_report_after_backfill(self):
+        for _ in range(3):
+            Product.objects.create(seller=self.seller, title=self.HEADPHONES[0], description=self.HEADPHONES[1],
+                                   price='1', category='x', image='https://example.com/x.png')
+        Product.objects.create(seller=self.other, title=self.REPOST[0], description=self.REPOST[1],
+                               price='1', category='x', image='https://example.com/x.png')
+        Product.objects.create(seller=self.other, title='Calculus textbook 8th edition', description='Used.',
+                               price='1', category='x', image='https://example.com/x.png')
+        self.assertEqual(duplicates.backfill(batch_size=2), 5)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        report = client.get('/api/products/duplicates/').json()
+        self.assertEqual(report['total'], 1)
+        self.assertEqual(report['clusters'][0]['size'], 3)
+        report = client.get('/api/products/duplicates/', {'sameSeller': 'false'}).json()
+        self.assertEqual((report['clusters'][0]['size'], report['clusters'][0]['sellers']), (4, 2))
+        client.force_authenticate(self.seller)
+        self.assertEqual(client.get('/api/products/duplicates/').status_code, 403)
+
+
+@unittest.skipIf(follow_suggestions.sparse is None, 'numpy / scipy is not installed')
+class FollowSuggestionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        names = ['alice', 'bob', 'carol', 'dave', 'erin', 'mallory', 'frank', 'gina', 'sam1', 'sam2']
+        cls.u = {name: User.objects.create_user(username=f'fs_{name}', password='x') for name in names}
+        User.objects.filter(pk=cls.u['mallory'].pk).update(is_banned=True)
+        u = cls.u
+        u['alice'].following.add(u['bob'], u['carol'])
+        u['bob'].following.add(u['dave'], u['erin'], u['mallory'])
+        u['carol'].following.add(u['dave'])
+        # gina 在 sam1 和 sam2 都买过东西，frank 只买过 sam1：sam2 与 sam1 相似
+        for buyer, seller in (('gina', 'sam1'), ('gina', 'sam2'), ('frank', 'sam1')):
+            Product.objects.create(seller=u[seller], buyer=u[buyer], status='SOLD', title='x', price='1',
+                                   description='x', category='x', image='https://example.com/x.png')
+
+    def suggestions(self, name):
+        client = APIClient()
+        client.force_authenticate(self.u[name])
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get('/api/users/suggestions/')
+        self.assertEqual(len(captured), 1)
+        return [(row['username'][3:], row['mutualFollows'], row['reason']) for row in response.json()]
+
+    def test_friends_of_friends_and_similar_sellers(self):
+        result = follow_suggestions.build(k=5, block_size=4)
+        self.assertEqual(result['users'], 10)
+        self.assertEqual(self.suggestions('alice'), [('dave', 2, 'follows'), ('erin', 1, 'follows')])
+        self.assertEqual([name for name, _, reason in self.suggestions('frank')], ['sam1', 'sam2'])
+        self.assertEqual({reason for _, _, reason in self.suggestions('frank')}, {'sellers'})
+
+        # 计算之后关注的人不再推荐；重新计算替换旧结果
+        self.u['alice'].following.add(self.u['dave'])
+        self.assertEqual(self.suggestions('alice'), [('erin', 1, 'follows')])
+        follow_suggestions.build(k=5, block_size=4)
+        self.assertEqual(FollowSuggestion.objects.filter(user=self.u['alice']).count(), 1)
+        self.assertEqual(APIClient().get('/api/users/suggestions/').status_code, 401)
+
+
+class IdentityMapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username='im_seller', password='x')
+        cls.buyer = User.objects.create_user(username='im_buyer', password='x')
+        cls.product = Product.objects.create(seller=cls.seller, title='Lamp', price=10, description='',
+                                             category='Other', image='https://example.com/x.png')
+
+    def test_lookups_are_batched_memoized_and_follow_writes(self):
+        with identity.scope():
+            identity.prefetch(User, [self.seller.pk, 'im_ghost'])
+            with self.assertNumQueries(1):
+                buyer = identity.get(User, self.buyer.pk)
+                self.assertEqual(identity.get(User, self.seller.pk).username, 'im_seller')
+                self.assertIsNone(identity.get(User, 'im_ghost'))
+                self.assertIs(identity.get(User, self.buyer.pk), buyer)
+
+            # 通过其他实例保存或删除时替换映射中的行，记为不存在后新建的主键也能取到
+            other = User.objects.get(pk=self.seller.pk)
+            other.bio = 'changed'
+            other.save()
+            ghost = User.objects.create(id='im_ghost', username='im_ghost')
+            with self.assertNumQueries(0):
+                self.assertEqual(identity.get(User, self.seller.pk).bio, 'changed')
+                self.assertEqual(identity.get(User, 'im_ghost'), ghost)
+            ghost.delete()
+            self.assertIsNone(identity.get(User, 'im_ghost'))
+
+    def test_serializers_batch_related_lookups(self):
+        rows = [{'senderId': self.buyer.pk, 'receiverId': self.seller.pk, 'content': f'hi {i}'} for i in range(3)]
+        with identity.scope(), self.assertNumQueries(1):
+            serializer = MessageSerializer(data=rows, many=True)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        with identity.scope(), self.assertNumQueries(2):
+            serializer = ReviewSerializer(data={'sellerId': self.seller.pk, 'buyerId': self.buyer.pk,
+                                                'productId': self.product.pk, 'rating': 5, 'content': 'ok'})
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    @override_settings(IDENTITY_MAP_DEBUG=True)
+    def test_request_reuses_authenticated_user_and_reports_avoided_queries(self):
+        client = APIClient()
+        access = str(throttling.AccessToken.for_user(self.buyer))
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = client.post(f'/api/products/{self.product.pk}/purchase/', {'buyerId': self.buyer.pk},
+                               format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Identity-Map'], 'loads=0; avoided=1; duplicates=0')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).buyer_id, self.buyer.pk)
+
+
+class BatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        bench.seed_dataset(users=20, products=150, seed=13)
+        cls.seller = User.objects.order_by('id').first()
+        cls.buyer = User.objects.create_user(username='batch_buyer', password='x')
+
+    def setUp(self):
+        self.client = APIClient()
+        access = throttling.AccessToken.for_user(self.buyer)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def batch(self, requests):
+        response = self.client.post('/api/batch/', {'requests': requests}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['responses']
+
+    def test_app_launch_reads_match_individual_calls(self):
+        paths = [f'/api/users/{self.seller.pk}/profile_data/', f'/api/messages/?userId={self.buyer.pk}',
+                 f'/api/reviews/?sellerId={self.seller.pk}', '/api/products/?sort=price_desc', '/api/products/missing/']
+        results = self.batch([{'id': path, 'path': path} for path in paths + ['/api/nowhere/']])
+        self.assertEqual([item['id'] for item in results], paths + ['/api/nowhere/'])
+        self.assertEqual(results[-1]['status'], 404)
+        for path, item in zip(paths, results):
+            expected = self.client.get(path)
+            self.assertEqual(item['status'], expected.status_code, path)
+            self.assertEqual(item['body'], expected.json(), path)
+            self.assertEqual(item['headers'].get('ETag'), expected.get('ETag'), path)
+
+        # 子请求可以带条件请求头
+        etag = results[0]['headers']['ETag']
+        [revalidated] = self.batch([{'path': paths[0], 'headers': {'If-None-Match': etag}}])
+        self.assertEqual((revalidated['id'], revalidated['status'], revalidated['body']), (0, 304, None))
+
+    def test_writes_run_in_order_with_per_item_status(self):
+        product = Product.objects.filter(status='ACTIVE').exclude(seller=self.buyer).first()
+        url = f'/api/products/{product.pk}/'
+        results = self.batch([
+            {'method': 'POST', 'path': f'{url}purchase/', 'body': {'buyerId': self.buyer.pk}},
+            {'path': url},
+            {'method': 'POST', 'path': f'{url}purchase/', 'body': {'buyerId': self.buyer.pk}},
+            {'method': 'POST', 'path': '/api/batch/', 'body': {'requests': [{'path': url}]}},
+        ])
+        self.assertEqual([item['status'] for item in results], [200, 200, 400, 400])
+        self.assertEqual(results[1]['body']['status'], 'SOLD')
+
+        response = self.client.post('/api/batch/', {'requests': [{'path': '/admin/'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_token_is_checked_per_item_so_refresh_still_works(self):
+        refresh = str(RefreshToken.for_user(self.buyer))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer expired')
+        results = self.batch([
+            {'method': 'POST', 'path': '/api/auth/refresh/', 'body': {'refresh': refresh}},
+            {'path': f'/api/messages/?userId={self.buyer.pk}'},
+        ])
+        self.assertEqual([item['status'] for item in results], [200, 401])
+        access = results[0]['body']['access']
+        [messages] = self.batch([{'path': f'/api/messages/?userId={self.buyer.pk}',
+                                  'headers': {'Authorization': f'Bearer {access}'}}])
+        self.assertEqual(messages['status'], 200)
+
+    @override_settings(THROTTLE_ENABLED=True, THROTTLE_NUM_PROXIES=1)
+    def test_sub_requests_cannot_override_client_address(self):
+        for name in ('X-Forwarded-For', 'x_forwarded_for', 'Host', 'Forwarded', 'Connection'):
+            response = self.client.post('/api/batch/', {'requests': [
+                {'method': 'POST', 'path': '/api/auth/login/', 'headers': {name: '203.0.113.7'}}]}, format='json')
+            self.assertEqual(response.status_code, 400, name)
+        sub = batch.build_request(RequestFactory().post('/api/batch/', HTTP_X_FORWARDED_FOR='198.51.100.1'),
+                                  batch.parse([{'path': '/api/products/'}])[0], None, None)
+        self.assertEqual(throttling.client_ip(sub), '198.51.100.1')
+
+
+@override_settings(BATCH_MAX_PARALLEL=3)
+class ParallelBatchTests(TransactionTestCase):
+    """并行执行需要其他连接能看到数据，不能在 TestCase 的事务中运行"""
+
+    def test_independent_reads_run_in_parallel(self):
+        bench.seed_dataset(users=10, products=60, seed=17)
+        seller = User.objects.order_by('id').values_list('id', flat=True).first()
+        client = APIClient()
+        paths = [f'/api/users/{seller}/profile_data/', f'/api/reviews/?sellerId={seller}', '/api/products/',
+                 f'/api/products/?search=a', '/api/users/']
+        threads, maps = set(), []
+        original = batch.dispatch
+
+        def record(sub):
+            threads.add(threading.get_ident())
+            maps.append(identity.current())
+            return original(sub)
+
+        with mock.patch.object(batch, 'dispatch', record):
+            response = client.post('/api/batch/', {'requests': [{'path': path} for path in paths]}, format='json')
+        for path, item in zip(paths, response.json()['responses']):
+            self.assertEqual(item['body'], client.get(path).json(), path)
+        self.assertGreater(len(threads), 1)
+        # 每个子请求一个身份映射，线程之间不共享
+        self.assertEqual(len({id(identity_map) for identity_map in maps}), len(paths))
 
-# Create your tests here.
@@ -0,0 +1,239 @@
+# api/throttling.py
+"""
+令牌桶限流：在 URL 解析之后、视图（认证、查询数据库、密码哈希）之前拒绝超额请求。
+
+- 每个客户端一个总桶 'client'：登录用户按 JWT 中的 user_id（只校验签名，不查数据库），
+  其他请求按 IP。每个请求按接口的权重（THROTTLE_COSTS）扣除令牌，搜索和登录比详情更贵。
+- THROTTLE_BUCKETS 中与接口同名的桶（如 'login'、'search'）是该接口的独立限额，同样按客户端计数。
+- 计数保存在 THROTTLE_STORE_PATH 指向的共享内存文件（mmap）中，同一台机器上的所有 worker
+  进程共用一份限额；每个桶 24 字节，按键的哈希放入固定大小的槽位表，fcntl 按字节范围加锁。
+  槽位不足时替换最久未使用的桶（相当于把它重置为满桶）。没有 fcntl 或未配置路径时只在进程内计数。
+- 超额时返回 429 和 Retry-After（距离攒够令牌的秒数）。
+"""
+import functools
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import metrics
+from .middleware import resolve_route
+from .renderers import FastJSONRenderer
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能在进程内计数
+    fcntl = None
+
+# 作用域 -> (桶容量, 每秒补充的令牌数)
+DEFAULT_BUCKETS = {'client': (120, 4.0)}
+SLOT = struct.Struct('=Qdd')  # 键的哈希（0 表示空槽）, 令牌数, 上次更新时间
+PROBES = 8  # 每个键可能落在的连续槽位数
+
+metrics.describe('unitrade_throttled_requests_total', 'counter', 'Requests rejected by rate limiting, by bucket.')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + max(now - updated, 0.0) * rate)
+
+
+def _spend(tokens, capacity, rate, cost):
+    """返回 (是否放行, 剩余令牌, 需要等待的秒数)"""
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    wait = (cost - tokens) / rate if rate > 0 else math.inf
+    return False, tokens, wait
+
+
+class LocalStore:
+    """进程内的令牌桶；多进程部署时限额相当于乘以进程数"""
+
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (令牌数, 上次更新时间, 攒满的时间)
+
+    def take(self, key, capacity, rate, cost, now):
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            allowed, tokens, wait = _spend(_refill(tokens, updated, capacity, rate, now), capacity, rate, cost)
+            full_at = now + (capacity - tokens) / rate if rate > 0 else math.inf
+            self._buckets[key] = (tokens, now, full_at)
+            if len(self._buckets) > self.MAX_KEYS:
+                # 已攒满的桶与不存在等价，删除不影响限流
+                self._buckets = {k: v for k, v in self._buckets.items() if v[2] > now}
+        return allowed, wait
+
+
+class SharedStore:
+    """mmap 共享文件中的令牌桶，同一台机器上的进程共用"""
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = max(slots, PROBES)
+        self._lock = threading.Lock()  # fcntl 锁只在进程之间互斥
+        self._pid = None
+        self._fd = self._map = None
+
+    def _open(self):
+        # fork 出的 worker 各自重新打开，fcntl 锁属于打开它的进程
+        size = self.slots * SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd, self._map, self._pid = fd, mmap.mmap(fd, size), os.getpid()
+
+    def take(self, key, capacity, rate, cost, now):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, 'little') or 1
+        offset = key_hash % (self.slots - PROBES + 1) * SLOT.size
+        length = PROBES * SLOT.size
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                position, tokens, updated = None, capacity, now
+                oldest = math.inf
+                for i in range(PROBES):
+                    slot = offset + i * SLOT.size
+                    slot_hash, slot_tokens, slot_updated = SLOT.unpack_from(self._map, slot)
+                    if slot_hash == key_hash:
+                        position, tokens, updated = slot, slot_tokens, slot_updated
+                        break
+                    if slot_hash == 0:
+                        # 从不删除槽位，遇到空槽说明该键不在表中
+                        position = slot
+                        break
+                    if slot_updated < oldest:
+                        position, oldest = slot, slot_updated
+                allowed, tokens, wait = _spend(_refill(tokens, updated, capacity, rate, now), capacity, rate, cost)
+                SLOT.pack_into(self._map, position, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+        return allowed, wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = _setting('THROTTLE_STORE_PATH', None)
+                if path and fcntl is not None:
+                    _store = SharedStore(str(path), _setting('THROTTLE_STORE_SLOTS', 65536))
+                else:
+                    _store = LocalStore()
+    return _store
+
+
+def reset_store():
+    """丢弃当前的计数（测试用；共享文件中的计数不受影响）"""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+@functools.lru_cache(maxsize=4096)
+def _token_claims(raw):
+    """校验 access token 的签名和有效期（不查数据库），返回 (user_id, exp)"""
+    try:
+        token = AccessToken(raw)
+    except TokenError:
+        return None, 0
+    return token.get(jwt_settings.USER_ID_CLAIM), token.get('exp', 0)
+
+
+def client_ip(request):
+    """REMOTE_ADDR；部署在 THROTTLE_NUM_PROXIES 层反向代理之后时取 X-Forwarded-For 中对应的地址"""
+    proxies = _setting('THROTTLE_NUM_PROXIES', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_identity(request):
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if header.startswith('Bearer '):
+        user_id, expires = _token_claims(header[7:].strip())
+        if user_id is not None and expires > time.time():
+            return f'u:{user_id}'
+    return f'ip:{client_ip(request)}'
+
+
+def endpoint_name(request, route):
+    """限流使用的接口名：登录为 'login'，带搜索词的商品列表为 'search'，其他为路由名"""
+    if route == 'token_obtain_pair':
+        return 'login'
+    if route in ('product-list', 'async-product-list') and request.GET.get('search'):
+        return 'search'
+    return route
+
+
+def check(request, endpoint, now=None):
+    """放行时返回 None，否则返回 (桶名, 需要等待的秒数)"""
+    now = time.time() if now is None else now
+    buckets = _setting('THROTTLE_BUCKETS', DEFAULT_BUCKETS)
+    identity = client_identity(request)
+    store = get_store()
+    checks = []
+    if endpoint in buckets:
+        checks.append((endpoint, 1))
+    checks.append(('client', _setting('THROTTLE_COSTS', {}).get(endpoint, 1)))
+    for scope, cost in checks:
+        capacity, rate = buckets[scope]
+        allowed, wait = store.take(f'{scope}:{identity}', capacity, rate, cost, now)
+        if not allowed:
+            return scope, wait
+    return None
+
+
+def throttled_response(scope, wait):
+    metrics.inc('unitrade_throttled_requests_total', (('bucket', scope),))
+    retry_after = max(1, math.ceil(min(wait, 86400)))
+    body = {'detail': f'Request was throttled. Expected available in {retry_after} seconds.'}
+    response = HttpResponse(FastJSONRenderer().render(body), content_type='application/json', status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class ThrottleMiddleware:
+    """在视图执行前检查令牌桶；需放在 PerformanceMiddleware 之后，被拒绝的请求同样计入指标"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not _setting('THROTTLE_ENABLED', False) or request.method == 'OPTIONS':
+            return None
+        route, _ = getattr(request, '_perf_route', None) or resolve_route(request, view_func)
+        result = check(request, endpoint_name(request, route))
+        return None if result is None else throttled_response(*result)
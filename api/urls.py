@@ -3,16 +3,34 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 # 修改导入，引入您自定义的 View
-from .views import ProductViewSet, UserViewSet, MessageViewSet, ReviewViewSet, MyTokenObtainPairView
+from .views import ProductViewSet, UserViewSet, MessageViewSet, ReviewViewSet, MyTokenObtainPairView, MetricsView,\
+    ProfileListView, ProfileDownloadView, ImageUploadView, SavedSearchViewSet, product_suggestions
+from . import async_views
+from .batch import BatchView
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'messages', MessageViewSet, basename='message')
 router.register(r'reviews', ReviewViewSet, basename='review')
+router.register(r'saved-searches', SavedSearchViewSet, basename='saved-search')
 
 urlpatterns = [
     # 将 TokenObtainPairView 替换为 MyTokenObtainPairView
     path('auth/login/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # 一次提交多个子请求（见 api/batch.py）
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:profile_id>/', ProfileDownloadView.as_view(), name='profile-download'),
+    # 必须在 router 之前，否则会被商品详情路由 products/<pk>/ 匹配
+    path('products/suggest/', product_suggestions, name='product-suggest'),
+    path('uploads/images/', ImageUploadView.as_view(), name='image-upload'),
+    # 热点只读接口的异步版本（ASGI 部署时使用），输出与上面的同步接口一致
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<str:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/users/<str:pk>/profile_data/', async_views.profile_data, name='async-user-profile-data'),
+    path('async/messages/', async_views.message_list, name='async-message-list'),
+    path('async/reviews/', async_views.review_list, name='async-review-list'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
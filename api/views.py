@@ -1,13 +1,23 @@
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
+from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.exceptions import ValidationError
+from django.db.models import Q, Max, Count, Case, When, IntegerField
+from django.conf import settings
+from django.http import HttpResponse, FileResponse, Http404
+import mimetypes
 from django.shortcuts import get_object_or_404
-from .models import User, Product, Message, Review
-from .serializers import UserSerializer, ProductSerializer, MessageSerializer, ReviewSerializer
+from .models import User, Product, Message, Review, ArchivedProduct, SavedSearch, FollowSuggestion
+from .serializers import UserSerializer, ProductSerializer, MessageSerializer, ReviewSerializer, \
+    SavedSearchSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import MyTokenObtainPairSerializer # 确保导入了它
 import decimal  # 处理钱包余额计算
+from . import archive, conditional, duplicates, fastpath, fieldsets, identity, listings, media, metrics, objcache, \
+    profiling, suggest, tasks
+from .renderers import FastJSONRenderer
 
 # 自定义权限类：检查用户角色是否为 ADMIN
 class IsAdminRole(permissions.BasePermission):
@@ -21,44 +31,244 @@ class IsAdminRole(permissions.BasePermission):
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
-class UserViewSet(viewsets.ModelViewSet):
+# 管理员接口：Prometheus 文本格式的性能指标
+class MetricsView(APIView):
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# 管理员接口：列出按需分析生成的 profile
+class ProfileListView(APIView):
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        return Response(profiling.list_profiles())
+
+# 管理员接口：下载 profile，kind=collapsed（火焰图输入）或 json（含 SQL 时间线）
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminRole]
+
+    def get(self, request, profile_id):
+        kind = request.query_params.get('kind', 'collapsed')
+        path = profiling.profile_path(profile_id, kind)
+        if path is None:
+            raise Http404
+        return FileResponse(path.open('rb'), as_attachment=True, filename=path.name)
+
+# 图片上传：原图按内容哈希去重存储，缩略图在后台进程池生成
+class ImageUploadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        uploaded = request.FILES.get('file')
+        if uploaded is None:
+            return Response({'error': 'No file provided'}, status=400)
+        try:
+            data = media.handle_upload(uploaded)
+        except media.UploadRejected as exc:
+            return Response({'error': str(exc)}, status=400)
+        except media.PoolSaturated:
+            response = Response({'error': 'Image processing is busy, please retry'}, status=503)
+            response['Retry-After'] = '2'
+            return response
+        return Response(data, status=200 if data['deduplicated'] else 201)
+
+# 图片文件服务：内容寻址的文件永不变化，可长期缓存；回退为原图的响应不能缓存，
+# 否则变体生成后客户端 / CDN 仍会一直拿到原图
+def serve_image(request, digest, name):
+    path, is_fallback = media.resolve_file(digest, name)
+    if path is None:
+        raise Http404
+    if is_fallback:
+        media.rerender_missing(digest, path)
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', None)
+    if accel_prefix:
+        # 交给 nginx (X-Accel-Redirect) 直接发送文件
+        response = HttpResponse(content_type=mimetypes.guess_type(path.name)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = accel_prefix + path.relative_to(settings.MEDIA_ROOT).as_posix()
+    else:
+        # FileResponse 分块流式输出，WSGI 服务器支持时走 wsgi.file_wrapper (sendfile)
+        response = FileResponse(path.open('rb'))
+    if is_fallback:
+        response['Cache-Control'] = 'no-cache'
+    else:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# 搜索框输入联想：查询进程内的前缀索引（见 api/suggest.py），不访问数据库
+def product_suggestions(request):
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except ValueError:
+        limit = 8
+    data = suggest.index.suggest(request.GET.get('q', ''), limit)
+    response = HttpResponse(FastJSONRenderer().render(data), content_type='application/json')
+    # 每次按键都会请求，允许浏览器 / CDN 短时间缓存
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'SUGGEST_CACHE_SECONDS', 30)}"
+    return response
+
+class SparseFieldsViewMixin:
+    """
+    稀疏字段集（见 api/fieldsets.py）：GET 请求按 fields / omit / preset 裁剪序列化字段，
+    详情接口同时用 only() 只查询需要的列。
+    """
+    sparse_resource = None
+    # only() 时必须保留的列（如计算 ETag 用的 updated_at）
+    sparse_required_columns = ()
+
+    @property
+    def sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            if self.request.method == 'GET':
+                self._sparse_fields = fieldsets.select_fields(self.request, self.sparse_resource)
+        return self._sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        if self.sparse_fields is not None:
+            kwargs.setdefault('fields', self.sparse_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def trim_columns(self, queryset):
+        if self.action == 'retrieve' and self.sparse_fields is not None:
+            queryset = queryset.only(*fieldsets.model_columns(
+                self.sparse_resource, self.sparse_fields, self.sparse_required_columns))
+        return queryset
+
+class CachedObjectMixin:
+    """
+    get_object 先查请求的身份映射（见 api/identity.py），只读请求再查进程内对象缓存（见 api/objcache.py），
+    写请求未命中时查询数据库；取到的对象放入身份映射
+    """
+
+    def object_cache_usable(self):
+        # 详情查询不带额外筛选条件时，按主键取到的对象与 get_queryset 的结果相同
+        return True
+
+    def get_object(self):
+        if not self.object_cache_usable():
+            return identity.add(super().get_object())
+        model = self.queryset.model
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        obj = identity.peek(model, pk)
+        if obj is None:
+            if self.request.method not in permissions.SAFE_METHODS or not objcache.enabled():
+                return identity.add(super().get_object())
+            obj = identity.add(objcache.get(model, pk))
+        if obj is None or obj is identity.MISSING:
+            raise Http404(f'No {model._meta.object_name} matches the given query.')
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+class UserViewSet(CachedObjectMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    sparse_resource = 'user'
+    # profile_data 的 ETag 由这些聚合值计算
+    PROFILE_STATE = {'latest': Max('updated_at'), 'count': Count('id')}
+
+    def get_queryset(self):
+        return self.trim_columns(super().get_queryset())
+
+    # 列表走 values_list 快速序列化路径，输出与 UserSerializer 一致
+    def list(self, request, *args, **kwargs):
+        return Response(fastpath.user_rows(self.filter_queryset(self.get_queryset()), self.sparse_fields))
 
     def get_permissions(self):
         if self.action in ['admin_list', 'toggle_ban']:
             return [IsAdminRole()]
-        if self.action in ['toggle_follow', 'toggle_wishlist']:
+        if self.action in ['toggle_follow', 'toggle_wishlist', 'suggestions']:
             return [permissions.IsAuthenticated()]  # 仅限登录用户
         return [permissions.AllowAny()]
 
+    # 推荐关注（见 api/follow_suggestions.py）：一条按 (user, rank) 索引的查询，排除计算之后已关注和被封禁的人
+    @action(detail=False, methods=['get'])
+    def suggestions(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=400)
+        followed = User.following.through.objects.filter(from_user_id=request.user.pk).values('to_user_id')
+        rows = (FollowSuggestion.objects.filter(user_id=request.user.pk)
+                .exclude(suggested_id__in=followed).exclude(suggested__is_banned=True)
+                .select_related('suggested')
+                .only('score', 'mutual_follows', 'reason', 'suggested__id', 'suggested__username',
+                      'suggested__avatar', 'suggested__bio', 'suggested__credit_score')
+                .order_by('rank')[:limit])
+        return Response([{
+            'id': row.suggested.pk,
+            'username': row.suggested.username,
+            'avatar': row.suggested.avatar,
+            'avatarVariants': media.variant_urls(row.suggested.avatar),
+            'bio': row.suggested.bio,
+            'creditScore': row.suggested.credit_score,
+            'score': row.score,
+            'mutualFollows': row.mutual_follows,
+            'reason': row.reason,
+        } for row in rows])
+
     # 对应 api.ts 中的 users.getProfileData
     @action(detail=True, methods=['get'])
     def profile_data(self, request, pk=None):
         user = self.get_object()
-        listings = Product.objects.filter(seller=user, status='ACTIVE')
-        sold = Product.objects.filter(seller=user, status='SOLD')
-        bought = Product.objects.filter(buyer=user)
-
-        return Response({
-            'listings': ProductSerializer(listings, many=True).data,
-            'sold': ProductSerializer(sold, many=True).data,
-            'bought': ProductSerializer(bought, many=True).data,
-            'wishlist': ProductSerializer(user.wishlist.all(), many=True).data,
-            'followedUsers': UserSerializer(user.following.all(), many=True).data
-        })
+        # 先用聚合查询算出校验器，未变化时直接返回 304，不查询和序列化五个列表
+        state = [queryset.aggregate(**self.PROFILE_STATE) for queryset in self.profile_state_querysets(user)]
+        etag, last_modified = self.profile_validators(user, *state)
+        return conditional.conditional_response(
+            request, etag, last_modified, lambda: Response(self.profile_payload(user)))
+
+    @staticmethod
+    def profile_state_querysets(user):
+        return (Product.objects.filter(Q(seller=user) | Q(buyer=user)), user.wishlist.all(), user.following.all())
+
+    @staticmethod
+    def profile_validators(user, products, wishlist, following):
+        etag = conditional.make_etag(
+            'profile', user.pk, user.updated_at,
+            products['latest'], products['count'], wishlist['latest'], wishlist['count'],
+            following['latest'], following['count'],
+        )
+        last_modified = conditional.latest(
+            user.updated_at, products['latest'], wishlist['latest'], following['latest'])
+        return etag, last_modified
+
+    @staticmethod
+    def profile_querysets(user):
+        """profile_data 的五个列表，同步和异步视图共用"""
+        return {
+            'listings': Product.objects.filter(seller=user, status='ACTIVE'),
+            'sold': Product.objects.filter(seller=user, status='SOLD'),
+            'bought': Product.objects.filter(buyer=user),
+            'archivedBought': archive.archived_purchases(user),  # 并入 bought，排在前面
+            'wishlist': user.wishlist.all(),
+            'followedUsers': user.following.all(),
+        }
+
+    @classmethod
+    def profile_payload(cls, user):
+        querysets = cls.profile_querysets(user)
+        followed = querysets.pop('followedUsers')
+        archived = querysets.pop('archivedBought')
+        payload = {key: fastpath.product_rows(queryset) for key, queryset in querysets.items()}
+        payload['bought'] = fastpath.product_rows(archived) + payload['bought']
+        payload['followedUsers'] = fastpath.user_rows(followed)
+        return payload
 
     # 对应 api.ts 中的 auth.updateWishlist
     @action(detail=True, methods=['post'])
     def toggle_wishlist(self, request, pk=None):
         user = self.get_object()
         product_id = request.data.get('productId')
-        product = get_object_or_404(Product, id=product_id)
+        product = identity.get_or_404(Product, product_id)
 
         if product in user.wishlist.all():
             user.wishlist.remove(product)
         else:
             user.wishlist.add(product)
+        # 多对多变化不会刷新 updated_at，手动刷新以使 profile_data 的 ETag 失效
+        user.save(update_fields=['updated_at'])
         return Response(UserSerializer(user).data)
 
     # 管理员接口：获取所有用户列表（支持分页和筛选）
@@ -95,7 +305,7 @@ class UserViewSet(viewsets.ModelViewSet):
         users = queryset[start:end]
         
         return Response({
-            'results': UserSerializer(users, many=True).data,
+            'results': fastpath.user_rows(users, fieldsets.select_fields(request, 'user')),
             'total': total,
             'page': page,
             'pageSize': page_size,
@@ -117,7 +327,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
         # 获取要被关注的目标用户 ID
         target_id = request.data.get('targetId')
-        target_user = get_object_or_404(User, id=target_id)
+        target_user = identity.get_or_404(User, target_id)
 
         # 防止自己关注自己
         if user.id == target_user.id:
@@ -128,6 +338,7 @@ class UserViewSet(viewsets.ModelViewSet):
             user.following.remove(target_user)
         else:
             user.following.add(target_user)
+        user.save(update_fields=['updated_at'])
 
         # 返回更新后的用户信息（包含新的 following 列表）
         return Response(UserSerializer(user).data)
@@ -146,19 +357,102 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response({'status': 'success', 'newBalance': float(user.wallet_balance)})
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+def filter_products(queryset, params):
+    """商品列表的搜索、筛选和排序；同步 ViewSet 和 api/async_views.py 共用"""
+    # 搜索功能 (对应 api.ts list params.search)
+    search = params.get('search')
+    if search:
+        queryset = queryset.filter(
+            Q(title__icontains=search) | Q(description__icontains=search)
+        )
+
+    # 隐藏已售出/确认收货/下架商品 (对应 api.ts list params.hideSold)
+    hide_sold = params.get('hideSold')
+    if hide_sold == 'true':
+        queryset = queryset.exclude(status__in=['SOLD', 'RECEIVED', 'BANNED'])
+
+    # 排序功能 (对应 api.ts list params.sort)
+    sort = params.get('sort')
+    
+    # 定义状态优先级：ACTIVE > 其他状态（SOLD/RECEIVED/BANNED 排在最后）
+    status_priority = Case(
+        When(status='ACTIVE', then=0),
+        default=1,
+        output_field=IntegerField()
+    )
+    
+    if sort == 'price_asc':
+        queryset = queryset.order_by(status_priority, 'price')
+    elif sort == 'price_desc':
+        queryset = queryset.order_by(status_priority, '-price')
+    elif sort == 'views_desc':
+        queryset = queryset.order_by(status_priority, '-view_count')
+    else:
+        queryset = queryset.order_by(status_priority, '-created_at')
+
+    return queryset
+
+
+class ProductViewSet(CachedObjectMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    sparse_resource = 'product'
+    sparse_required_columns = ('updated_at', 'view_count')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_permissions(self):
-        if self.action in ['admin_list', 'toggle_status']:
+        if self.action in ['admin_list', 'toggle_status', 'duplicate_clusters']:
             return [IsAdminRole()]
         return super().get_permissions()
 
     def perform_create(self, serializer):
+        # 同一卖家在售商品中的近似重复（见 api/duplicates.py）
+        data = serializer.validated_data
+        match = duplicates.check(self.request.user.pk, data.get('title', ''), data.get('description', ''))
+        if match.duplicate_of and duplicates.action() == 'reject':
+            raise ValidationError({'error': f'Near-duplicate of your listing {match.duplicate_of}',
+                                   'duplicateOf': match.duplicate_of})
         # 自动将当前登录用户设置为卖家
-        serializer.save(seller=self.request.user)
+        product = serializer.save(seller=self.request.user)
+        duplicates.record([product], [match])
+        # 后台任务匹配保存的搜索并通知买家（见 api/saved_searches.py）
+        tasks.match_saved_searches(product.pk)
+
+    def perform_update(self, serializer):
+        old_price = serializer.instance.price
+        old_text = (serializer.instance.title, serializer.instance.description)
+        product = serializer.save()
+        if (product.title, product.description) != old_text:
+            duplicates.refresh(product)
+        if product.price < old_price:
+            # 降价提醒在后台分批发送给收藏了该商品的用户
+            tasks.alert_price_drop(product, old_price)
+
+    # 批量发布：JSON 数组或上传的 CSV（见 api/listings.py），返回逐行的校验错误
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, MultiPartParser])
+    def bulk_create(self, request):
+        partial = request.query_params.get('partial') == 'true'
+        try:
+            uploaded = request.FILES.get('file')
+            rows = listings.read_csv(uploaded) if uploaded is not None else request.data
+            valid, errors = listings.validate(rows, request.user, partial)
+        except listings.BulkRejected as exc:
+            return Response({'error': str(exc)}, status=400)
+        if not valid:
+            return Response({'created': 0, 'ids': [], 'errors': errors}, status=400)
+        product_ids = listings.create(request.user, valid)
+        return Response({'created': len(product_ids), 'ids': product_ids, 'errors': errors}, status=201)
+
+    # 管理员接口：近似重复商品簇（见 api/duplicates.py），sameSeller=false 时也合并不同卖家的商品
+    @action(detail=False, methods=['get'], url_path='duplicates')
+    def duplicate_clusters(self, request):
+        same_seller = request.query_params.get('sameSeller', 'true') != 'false'
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 50)), 500))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=400)
+        total, report = duplicates.clusters(same_seller=same_seller, limit=limit)
+        return Response({'total': total, 'clusters': report})
 
     # 管理员接口：获取所有商品列表（支持分页和筛选）
     @action(detail=False, methods=['get'])
@@ -196,7 +490,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         products = queryset[start:end]
         
         return Response({
-            'results': ProductSerializer(products, many=True).data,
+            'results': fastpath.product_rows(products, fieldsets.select_fields(request, 'product')),
             'total': total,
             'page': page,
             'pageSize': page_size,
@@ -217,71 +511,40 @@ class ProductViewSet(viewsets.ModelViewSet):
             
             # 如果是下架操作（从非BANNED状态变为BANNED），发送系统消息给卖家
             if old_status != 'BANNED' and new_status == 'BANNED':
-                # 获取或创建系统管理员账号
-                admin_user = User.objects.filter(role='ADMIN').first()
-                if not admin_user:
-                    # 如果没有管理员账号，使用第一个超级用户
-                    admin_user = User.objects.filter(is_staff=True).first()
-                
-                if admin_user:
-                    # 构建消息内容
-                    message_content = f"您的商品「{product.title}」已被管理员下架。\n下架原因：{reason if reason else '违反平台规定'}"
-                    
-                    # 创建系统消息
-                    Message.objects.create(
-                        sender=admin_user,
-                        receiver=product.seller,
-                        content=message_content,
-                        msg_type='SYSTEM'
-                    )
+                # 系统消息由后台任务发送（发送者为管理员账号，见 api/tasks.py）
+                message_content = f"您的商品「{product.title}」已被管理员下架。\n下架原因：{reason if reason else '违反平台规定'}"
+                tasks.notify(product.seller_id, message_content,
+                             key=f'product-banned:{product.pk}:{product.updated_at.timestamp()}')
             
             return Response({'status': 'updated'})
         return Response({'error': 'No status provided'}, status=400)
 
     def get_queryset(self):
-        from django.db.models import Case, When, IntegerField
-        
-        queryset = Product.objects.all()
-
-        # 搜索功能 (对应 api.ts list params.search)
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | Q(description__icontains=search)
-            )
-
-        # 隐藏已售出/确认收货/下架商品 (对应 api.ts list params.hideSold)
-        hide_sold = self.request.query_params.get('hideSold')
-        if hide_sold == 'true':
-            queryset = queryset.exclude(status__in=['SOLD', 'RECEIVED', 'BANNED'])
+        return self.trim_columns(filter_products(Product.objects.all(), self.request.query_params))
 
-        # 排序功能 (对应 api.ts list params.sort)
-        sort = self.request.query_params.get('sort')
-        
-        # 定义状态优先级：ACTIVE > 其他状态（SOLD/RECEIVED/BANNED 排在最后）
-        status_priority = Case(
-            When(status='ACTIVE', then=0),
-            default=1,
-            output_field=IntegerField()
-        )
-        
-        if sort == 'price_asc':
-            queryset = queryset.order_by(status_priority, 'price')
-        elif sort == 'price_desc':
-            queryset = queryset.order_by(status_priority, '-price')
-        elif sort == 'views_desc':
-            queryset = queryset.order_by(status_priority, '-view_count')
-        else:
-            queryset = queryset.order_by(status_priority, '-created_at')
+    def object_cache_usable(self):
+        # 详情同样应用列表的搜索和 hideSold 筛选，带这些参数时查询数据库
+        return not {'search', 'hideSold'} & set(self.request.query_params)
 
-        return queryset
+    # 列表走 values_list 快速序列化路径，输出与 ProductSerializer 一致
+    def list(self, request, *args, **kwargs):
+        return Response(fastpath.product_rows(self.filter_queryset(self.get_queryset()), self.sparse_fields))
 
-    # 获取单个商品时增加浏览量
+    # 获取单个商品时增加浏览量；商品未修改时返回 304
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        instance.view_count += 1
-        instance.save()
-        return super().retrieve(request, *args, **kwargs)
+        try:
+            instance = self.get_object()
+        except Http404:
+            # 已归档的商品（见 api/archive.py）只读返回，不再计浏览量
+            archived = self.trim_columns(filter_products(ArchivedProduct.objects.all(), request.query_params))
+            instance = get_object_or_404(archived, pk=kwargs[self.lookup_field])
+        else:
+            # 浏览量在进程内累计后由后台任务批量写入（见 api/tasks.py），不刷新 updated_at，ETag 不随浏览量变化
+            tasks.record_view(instance.pk)
+            instance.view_count += 1
+        etag = conditional.make_etag('product', instance.pk, instance.updated_at, self.sparse_fields)
+        return conditional.conditional_response(
+            request, etag, instance.updated_at, lambda: Response(self.get_serializer(instance).data))
 
     # 购买逻辑
     @action(detail=True, methods=['post'])
@@ -290,7 +553,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         buyer_id = request.data.get('buyerId')
         # 获取前端传来的地址
         address = request.data.get('address', '未提供地址')
-        buyer = get_object_or_404(User, id=buyer_id)
+        buyer = identity.get_or_404(User, buyer_id)  # 买家通常就是当前用户，已在身份映射中
 
         if product.status != 'ACTIVE':
             return Response({'error': 'Item not available'}, status=400)
@@ -299,12 +562,11 @@ class ProductViewSet(viewsets.ModelViewSet):
         product.buyer = buyer
         product.save()
 
-        # 修改系统消息内容，包含买家地址
-        Message.objects.create(
-            sender=User.objects.filter(is_staff=True).first(),
-            receiver=product.seller,
-            content=f"恭喜！您的商品 '{product.title}' 已被买家购买。\n买家提供的收货地址/约定地点：{address}",
-            msg_type='SYSTEM'
+        # 系统消息包含买家地址，由后台任务发送
+        tasks.notify(
+            product.seller_id,
+            f"恭喜！您的商品 '{product.title}' 已被买家购买。\n买家提供的收货地址/约定地点：{address}",
+            key=f'product-purchased:{product.pk}:{buyer.pk}',
         )
         return Response({'status': 'success'})
 
@@ -322,15 +584,16 @@ class ProductViewSet(viewsets.ModelViewSet):
         product.status = 'RECEIVED'
         product.save()
 
-        seller = product.seller
+        seller = identity.related(product, 'seller')
         seller.wallet_balance += product.price
         seller.save()
 
         return Response({'status': 'success'})
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     serializer_class = MessageSerializer
+    sparse_resource = 'message'
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
@@ -342,14 +605,53 @@ class MessageViewSet(viewsets.ModelViewSet):
             ).order_by('timestamp')
         return Message.objects.none()
 
+    # 已归档的旧消息排在热表中的消息之前
+    def list(self, request, *args, **kwargs):
+        rows = fastpath.message_rows(self.filter_queryset(self.get_queryset()), self.sparse_fields)
+        user_id = request.query_params.get('userId')
+        if user_id:
+            rows = fastpath.message_rows(archive.archived_thread(user_id), self.sparse_fields) + rows
+        return Response(rows)
 
-class ReviewViewSet(viewsets.ModelViewSet):
+
+class ReviewViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    sparse_resource = 'review'
+    # 列表 ETag 的聚合值；买家改名会影响 buyerName，因此也纳入买家的 updated_at
+    REVIEW_STATE = {'latest': Max('updated_at'), 'count': Count('id'), 'buyers': Max('buyer__updated_at')}
 
     def get_queryset(self):
         # 筛选特定卖家的评价
         seller_id = self.request.query_params.get('sellerId')
         if seller_id:
             return Review.objects.filter(seller_id=seller_id)
-        return Review.objects.all()
\ No newline at end of file
+        return Review.objects.all()
+
+    # buyerName 通过 JOIN 一次取出，避免逐条查询买家；评价未变化时返回 304
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        state = queryset.aggregate(**self.REVIEW_STATE)
+        etag, last_modified = self.review_validators(request, self.sparse_fields, state)
+        return conditional.conditional_response(
+            request, etag, last_modified,
+            lambda: Response(fastpath.review_rows(queryset, self.sparse_fields)))
+
+    @staticmethod
+    def review_validators(request, fields, state):
+        etag = conditional.make_etag(
+            'reviews', request.GET.get('sellerId'), fields,
+            state['latest'], state['count'], state['buyers'])
+        return etag, conditional.latest(state['latest'], state['buyers'])
+
+
+# 买家保存的搜索：新商品上架时匹配并发送系统消息
+class SavedSearchViewSet(viewsets.ModelViewSet):
+    serializer_class = SavedSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
@@ -50,6 +50,11 @@ AUTH_USER_MODEL = 'api.User'
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.middleware.PerformanceMiddleware',  # 请求级性能指标，见 /api/metrics/
+    'api.middleware.ProfilingMiddleware',  # 按需采样分析，见 /api/profiles/
+    'api.throttling.ThrottleMiddleware',  # 令牌桶限流，在认证和查询数据库之前拒绝超额请求
+    'api.db_router.ReplicaRoutingMiddleware',  # 只读请求读从库，见 DATABASE_REPLICAS
+    'api.identity.IdentityMapMiddleware',  # 请求内按主键查找的行只查询一次，见 api/identity.py
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,11 +66,15 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.identity.JWTAuthentication',  # simplejwt 认证，当前用户放入请求的身份映射
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly', # 允许首页游客查看
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',  # 安装了 orjson 时使用，输出与 JSONRenderer 一致
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -73,6 +82,16 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),           # 对应前端 api.ts 中的 Bearer
 }
 
+# 超过任一阈值的请求会连同最慢的 SQL 一起写入 api.performance 日志
+PERF_SLOW_REQUEST_MS = 500
+PERF_SLOW_QUERY_COUNT = 50
+
+# 按需分析：管理员请求带 X-Profile 头或 ?_profile=1 时分析；另按比例抽样 (0 表示关闭)
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_INTERVAL_MS = 5
+PROFILE_DIR = BASE_DIR / 'profiles'  # 含 SQL 文本，不要放在 MEDIA_ROOT 下公开
+PROFILE_MAX_COUNT = 200  # 只保留最新的这些分析结果，保存时删除更早的
+
 ROOT_URLCONF = 'unitrade_backend.urls'
 
 TEMPLATES = [
@@ -107,6 +126,13 @@ DATABASES = {
     }
 }
 
+# 读写分离（api/db_router.py）：把从库别名加入 DATABASE_REPLICAS 后，只读请求读从库
+DATABASE_ROUTERS = ['api.db_router.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 5  # 客户端写入后这段时间内的读请求仍走主库
+REPLICA_MAX_LAG_SECONDS = 2  # 复制延迟超过该值的从库移出轮询
+REPLICA_LAG_CHECK_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -156,5 +182,100 @@ AUTH_USER_MODEL = 'api.User'
 
 # 配置文件上传路径
 import os
+import tempfile
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# 图片上传：原图内容寻址存放在 MEDIA_ROOT/img 下，缩略图在进程池中生成
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_VARIANTS = {'thumb': 320, 'medium': 960}  # 变体名 -> 最长边像素，各生成 JPEG 和 WebP
+IMAGE_POOL_WORKERS = 2
+IMAGE_POOL_MAX_PENDING = 32  # 排队 + 处理中的上限，超出时返回 503
+IMAGE_RERENDER_COOLDOWN = 300  # 变体生成失败后，文件服务回退为原图时至少隔这么多秒才重试
+MEDIA_ACCEL_REDIRECT_PREFIX = None  # 如 '/protected-media/'：由 nginx X-Accel-Redirect 发送文件
+
+# 新建用户 / 商品的主键格式：'time' 为时间有序编码（见 api/ids.py），'legacy' 为旧的 8 位随机 hex
+ID_SCHEME = 'time'
+
+# 后台任务队列（api/jobs.py），由 python manage.py run_jobs 执行
+JOB_BATCH_SIZE = 50  # worker 每次认领的任务数
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF_BASE = 2  # 重试等待 base * 2^(n-1) 秒
+JOB_BACKOFF_MAX = 600
+JOB_LOCK_TIMEOUT = 300  # RUNNING 超过该秒数视为 worker 已崩溃，重新入队
+JOB_RETENTION_DAYS = 7
+# 商品浏览量在进程内累计，满足任一条件时合并为一个任务写入
+VIEW_COUNT_FLUSH_SECONDS = 5
+VIEW_COUNT_FLUSH_SIZE = 200
+VIEW_COUNT_AUTO_FLUSH = True  # 定时器线程按周期刷新，进程退出时刷新剩余计数
+
+# 冷热数据分离（api/archive.py），由 python manage.py archive_data 执行
+ARCHIVE_PRODUCTS_AFTER_DAYS = 30  # RECEIVED / BANNED 商品多少天未修改后归档
+ARCHIVE_MESSAGES_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 500  # 每个事务移动的行数
+
+# 搜索框输入联想（api/suggest.py）：进程内前缀索引
+SUGGEST_MAX_TITLES = 200000  # 只索引浏览量最高的这些在售商品
+SUGGEST_MAX_TAGS = 2000
+SUGGEST_SCAN_LIMIT = 256  # 前缀匹配超过这么多条时使用构建时缓存的 top-k
+SUGGEST_OVERLAY_MAX = 1000  # 增量修改超过这么多条时后台重建
+SUGGEST_REBUILD_SECONDS = 600  # 刷新浏览量排序、标签计数和其他进程中的修改
+SUGGEST_CACHE_SECONDS = 30
+SUGGEST_WARM_ON_STARTUP = True
+
+# 保存的搜索（api/saved_searches.py）：新商品上架后匹配并发送系统消息
+SAVED_SEARCH_MAX_PER_USER = 20
+
+# 进程内对象缓存（api/objcache.py）：Product / User 的 get_object 和关联查找
+OBJECT_CACHE_ENABLED = True
+OBJECT_CACHE_MAX_ENTRIES = 20000
+OBJECT_CACHE_TTL_SECONDS = 300  # 不发失效信号的修改（如浏览量累加）最多滞后这么久
+OBJECT_CACHE_SYNC_SECONDS = 1  # 其他进程中的修改最多滞后这么久
+OBJECT_CACHE_SYNC_OVERLAP_SECONDS = 5
+OBJECT_CACHE_LOG_RETENTION_SECONDS = 3600
+
+# 令牌桶限流（api/throttling.py）：按用户（JWT）或 IP 计数，同一台机器上的 worker 共用计数文件
+THROTTLE_ENABLED = True
+THROTTLE_STORE_PATH = os.path.join(tempfile.gettempdir(), 'unitrade-throttle.bin')  # None 时只在进程内计数
+THROTTLE_STORE_SLOTS = 65536  # 每个槽位 24 字节
+THROTTLE_NUM_PROXIES = 0  # 部署在反向代理之后时设为代理层数，从 X-Forwarded-For 取客户端 IP
+# 作用域 -> (桶容量, 每秒补充的令牌数)。'client' 是每个客户端的总桶，其他为同名接口的独立桶
+THROTTLE_BUCKETS = {
+    'client': (120, 4.0),
+    'login': (10, 10 / 60),  # PBKDF2 哈希很耗 CPU：每分钟 10 次
+    'search': (30, 0.5),
+}
+# 每个请求从总桶扣除的令牌数（按接口名，见 throttling.endpoint_name），未列出的为 1
+THROTTLE_COSTS = {
+    'login': 10,
+    'search': 3,
+    'image-upload': 5,
+    'product-bulk-create': 20,
+    'product-suggest': 0.25,  # 每次按键一个请求，只查进程内索引
+}
+
+# 批量发布商品（api/listings.py）
+PRODUCT_BULK_MAX_ROWS = 500
+PRODUCT_BULK_MAX_CSV_BYTES = 2 * 1024 * 1024
+PRODUCT_BULK_BATCH_SIZE = 200  # 每条 INSERT 的行数
+
+# 降价提醒（api/tasks.py）：通知收藏了该商品的用户
+PRICE_ALERT_WINDOW_SECONDS = 600  # 同一商品在一个窗口内多次降价只提醒一次，窗口结束时发送
+PRICE_ALERT_CHUNK_SIZE = 1000  # 每次读取的收藏者数，也是每条 INSERT 的行数
+PRICE_ALERT_CHUNKS_PER_JOB = 10  # 超过这么多块时剩余部分交给后续任务，单个事务大小有上限
+
+# 近似重复商品检测（api/duplicates.py）：标题 + 描述的 MinHash 签名
+DUPLICATE_LISTING_ACTION = 'flag'  # 'reject' 拒绝同一卖家的近似重复商品，'flag' 照常发布并记录，'off' 只记录签名
+DUPLICATE_MIN_SIMILARITY = 0.7  # 估计的词集合 Jaccard 相似度不低于该值视为近似重复
+DUPLICATE_MIN_TERMS = 3  # 不同的词少于该数时不做检测，避免短标题误判
+
+# 推荐关注（api/follow_suggestions.py），由 python manage.py build_follow_suggestions 计算
+FOLLOW_SUGGESTION_COUNT = 20  # 每个用户保存的推荐数
+FOLLOW_SUGGESTION_BLOCK_SIZE = 20000  # 每块计算和写入的用户数，决定峰值内存
+
+# 请求级身份映射（api/identity.py）：True 时响应带 X-Identity-Map 头，避免的和仍然重复的查询写入 api.identity 日志
+IDENTITY_MAP_DEBUG = False
+
+# 批量调用 POST /api/batch/（api/batch.py）
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_PARALLEL = 4  # 同时执行的只读子请求数，每个并行的子请求占用一个数据库连接
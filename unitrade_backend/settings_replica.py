@@ -0,0 +1,23 @@
+"""
+用两个 SQLite 文件模拟主从库，在本地验证读写分离（api/db_router.py）。
+
+Usage:
+    python manage.py migrate --settings=unitrade_backend.settings_replica
+    python manage.py sync_sqlite_replica --interval 1 --settings=unitrade_backend.settings_replica
+    python manage.py runserver --settings=unitrade_backend.settings_replica
+"""
+from .settings_sqlite import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        # 测试时从库直接使用主库的测试数据库
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_REPLICAS = ['replica']
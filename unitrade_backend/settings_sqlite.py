@@ -0,0 +1,25 @@
+"""
+SQLite settings for offline development, tests and benchmarks.
+
+Usage:
+    python manage.py test --settings=unitrade_backend.settings_sqlite
+    python manage.py bench_api --settings=unitrade_backend.settings_sqlite
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+}
+
+# 测试之间回滚后会以相同 id 重建数据（bulk_create 不发信号），进程内对象缓存会留下旧行；
+# 需要时用 override_settings 开启（见 ObjectCacheTests、manage.py bench_object_cache）
+OBJECT_CACHE_ENABLED = False
+
+# 测试和基准从同一个 IP 连续发出大量请求；需要时用 override_settings 开启（见 ThrottleTests）
+THROTTLE_ENABLED = False
+
+# 定时器线程在测试事务之外写入任务表；测试中显式调用 tasks.view_counts.flush()
+VIEW_COUNT_AUTO_FLUSH = False
@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from api.views import serve_image
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('media/img/<str:digest>/<str:name>', serve_image, name='media-image'),
     path('api/', include('api.urls')), # 确保这一行存在
 ]
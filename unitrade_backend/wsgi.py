@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'unitrade_backend.settings')
 
 application = get_wsgi_application()
+
+# 按 SUGGEST_WARM_ON_STARTUP 预先构建搜索联想索引（见 api/suggest.py）
+from api import suggest  # noqa: E402
+
+suggest.warm()